@@ -0,0 +1,13 @@
+"""Performance benchmarks of win32_window_monitor.
+
+Benchmarks run against the Win32 stand-in of tests/fake_win32.py, on any platform, so that results only
+measure the Python side of the package and are comparable between machines and runs. The stand-in
+replaces ctypes.windll for the whole process: run the benchmarks with `python -m benchmarks`, not from
+an application using the real Win32 API.
+"""
+
+from tests import fake_win32
+
+#: Simulated desktop used by the benchmarks, installed before win32_window_monitor is imported unless the
+#: tests already installed it.
+desktop = fake_win32.desktop if fake_win32.desktop is not None else fake_win32.install()
@@ -0,0 +1,56 @@
+"""Command line of the benchmark suite, see benchmarks/suite.py."""
+
+import argparse
+import json
+import sys
+
+from benchmarks import suite
+
+
+def _parse_threshold(value: str):
+    name, _, ratio = value.partition('=')
+    return name, float(ratio)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=suite.__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--output', '-o', help='path of the JSON results file')
+    run_parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number of iterations')
+    run_parser.add_argument('names', nargs='*', choices=[[]] + list(suite.BENCHMARKS),
+                            help='benchmarks to run, all by default')
+    compare_parser = subparsers.add_parser('compare', help='compare results with a baseline')
+    compare_parser.add_argument('baseline', help='path of the baseline JSON results file')
+    compare_parser.add_argument('current', help='path of the current JSON results file')
+    compare_parser.add_argument('--max-regression', type=float, default=0.1,
+                                help='maximum allowed relative regression (default: 0.1, i.e. 10%%)')
+    compare_parser.add_argument('--threshold', action='append', type=_parse_threshold, default=[],
+                                metavar='NAME=RATIO', help='maximum allowed relative regression of a result')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = suite.run_suite(args.names or None, args.scale)
+        if args.output:
+            with open(args.output, 'wt', encoding='utf-8') as output_file:
+                json.dump(results, output_file, indent=2)
+        return 0
+
+    with open(args.baseline, 'rt', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current, 'rt', encoding='utf-8') as current_file:
+        current = json.load(current_file)
+    comparisons = suite.compare_results(baseline, current, args.max_regression, dict(args.threshold))
+    for comparison in comparisons:
+        status = 'REGRESSION' if comparison.failed else 'ok'
+        print(f'{comparison.name:40} {comparison.baseline:14.3f} {comparison.current:14.3f} '
+              f'{comparison.regression:+8.1%}  {status}')
+    failed = [comparison.name for comparison in comparisons if comparison.failed]
+    if failed:
+        print(f'{len(failed)} regression(s): {", ".join(failed)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
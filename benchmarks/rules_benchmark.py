@@ -0,0 +1,111 @@
+"""Measures the per event cost of RuleEngine.classify() with a large rule set.
+
+Also part of the benchmark suite, see benchmarks/suite.py.
+
+Usage::
+
+    python -m benchmarks.rules_benchmark --rules 5000
+"""
+
+import argparse
+import fnmatch
+import random
+import re
+import time
+
+from win32_window_monitor.rules import Rule, RuleEngine
+
+CATEGORIES = [f'category{index}' for index in range(20)]
+WORDS = ['project', 'report', 'inbox', 'meeting', 'invoice', 'sprint', 'review', 'budget', 'design', 'roadmap']
+
+
+def make_rules(count: int, rng: random.Random):
+    """Returns a mix of exact/prefix exe rules and glob/prefix/regex title rules, similar to user rule sets."""
+    rules = []
+    for index in range(count):
+        category = rng.choice(CATEGORIES)
+        kind = index % 10
+        if kind < 3:
+            rules.append(Rule(category, f'app{index}.exe', field='exe'))
+        elif kind < 4:
+            rules.append(Rule(category, f'tool{index}*', field='exe'))
+        elif kind < 7:
+            rules.append(Rule(category, f'*{rng.choice(WORDS)}{index}*'))
+        elif kind < 9:
+            rules.append(Rule(category, f'Document{index} - *'))
+        else:
+            rules.append(Rule(category, rf'\b{rng.choice(WORDS)}-{index}\b', kind='regex'))
+    return rules
+
+
+def make_events(count: int, distinct: int, rule_count: int, rng: random.Random):
+    """Returns (exe, title) pairs, drawn from `distinct` different pairs."""
+    pairs = [(f'app{rng.randrange(rule_count * 2)}.exe',
+              f'Document{rng.randrange(rule_count * 2)} - {rng.choice(WORDS)}{rng.randrange(rule_count)}')
+             for _ in range(distinct)]
+    return [rng.choice(pairs) for _ in range(count)]
+
+
+def classify_linear(rules, exe: str, title: str):
+    """Reference implementation: evaluates each rule in turn."""
+    categories = set()
+    for rule in rules:
+        value = exe if rule.field == 'exe' else title
+        if rule.kind == 'regex':
+            matched = re.search(rule.pattern, value, re.IGNORECASE)
+        elif rule.kind == 'prefix':
+            matched = value.lower().startswith(rule.pattern.lower())
+        elif rule.kind == 'suffix':
+            matched = value.lower().endswith(rule.pattern.lower())
+        elif rule.kind == 'substring':
+            matched = rule.pattern.lower() in value.lower()
+        else:
+            matched = fnmatch.fnmatch(value.lower(), rule.pattern.lower())
+        if matched:
+            categories.add(rule.category)
+    return frozenset(categories)
+
+
+def measure(classify, events) -> float:
+    """Returns the mean cost of classify() per event in microseconds."""
+    start = time.perf_counter()
+    for exe, title in events:
+        classify(exe, title)
+    return (time.perf_counter() - start) / len(events) * 1e6
+
+
+def run(rule_count: int = 5000, event_count: int = 20000, distinct: int = 2000, seed: int = 0) -> dict:
+    """Runs the benchmark and returns the per event costs in microseconds."""
+    rng = random.Random(seed)
+    rules = make_rules(rule_count, rng)
+    events = make_events(event_count, distinct, rule_count, rng)
+
+    start = time.perf_counter()
+    uncached = RuleEngine(rules, cache_size=0)
+    compile_ms = (time.perf_counter() - start) * 1000
+    cached = RuleEngine(rules)
+    linear_events = events[:max(1, event_count // 100)]
+    return {
+        'compile_ms': compile_ms,
+        'linear_us_per_event': measure(lambda exe, title: classify_linear(rules, exe, title), linear_events),
+        'compiled_us_per_event': measure(uncached.classify, events),
+        'compiled_cached_us_per_event': measure(cached.classify, events),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=5000, help='number of rules')
+    parser.add_argument('--events', type=int, default=20000, help='number of classified events')
+    parser.add_argument('--distinct', type=int, default=2000, help='number of distinct (exe, title) pairs')
+    args = parser.parse_args()
+    results = run(args.rules, args.events, args.distinct)
+    print(f'{args.rules} rules, {args.events} events ({args.distinct} distinct), '
+          f'compiled in {results["compile_ms"]:.0f}ms')
+    print(f'  linear rule evaluation: {results["linear_us_per_event"]:10.1f} us/event')
+    print(f'  compiled rules:         {results["compiled_us_per_event"]:10.1f} us/event')
+    print(f'  compiled rules + LRU:   {results["compiled_cached_us_per_event"]:10.1f} us/event')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""End-to-end performance benchmark suite, with JSON baselines and regression comparison.
+
+Usage::
+
+    python -m benchmarks run --output baseline.json
+    ... change the code ...
+    python -m benchmarks run --output current.json
+    python -m benchmarks compare baseline.json current.json --max-regression 0.15
+
+compare exits with status 1 if a benchmark regressed by more than the allowed ratio. Per benchmark
+limits can be given with `--threshold NAME=RATIO`.
+"""
+
+import contextlib
+import datetime
+import os
+import platform
+import random
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks import desktop, rules_benchmark
+from win32_window_monitor import HookEvent, get_hwnd_process_id, get_process_filename, get_window_title
+from win32_window_monitor import main as log_focused_window
+from win32_window_monitor import timestamps
+from win32_window_monitor.cdc import ChangeDataCapture
+from win32_window_monitor.enrichment import EventBatcher, enrich_batch
+from win32_window_monitor.records import EventRecord
+from win32_window_monitor.warm_cache import WarmStartCache
+from win32_window_monitor.win32api import MessagePump, post_quit_message, run_message_loop, set_win_event_hook
+
+
+class BenchmarkResult(NamedTuple):
+    value: float
+    #: Unit of value, for example 'us/op' or 'events/s'.
+    unit: str
+    higher_is_better: bool = False
+
+
+def time_per_op_us(func: Callable[[], None], number: int, repeat: int = 5) -> float:
+    """Returns the best, over `repeat` runs, mean duration of func() in microseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def _setup_desktop(window_count: int = 8):
+    """Simulates a desktop with window_count windows, one process and thread per window."""
+    desktop.reset()
+    for index in range(window_count):
+        process_id = 100 + index
+        desktop.add_process(process_id, rf'C:\Program Files\App{index}\app{index}.exe')
+        desktop.add_window(0x1000 + index, process_id, 1000 + index, f'Window {index} - App{index}')
+
+
+# Benchmarks
+# ###################################################################
+
+def bench_hook_event(scale: float) -> Dict[str, BenchmarkResult]:
+    number = int(200_000 * scale)
+    return {
+        'hook_event_known_us': BenchmarkResult(
+            time_per_op_us(lambda: HookEvent(0x0003), number), 'us/op'),
+        'hook_event_unknown_us': BenchmarkResult(
+            time_per_op_us(lambda: HookEvent(0x1234), number), 'us/op'),
+    }
+
+
+def bench_logger_on_event(scale: float) -> Dict[str, BenchmarkResult]:
+    _setup_desktop()
+    logger = log_focused_window.WindowEventLogger()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        value = time_per_op_us(lambda: logger.on_event(0x100, 0x0003, 0x1001, 0, 0, 1001, 5000), int(20_000 * scale))
+    return {'logger_on_event_us': BenchmarkResult(value, 'us/op')}
+
+
+def bench_enrichment(scale: float) -> Dict[str, BenchmarkResult]:
+    _setup_desktop()
+    number = int(50_000 * scale)
+    # A burst of 256 events over the 8 windows, as drained in a single batch.
+    raw_events = [(0x100, 0x8002, 0x1000 + index % 8, 0, 0, 1000 + index % 8, index) for index in range(256)]
+    batches = max(1, number // 256)
+    _, stats = enrich_batch(raw_events)
+    return {
+        'get_hwnd_process_id_us': BenchmarkResult(
+            time_per_op_us(lambda: get_hwnd_process_id(1001, 0x1001), number), 'us/op'),
+        'get_process_filename_us': BenchmarkResult(
+            time_per_op_us(lambda: get_process_filename(101), number), 'us/op'),
+        'get_window_title_us': BenchmarkResult(
+            time_per_op_us(lambda: get_window_title(0x1001), number), 'us/op'),
+        'enrich_batch_per_event_us': BenchmarkResult(
+            time_per_op_us(lambda: enrich_batch(raw_events), batches) / len(raw_events), 'us/op'),
+        'enrich_batch_dedupe_ratio': BenchmarkResult(stats.dedupe_ratio, 'ratio', higher_is_better=True),
+    }
+
+
+def bench_hook_registration(scale: float) -> Dict[str, BenchmarkResult]:
+    desktop.reset()
+
+    def on_event_noop(*args):
+        pass
+
+    def register_unhook():
+        set_win_event_hook(on_event_noop, HookEvent.SYSTEM_FOREGROUND).unhook()
+
+    event_hook_handle = set_win_event_hook(on_event_noop, HookEvent.SYSTEM_FOREGROUND)
+    dispatch_us = time_per_op_us(lambda: desktop.fire_event(0x0003, 0x1001), int(100_000 * scale))
+    event_hook_handle.unhook()
+    return {
+        'hook_register_unhook_us': BenchmarkResult(time_per_op_us(register_unhook, int(20_000 * scale)), 'us/op'),
+        'hook_dispatch_us': BenchmarkResult(dispatch_us, 'us/op'),
+    }
+
+
+def _run_pipeline(rate: Optional[float], duration_s: float, event_count: int) -> Tuple[int, float, float]:
+    """Posts events at the given rate (as fast as possible if None) through the message loop to an EventBatcher
+    drained after each message loop run. Returns the number of processed events, the elapsed and busy time."""
+    _setup_desktop()
+    batcher = EventBatcher()
+    event_hook_handle = set_win_event_hook(batcher.on_event, HookEvent.OBJECT_SHOW)
+    processed = 0
+    busy_s = 0.0
+    posted = 0
+    start = time.perf_counter()
+    deadline = start + duration_s
+    while True:
+        now = time.perf_counter()
+        if rate is None:
+            if posted >= event_count:
+                break
+            due = min(event_count, posted + 256)
+        else:
+            if now >= deadline:
+                break
+            due = int((now - start) * rate)
+            if due <= posted:
+                time.sleep(0.0005)
+                continue
+        busy_start = time.perf_counter()
+        for index in range(posted, due):
+            desktop.post_event(HookEvent.OBJECT_SHOW, 0x1000 + index % 8, event_time_ms=index)
+        posted = due
+        run_message_loop()
+        processed += len(batcher.drain())
+        busy_s += time.perf_counter() - busy_start
+    elapsed_s = time.perf_counter() - start
+    event_hook_handle.unhook()
+    return processed, elapsed_s, busy_s
+
+
+def bench_throughput(scale: float, rates: Tuple[int, ...] = (1_000, 10_000, 50_000)) -> Dict[str, BenchmarkResult]:
+    """Sustained throughput of hook dispatch + batch enrichment at increasing event rates."""
+    results = {}
+    processed, elapsed_s, _ = _run_pipeline(None, 0, int(100_000 * scale))
+    results['throughput_max_events_per_s'] = BenchmarkResult(processed / elapsed_s, 'events/s', True)
+    for rate in rates:
+        processed, elapsed_s, busy_s = _run_pipeline(rate, max(0.2, scale), 0)
+        results[f'throughput_{rate}_events_per_s'] = BenchmarkResult(processed / elapsed_s, 'events/s', True)
+        results[f'throughput_{rate}_busy_ratio'] = BenchmarkResult(busy_s / elapsed_s, 'ratio')
+    return results
+
+
+def bench_message_pump(scale: float) -> Dict[str, BenchmarkResult]:
+    """Cost per event of MessagePump draining bursts of 256 events, enriched in batch by on_batch."""
+    _setup_desktop()
+    batcher = EventBatcher()
+    event_hook_handle = set_win_event_hook(batcher.on_event, HookEvent.OBJECT_SHOW)
+    pump = MessagePump(on_batch=batcher.drain)
+
+    def pump_burst():
+        for index in range(256):
+            desktop.post_event(HookEvent.OBJECT_SHOW, 0x1000 + index % 8, event_time_ms=index)
+        post_quit_message()
+        pump.run()
+
+    value = time_per_op_us(pump_burst, max(1, int(200 * scale))) / 256
+    event_hook_handle.unhook()
+    return {'message_pump_per_event_us': BenchmarkResult(value, 'us/op')}
+
+
+def bench_timestamps(scale: float) -> Dict[str, BenchmarkResult]:
+    """Cost per event of converting a batch of 10,000 tick counts, wrapping around, to wall clock time."""
+    ticks_ms = [(2 ** 32 - 5_000 + index) % 2 ** 32 for index in range(10_000)]
+    results = {}
+    for use_numpy in ([False, True] if timestamps.numpy is not None else [False]):
+        normalizer = timestamps.TickNormalizer.from_tick(ticks_ms[0], 1_700_000_000_000, use_numpy=use_numpy)
+        value = time_per_op_us(lambda: normalizer.to_wall_time_batch(ticks_ms), max(1, int(50 * scale)))
+        results['to_wall_time_batch_numpy_us' if use_numpy else 'to_wall_time_batch_us'] = \
+            BenchmarkResult(value / len(ticks_ms), 'us/op')
+    return results
+
+
+def make_cdc_trace(event_count: int, window_count: int = 20, seed: int = 0) -> List[EventRecord]:
+    """Returns a trace where, as in real captures, most events repeat an unchanged state: windows shown again,
+    same title, repeated foreground activations... Titles change every 50 events on average."""
+    rng = random.Random(seed)
+    event_ids = [HookEvent.OBJECT_SHOW, HookEvent.OBJECT_NAMECHANGE, HookEvent.SYSTEM_FOREGROUND,
+                 HookEvent.OBJECT_LOCATIONCHANGE, HookEvent.OBJECT_SHOW, HookEvent.OBJECT_NAMECHANGE]
+    titles = [f'Document 0 - App{index}' for index in range(window_count)]
+    records = []
+    hwnd_index = 0
+    for event_time_ms in range(event_count):
+        if rng.random() < 0.05:
+            hwnd_index = rng.randrange(window_count)
+        if rng.random() < 0.02:
+            titles[hwnd_index] = f'Document {event_time_ms} - App{hwnd_index}'
+        records.append(EventRecord(event_time_ms, rng.choice(event_ids), 0x1000 + hwnd_index, 0, 0, 1000 + hwnd_index,
+                                   100 + hwnd_index, rf'C:\Program Files\App{hwnd_index}\app.exe',
+                                   titles[hwnd_index]))
+    return records
+
+
+def bench_cdc(scale: float) -> Dict[str, BenchmarkResult]:
+    records = make_cdc_trace(max(1000, int(100_000 * scale)))
+
+    def apply_trace():
+        cdc = ChangeDataCapture(on_message=lambda message: None, resync_interval_ms=60_000)
+        for record in records:
+            cdc.apply(record)
+        return cdc
+
+    value = time_per_op_us(apply_trace, 1, repeat=3) / len(records)
+    return {
+        'cdc_apply_us': BenchmarkResult(value, 'us/op'),
+        'cdc_reduction_ratio': BenchmarkResult(apply_trace().reduction_ratio, 'ratio', higher_is_better=True),
+    }
+
+
+def _events_to_full_hit_rate(cache: WarmStartCache, batches: List[List[tuple]]) -> Tuple[int, float, int]:
+    """Enriches the batches through the cache until the process lookups of a whole batch are served by the
+    cache. Returns the number of events and the milliseconds it took, and the number of Win32 calls made.
+
+    Title lookups are not counted: titles are not saved in the snapshot, so warm and cold starts miss them alike.
+    """
+    desktop.call_counts.clear()
+    events = 0
+    start = time.perf_counter()
+    for batch in batches:
+        stats = cache.stats
+        enrich_batch(batch, cache=cache)
+        events += len(batch)
+        batch_stats = cache.stats - stats
+        if batch_stats.process_id_misses + batch_stats.filename_misses == 0:
+            break
+    return events, (time.perf_counter() - start) * 1000, sum(desktop.call_counts.values())
+
+
+def bench_warm_start(scale: float, window_count: int = 300) -> Dict[str, BenchmarkResult]:
+    """Restart to full cache hit rate of a collector during a login storm, with and without a warm-start
+    snapshot of its lookup cache."""
+    _setup_desktop(window_count)
+    rng = random.Random(0)
+    batches = [[(0x100, HookEvent.OBJECT_SHOW, 0x1000 + index, 0, 0, 1000 + index, event_time_ms)
+                for event_time_ms, index in enumerate(rng.choices(range(window_count), k=256))]
+               for _ in range(100)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.json.gz')
+        with WarmStartCache(path, cache_titles=True) as cache:
+            _events_to_full_hit_rate(cache, batches)
+        for name, snapshot_path in (('warm', path), ('cold', None)):
+            events, elapsed_ms, calls = _events_to_full_hit_rate(WarmStartCache(snapshot_path, cache_titles=True),
+                                                                 batches)
+            results[f'{name}_start_events_to_full_hit_rate'] = BenchmarkResult(events, 'events')
+            results[f'{name}_start_ms_to_full_hit_rate'] = BenchmarkResult(elapsed_ms, 'ms')
+            results[f'{name}_start_win32_calls'] = BenchmarkResult(calls, 'calls')
+    return results
+
+
+def bench_rules(scale: float) -> Dict[str, BenchmarkResult]:
+    results = rules_benchmark.run(5000, int(20_000 * scale), 2000)
+    return {
+        'rules_5000_compile_ms': BenchmarkResult(results['compile_ms'], 'ms'),
+        'rules_5000_compiled_us': BenchmarkResult(results['compiled_us_per_event'], 'us/op'),
+        'rules_5000_compiled_cached_us': BenchmarkResult(results['compiled_cached_us_per_event'], 'us/op'),
+    }
+
+
+#: All the benchmarks of the suite, by name.
+BENCHMARKS: Dict[str, Callable[[float], Dict[str, BenchmarkResult]]] = {
+    'hook_event': bench_hook_event,
+    'logger_on_event': bench_logger_on_event,
+    'enrichment': bench_enrichment,
+    'hook_registration': bench_hook_registration,
+    'throughput': bench_throughput,
+    'message_pump': bench_message_pump,
+    'timestamps': bench_timestamps,
+    'cdc': bench_cdc,
+    'warm_start': bench_warm_start,
+    'rules': bench_rules,
+}
+
+
+# Suite and baseline comparison
+# ###################################################################
+
+def run_suite(names: Optional[List[str]] = None, scale: float = 1.0,
+              log: Callable[[str], None] = print) -> dict:
+    """Runs the benchmarks and returns the results, in the JSON baseline format.
+
+    :param names: names of the benchmarks to run (see BENCHMARKS), all if None.
+    :param scale: multiplies the number of iterations. Use a smaller scale for quick runs.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        for result_name, result in BENCHMARKS[name](scale).items():
+            log(f'{result_name:40} {result.value:14.3f} {result.unit}')
+            results[result_name] = result._asdict()
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'scale': scale,
+        },
+        'results': results,
+    }
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline: float
+    current: float
+    #: Relative change, positive when the result got worse.
+    regression: float
+    max_regression: float
+
+    @property
+    def failed(self) -> bool:
+        return self.regression > self.max_regression
+
+
+def compare_results(baseline: dict, current: dict, max_regression: float = 0.1,
+                    thresholds: Optional[Dict[str, float]] = None) -> List[Comparison]:
+    """Compares the results present in both baseline and current.
+
+    :param max_regression: maximum allowed relative regression, for example 0.1 for 10%.
+    :param thresholds: maximum allowed relative regression by result name, overriding max_regression.
+    """
+    thresholds = thresholds or {}
+    comparisons = []
+    for name, current_result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            continue
+        baseline_value = baseline_result['value']
+        current_value = current_result['value']
+        if baseline_value == 0:
+            regression = 0.0
+        elif current_result['higher_is_better']:
+            regression = (baseline_value - current_value) / baseline_value
+        else:
+            regression = (current_value - baseline_value) / baseline_value
+        comparisons.append(Comparison(name, baseline_value, current_value, regression,
+                                      thresholds.get(name, max_regression)))
+    return comparisons
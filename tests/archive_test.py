@@ -0,0 +1,143 @@
+import io
+
+import pytest
+from win32_window_monitor.archive import (
+    ArchiveError, ArchiveReader, ArchiveWriter, CODECS, decode_chunk, encode_chunk,
+)
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.records import EventRecord
+
+
+def make_records(count, start_ms=1000, step_ms=10):
+    event_ids = [HookEvent.SYSTEM_FOREGROUND, HookEvent.OBJECT_FOCUS, HookEvent.OBJECT_SHOW]
+    exe_paths = [r'C:\Windows\explorer.exe', r'C:\Program Files\Mozilla Firefox\firefox.exe']
+    return [EventRecord(start_ms + index * step_ms, int(event_ids[index % 3]), 0x1000 + index % 7,
+                        int(ObjectId.WINDOW), 0, 100 + index % 5, 2000 + index % 2, exe_paths[index % 2],
+                        f'title {index % 4}')
+            for index in range(count)]
+
+
+# Chunk encoding
+# ###################################################################
+
+def test_chunk_round_trip():
+    records = make_records(50)
+    columns = decode_chunk(encode_chunk(records))
+    assert columns.event_count == 50
+    assert columns.records() == records
+    assert columns.record(3) == records[3]
+
+
+def test_chunk_round_trip_empty():
+    assert decode_chunk(encode_chunk([])).records() == []
+
+
+def test_chunk_round_trip_extreme_values():
+    records = [
+        EventRecord(0xFFFFFFFF, HookEvent.MAX, 0xFFFFFFFFFFFF, -4, -1, 0, 0, '', 'lone \ud800 surrogate'),
+        EventRecord(0, HookEvent.MIN, 0, int(ObjectId.CURSOR), 2 ** 31, 1, 1, 'é', ''),
+    ]
+    assert decode_chunk(encode_chunk(records)).records() == records
+
+
+@pytest.mark.parametrize('distinct_count', [1, 2, 3, 5, 17, 300])
+def test_chunk_bit_packing_widths(distinct_count):
+    records = [EventRecord(index, index % distinct_count, 0, 0, 0, 0) for index in range(600)]
+    assert decode_chunk(encode_chunk(records)).records() == records
+
+
+# Archive
+# ###################################################################
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_archive_round_trip(tmp_path, codec):
+    path = str(tmp_path / 'capture.w32a')
+    records = make_records(1000)
+    with ArchiveWriter(path, chunk_ms=1000, codec=codec, metadata={'machine': 'pc1'}) as writer:
+        writer.write_many(records)
+    with ArchiveReader(path) as reader:
+        assert reader.metadata == {'machine': 'pc1'}
+        assert len(reader.chunks) == 10
+        assert len(reader) == 1000
+        assert list(reader) == records
+
+
+def test_archive_chunks_are_time_bounded(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    with ArchiveWriter(path, chunk_ms=1000, chunk_events=30) as writer:
+        writer.write_many(make_records(200))
+    with ArchiveReader(path) as reader:
+        for chunk in reader.chunks:
+            assert chunk.count <= 30
+            assert chunk.t_max - chunk.t_min <= 1000
+
+
+def test_archive_select_chunks_uses_index(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    records = make_records(100)
+    records.append(EventRecord(5000, HookEvent.OBJECT_DESTROY, 1, 0, 0, 1, 1, r'C:\notepad.exe', ''))
+    with ArchiveWriter(path, chunk_ms=100) as writer:
+        writer.write_many(records)
+    with ArchiveReader(path) as reader:
+        assert len(reader.select_chunks(t_min=1200, t_max=1399)) == 2
+        assert len(reader.select_chunks(event_ids=[HookEvent.OBJECT_DESTROY])) == 1
+        assert len(reader.select_chunks(exe_paths=[r'C:\notepad.exe'])) == 1
+        assert reader.select_chunks(event_ids=[HookEvent.OBJECT_HIDE]) == []
+
+
+def test_archive_records_filters(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    records = make_records(300)
+    with ArchiveWriter(path, chunk_ms=500) as writer:
+        writer.write_many(records)
+    expected = [record for record in records
+                if 1500 <= record.event_time_ms <= 2500 and record.event_id == HookEvent.OBJECT_SHOW]
+    with ArchiveReader(path) as reader:
+        assert list(reader.records(1500, 2500, event_ids=[HookEvent.OBJECT_SHOW])) == expected
+
+
+def test_archive_to_file_object():
+    buffer = io.BytesIO()
+    with ArchiveWriter(buffer) as writer:
+        writer.write_many(make_records(10))
+    assert not buffer.closed
+
+
+def test_archive_unsupported_codec(tmp_path):
+    with pytest.raises(ArchiveError, match='unsupported codec'):
+        ArchiveWriter(str(tmp_path / 'capture.w32a'), codec='snappy')
+
+
+def test_archive_invalid_file(tmp_path):
+    path = tmp_path / 'not_an_archive.w32a'
+    path.write_bytes(b'hello world, this is not an archive')
+    with pytest.raises(ArchiveError, match='bad magic'):
+        ArchiveReader(str(path))
+
+
+def test_archive_keyframes(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    records = make_records(30)
+    with ArchiveWriter(path) as writer:
+        writer.write_many(records[:10])
+        writer.write_keyframe(records[9].event_time_ms, {'state': 1})
+        writer.write_many(records[10:])
+    with ArchiveReader(path) as reader:
+        assert len(reader.chunks) == 2
+        assert list(reader) == records
+        (keyframe,) = reader.keyframes
+        assert keyframe.chunk_index == 1
+        assert keyframe.event_time_ms == records[9].event_time_ms
+        assert reader.read_keyframe(keyframe) == {'state': 1}
+
+
+def test_archive_source_tags(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    records = make_records(20)
+    with ArchiveWriter(path, chunk_ms=100) as writer:
+        for index, record in enumerate(records):
+            writer.write(record, source='' if index < 10 else f'pc{index % 3}')
+    with ArchiveReader(path) as reader:
+        assert list(reader) == records
+        assert list(reader.tagged_records()) == [
+            ('' if index < 10 else f'pc{index % 3}', record) for index, record in enumerate(records)]
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from tests import fake_win32
+
+if fake_win32.desktop is None:
+    # Benchmarks run against the Win32 stand-in, which can not be installed once the real Win32 API is imported.
+    pytest.skip('requires the Win32 stand-in, only installed on platforms other than Windows',
+                allow_module_level=True)
+
+from benchmarks import suite  # noqa: E402
+from benchmarks.__main__ import main  # noqa: E402
+
+
+def _results(**values):
+    return {'meta': {}, 'results': {
+        name: {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        for name, (value, unit, higher_is_better) in values.items()}}
+
+
+def test_compare_results_lower_and_higher_is_better():
+    baseline = _results(latency=(10.0, 'us/op', False), throughput=(1000.0, 'events/s', True),
+                        removed=(1.0, 'us/op', False))
+    current = _results(latency=(12.0, 'us/op', False), throughput=(1100.0, 'events/s', True),
+                       added=(1.0, 'us/op', False))
+    comparisons = {comparison.name: comparison for comparison in suite.compare_results(baseline, current, 0.1)}
+    assert set(comparisons) == {'latency', 'throughput'}
+    assert abs(comparisons['latency'].regression - 0.2) < 1e-9
+    assert comparisons['latency'].failed
+    assert abs(comparisons['throughput'].regression + 0.1) < 1e-9
+    assert not comparisons['throughput'].failed
+
+
+def test_compare_results_thresholds():
+    baseline = _results(latency=(10.0, 'us/op', False))
+    current = _results(latency=(12.0, 'us/op', False))
+    [comparison] = suite.compare_results(baseline, current, 0.1, {'latency': 0.5})
+    assert not comparison.failed
+
+
+def test_run_and_compare_command(tmp_path, capsys):
+    baseline_path = str(tmp_path / 'baseline.json')
+    assert main(['run', '--scale', '0.01', '--output', baseline_path, 'hook_event', 'enrichment']) == 0
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    assert baseline['results']['enrich_batch_dedupe_ratio']['value'] == 32.0
+    assert baseline['results']['hook_event_known_us']['unit'] == 'us/op'
+
+    # 5x slower than the baseline
+    baseline['results']['hook_event_known_us']['value'] /= 5
+    regressed_path = str(tmp_path / 'regressed.json')
+    with open(regressed_path, 'wt', encoding='utf-8') as regressed_file:
+        json.dump(baseline, regressed_file)
+    capsys.readouterr()
+    assert main(['compare', regressed_path, baseline_path, '--max-regression', '2']) == 1
+    assert 'hook_event_known_us' in capsys.readouterr().out.splitlines()[-1]
+    assert main(['compare', regressed_path, baseline_path, '--max-regression', '2',
+                 '--threshold', 'hook_event_known_us=10']) == 0
@@ -0,0 +1,94 @@
+from win32_window_monitor.cdc import DESTROYED, FOREGROUND, WINDOW, ChangeDataCapture, Delta, ForegroundSlot, Resync
+from win32_window_monitor.desktop_state import WindowState
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.records import EventRecord
+
+CODE = r'C:\Program Files\Code\Code.exe'
+FIREFOX = r'C:\Program Files\Mozilla Firefox\firefox.exe'
+
+
+def event(event_time_ms, event_id, hwnd, title='', process_id=0, exe_path='', id_object=ObjectId.WINDOW):
+    return EventRecord(event_time_ms, event_id, hwnd, id_object, 0, 1, process_id, exe_path, title)
+
+
+def run(records, **kwargs):
+    messages = []
+    cdc = ChangeDataCapture(messages.append, **kwargs)
+    for record in records:
+        cdc.apply(record)
+    return cdc, messages
+
+
+def test_window_deltas_only_on_change():
+    cdc, messages = run([
+        event(1, HookEvent.OBJECT_CREATE, 0x10, 'a.txt', 100, CODE),
+        event(2, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),
+        event(3, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),  # no-op
+        event(4, HookEvent.OBJECT_NAMECHANGE, 0x10, 'a.txt', 100, CODE),  # no-op
+        event(5, HookEvent.OBJECT_NAMECHANGE, 0x10, 'b.txt', 0, ''),  # failed lookups keep the process
+        event(6, HookEvent.OBJECT_NAMECHANGE, 0x10, 'caret', id_object=ObjectId.CARET),  # ignored child
+        event(7, HookEvent.OBJECT_CLOAKED, 0x10, 'b.txt', 100, CODE),
+        event(8, HookEvent.OBJECT_UNCLOAKED, 0x10, 'b.txt', 100, CODE),
+        event(9, HookEvent.OBJECT_HIDE, 0x10, 'b.txt', 100, CODE),
+        event(10, HookEvent.OBJECT_DESTROY, 0x10),
+        event(11, HookEvent.OBJECT_DESTROY, 0x10),  # no-op
+        event(12, HookEvent.OBJECT_FOCUS, 0x10),  # not tracked
+    ], resync_interval_ms=None)
+    assert messages == [
+        Delta(1, WINDOW, 0x10, {'process_id': (None, 100), 'exe_path': (None, CODE), 'title': (None, 'a.txt'),
+                                'visible': (None, False), 'cloaked': (None, False)}),
+        Delta(2, WINDOW, 0x10, {'visible': (False, True)}),
+        Delta(5, WINDOW, 0x10, {'title': ('a.txt', 'b.txt')}),
+        Delta(7, WINDOW, 0x10, {'cloaked': (False, True)}),
+        Delta(8, WINDOW, 0x10, {'cloaked': (True, False)}),
+        Delta(9, WINDOW, 0x10, {'visible': (True, False)}),
+        Delta(10, DESTROYED, 0x10, {}),
+    ]
+    assert cdc.windows == {}
+    assert cdc.events == 12
+    assert cdc.reduction_ratio == 12 / 7
+
+
+def test_foreground_deltas():
+    cdc, messages = run([
+        event(1, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),
+        event(2, HookEvent.OBJECT_SHOW, 0x20, 'Mozilla Firefox', 200, FIREFOX),
+        event(3, HookEvent.SYSTEM_FOREGROUND, 0x10, 'a.txt', 100, CODE),
+        event(4, HookEvent.SYSTEM_FOREGROUND, 0x10, 'a.txt', 100, CODE),  # no-op
+        event(5, HookEvent.SYSTEM_FOREGROUND, 0x20, 'Mozilla Firefox', 200, FIREFOX),
+        event(6, HookEvent.OBJECT_NAMECHANGE, 0x20, 'News - Mozilla Firefox', 200, FIREFOX),
+        event(7, HookEvent.OBJECT_DESTROY, 0x20),
+    ], resync_interval_ms=None)
+    foreground = [message for message in messages if message.kind == FOREGROUND]
+    assert foreground == [
+        Delta(3, FOREGROUND, 0x10, {'hwnd': (0, 0x10), 'process_id': (0, 100), 'exe_path': ('', CODE),
+                                    'title': ('', 'a.txt')}),
+        Delta(5, FOREGROUND, 0x20, {'hwnd': (0x10, 0x20), 'process_id': (100, 200), 'exe_path': (CODE, FIREFOX),
+                                    'title': ('a.txt', 'Mozilla Firefox')}),
+        Delta(6, FOREGROUND, 0x20, {'title': ('Mozilla Firefox', 'News - Mozilla Firefox')}),
+        Delta(7, FOREGROUND, 0, {'hwnd': (0x20, 0), 'process_id': (200, 0), 'exe_path': (FIREFOX, ''),
+                                 'title': ('News - Mozilla Firefox', '')}),
+    ]
+    assert cdc.foreground == ForegroundSlot()
+
+
+def test_periodic_resync():
+    cdc, messages = run([
+        event(0, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),
+        event(500, HookEvent.SYSTEM_FOREGROUND, 0x10, 'a.txt', 100, CODE),
+        event(1000, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),
+        event(1500, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE),
+    ], resync_interval_ms=1000)
+    resyncs = [message for message in messages if isinstance(message, Resync)]
+    window = WindowState(0x10, 100, CODE, 'a.txt', visible=True)
+    assert resyncs == [Resync(1000, {0x10: window}, ForegroundSlot(0x10, 100, CODE, 'a.txt'))]
+    assert cdc.snapshot(2000) == Resync(2000, {0x10: window}, ForegroundSlot(0x10, 100, CODE, 'a.txt'))
+    assert cdc.deltas == 2  # new window, foreground
+
+
+def test_periodic_resync_across_tick_wraparound():
+    start_ms = 2 ** 32 - 2500
+    _, messages = run([event((start_ms + offset_ms) % 2 ** 32, HookEvent.OBJECT_SHOW, 0x10, 'a.txt', 100, CODE)
+                       for offset_ms in range(0, 6000, 500)], resync_interval_ms=1000)
+    assert [message.event_time_ms for message in messages if isinstance(message, Resync)] == \
+        [(start_ms + offset_ms) % 2 ** 32 for offset_ms in range(1000, 6000, 1000)]
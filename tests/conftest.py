@@ -0,0 +1,17 @@
+import sys
+
+import pytest
+from tests import fake_win32
+
+# On other platforms, the Win32 DLLs are replaced by a simulated desktop so that the package can be imported.
+if sys.platform != 'win32':
+    fake_win32.install()
+
+
+@pytest.fixture
+def fake_desktop() -> fake_win32.FakeDesktop:
+    """Simulated desktop, see tests/fake_win32.py. Tests using it are skipped on Windows."""
+    if fake_win32.desktop is None:
+        pytest.skip('requires the Win32 stand-in, only installed on platforms other than Windows')
+    fake_win32.desktop.reset()
+    return fake_win32.desktop
@@ -0,0 +1,94 @@
+import random
+
+from win32_window_monitor.archive import ArchiveReader, ArchiveWriter
+from win32_window_monitor.desktop_state import DesktopState, KeyframeRecorder, WindowState, state_at
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.records import EventRecord
+
+
+def event(event_time_ms, event_id, hwnd, title='', id_object=ObjectId.WINDOW, id_child=0):
+    return EventRecord(event_time_ms, int(event_id), hwnd, int(id_object), id_child, 1, hwnd * 10,
+                       f'app{hwnd}.exe', title)
+
+
+def random_events(count, seed=42):
+    rng = random.Random(seed)
+    event_ids = [HookEvent.OBJECT_CREATE, HookEvent.OBJECT_DESTROY, HookEvent.OBJECT_NAMECHANGE,
+                 HookEvent.SYSTEM_FOREGROUND, HookEvent.SYSTEM_MINIMIZEEND, HookEvent.OBJECT_SHOW]
+    return [event(index * 100, rng.choice(event_ids), rng.randint(1, 20), f'title {rng.randint(0, 5)}',
+                  id_child=rng.choice([0, 0, 0, 1]))
+            for index in range(count)]
+
+
+def replay(records, event_time_ms):
+    state = DesktopState()
+    for record in records:
+        if record.event_time_ms <= event_time_ms:
+            state.apply(record)
+    state.event_time_ms = event_time_ms
+    return state
+
+
+def test_apply():
+    state = DesktopState()
+    state.apply(event(1, HookEvent.OBJECT_CREATE, 1, 'a'))
+    state.apply(event(2, HookEvent.OBJECT_CREATE, 2, 'b'))
+    state.apply(event(3, HookEvent.SYSTEM_FOREGROUND, 2, 'b'))
+    state.apply(event(4, HookEvent.OBJECT_NAMECHANGE, 2, 'b2'))
+    state.apply(event(5, HookEvent.OBJECT_NAMECHANGE, 1, 'caret', id_object=ObjectId.CARET))
+    assert state.foreground == WindowState(2, 20, 'app2.exe', 'b2', visible=True)
+    assert state.windows[1].title == 'a'
+    state.apply(event(6, HookEvent.OBJECT_DESTROY, 2))
+    assert state.foreground is None
+    assert list(state.windows) == [1]
+    assert state.event_time_ms == 6
+
+
+def test_keyframe_round_trip():
+    state = DesktopState()
+    for record in random_events(100):
+        state.apply(record)
+    assert DesktopState.from_keyframe(state.to_keyframe()) == state
+
+
+def test_state_at_matches_full_replay(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    records = random_events(2000)
+    with KeyframeRecorder(ArchiveWriter(path, chunk_ms=5_000), keyframe_interval_ms=20_000) as recorder:
+        for record in records:
+            recorder.write(record)
+    with ArchiveReader(path) as reader:
+        assert len(reader.keyframes) == 9
+        for event_time_ms in [-1, 0, 50, 19_999, 20_000, 20_050, 123_456, 199_900, 500_000]:
+            assert state_at(reader, event_time_ms) == replay(records, event_time_ms)
+
+
+def test_state_at_reads_bounded_number_of_chunks(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    with KeyframeRecorder(ArchiveWriter(path, chunk_ms=5_000), keyframe_interval_ms=20_000) as recorder:
+        for record in random_events(5000):
+            recorder.write(record)
+    with ArchiveReader(path) as reader:
+        read_columns = reader.read_columns
+        read_chunks = []
+        reader.read_columns = lambda chunk: read_chunks.append(chunk) or read_columns(chunk)
+        state_at(reader, 450_000)
+        assert len(read_chunks) <= 4
+
+
+def test_keyframes_and_state_at_across_tick_wraparound(tmp_path):
+    path = str(tmp_path / 'capture.w32a')
+    start_ms = 2 ** 32 - 100_000
+    records = [record._replace(event_time_ms=start_ms + record.event_time_ms) for record in random_events(2000)]
+    with KeyframeRecorder(ArchiveWriter(path, chunk_ms=5_000), keyframe_interval_ms=20_000) as recorder:
+        for record in records:
+            recorder.write(record._replace(event_time_ms=record.event_time_ms % 2 ** 32))
+    with ArchiveReader(path) as reader:
+        keyframe_times = [keyframe.event_time_ms for keyframe in reader.keyframes]
+        assert len(keyframe_times) == 9
+        assert keyframe_times == sorted(keyframe_times)
+        assert keyframe_times[-1] > 2 ** 32
+        for event_time_ms in [start_ms, 2 ** 32 - 1, 2 ** 32, 2 ** 32 + 50_000, start_ms + 199_900]:
+            expected = replay(records, event_time_ms)
+            assert state_at(reader, event_time_ms).windows == expected.windows
+            assert state_at(reader, event_time_ms).foreground_hwnd == expected.foreground_hwnd
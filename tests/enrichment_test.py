@@ -0,0 +1,69 @@
+import pytest
+from win32_window_monitor import enrichment
+from win32_window_monitor.enrichment import EnrichmentStats, EventBatcher, enrich_batch
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.records import EventRecord
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = []
+
+    def get_hwnd_process_id(event_thread_id, hwnd, log_error=True):
+        calls.append(('pid', event_thread_id, hwnd))
+        return {1: 100, 2: 200}.get(event_thread_id)
+
+    def get_process_filename(process_id, log_error=True):
+        calls.append(('filename', process_id))
+        return {100: r'C:\app100.exe'}.get(process_id)
+
+    def get_window_title(hwnd):
+        calls.append(('title', hwnd))
+        return f'window {hwnd:#x}'
+
+    monkeypatch.setattr(enrichment, 'get_hwnd_process_id', get_hwnd_process_id)
+    monkeypatch.setattr(enrichment, 'get_process_filename', get_process_filename)
+    monkeypatch.setattr(enrichment, 'get_window_title', get_window_title)
+    return calls
+
+
+def raw_event(hwnd, thread_id, event_time_ms, event_id=HookEvent.OBJECT_SHOW, id_object=ObjectId.WINDOW):
+    return (0x1234, event_id, hwnd, id_object, 0, thread_id, event_time_ms)
+
+
+def test_enrich_batch(lookups):
+    raw_events = [
+        raw_event(0x10, 1, 1),
+        raw_event(0x10, 1, 2),
+        raw_event(0x20, 2, 3),
+        raw_event(None, 3, 4, id_object=ObjectId.CURSOR),
+        raw_event(0x10, 1, 5),
+    ]
+    records, stats = enrich_batch(raw_events)
+    assert records == [
+        EventRecord(1, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 1, 100, r'C:\app100.exe', 'window 0x10'),
+        EventRecord(2, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 1, 100, r'C:\app100.exe', 'window 0x10'),
+        EventRecord(3, HookEvent.OBJECT_SHOW, 0x20, ObjectId.WINDOW, 0, 2, 200, '', 'window 0x20'),
+        EventRecord(4, HookEvent.OBJECT_SHOW, 0, ObjectId.CURSOR, 0, 3, 0, '', ''),
+        EventRecord(5, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 1, 100, r'C:\app100.exe', 'window 0x10'),
+    ]
+    assert stats == EnrichmentStats(events=5, pid_lookups=3, filename_lookups=2, title_lookups=2)
+    assert len(lookups) == stats.lookups
+    assert stats.dedupe_ratio == 15 / 7
+
+
+def test_enrich_empty_batch(lookups):
+    assert enrich_batch([]) == ([], EnrichmentStats())
+    assert EnrichmentStats().dedupe_ratio == 1.0
+
+
+def test_event_batcher(lookups):
+    batcher = EventBatcher()
+    for event_time_ms in range(10):
+        batcher.on_event(*raw_event(0x10, 1, event_time_ms))
+    records = batcher.drain()
+    assert [record.event_time_ms for record in records] == list(range(10))
+    assert batcher.drain() == []
+    batcher.on_event(*raw_event(0x10, 1, 10))
+    assert len(batcher.drain()) == 1
+    assert batcher.stats == EnrichmentStats(events=11, pid_lookups=2, filename_lookups=2, title_lookups=2)
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from win32_window_monitor import enrichment
+from win32_window_monitor.executor import ProcessPoolEventExecutor
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.records import EventRecord
+
+
+def title_length(record: EventRecord):
+    return len(record.title), os.getpid()
+
+
+def failing_handler(record: EventRecord):
+    raise RuntimeError('handler failed')
+
+
+def fail_on_first_event(record: EventRecord):
+    if record.event_time_ms == 0:
+        raise RuntimeError('handler failed')
+    return record.event_time_ms
+
+
+def record(event_time_ms):
+    return EventRecord(event_time_ms, HookEvent.SYSTEM_FOREGROUND, 1, ObjectId.WINDOW, 0, 1, 1, 'a.exe',
+                       'x' * (event_time_ms % 7))
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_results(ordered):
+    results = []
+    with ProcessPoolEventExecutor(title_length, lambda record, result: results.append((record, result[0])),
+                                  workers=2, max_in_flight=2, ordered=ordered) as executor:
+        for start in range(0, 1000, 10):
+            executor.submit([record(event_time_ms) for event_time_ms in range(start, start + 10)])
+            assert executor.in_flight <= 2
+    expected = [(record(event_time_ms), event_time_ms % 7) for event_time_ms in range(1000)]
+    if ordered:
+        assert results == expected
+    else:
+        assert sorted(results) == expected
+
+
+def test_handler_runs_in_worker_processes():
+    pids = set()
+    with ProcessPoolEventExecutor(title_length, lambda record, result: pids.add(result[1]), workers=2) as executor:
+        executor.submit([record(0)])
+    assert os.getpid() not in pids
+
+
+def test_on_event_batches_and_enriches(monkeypatch):
+    monkeypatch.setattr(enrichment, 'get_hwnd_process_id', lambda thread_id, hwnd, log_error=True: 42)
+    monkeypatch.setattr(enrichment, 'get_process_filename', lambda process_id, log_error=True: 'p.exe')
+    monkeypatch.setattr(enrichment, 'get_window_title', lambda hwnd: 'title')
+    results = []
+    with ProcessPoolEventExecutor(title_length, lambda record, result: results.append(record), workers=1,
+                                  batch_size=4) as executor:
+        # The tick count wraps around in the middle of the second batch.
+        event_times_ms = [(2 ** 32 - 6 + offset_ms) % 2 ** 32 for offset_ms in range(10)]
+        for event_time_ms in event_times_ms:
+            executor.on_event(0, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 7, event_time_ms)
+        executor.flush()
+    assert [result.event_time_ms for result in results] == event_times_ms
+    assert results[0] == EventRecord(2 ** 32 - 6, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 7, 42, 'p.exe',
+                                     'title')
+
+
+def test_handler_error_is_raised():
+    with pytest.raises(RuntimeError, match='handler failed'):
+        with ProcessPoolEventExecutor(failing_handler, lambda record, result: None, workers=1) as executor:
+            executor.submit([record(0)])
+
+
+def test_handler_error_in_hook_callback_is_raised_by_poll():
+    results = []
+    with ProcessPoolEventExecutor(fail_on_first_event, lambda record, result: results.append(result), workers=1,
+                                  batch_size=1, max_in_flight=1, enrich=False) as executor:
+        # The second event waits for the first batch, which fails: on_event() must not raise.
+        for event_time_ms in range(2):
+            executor.on_event(0, HookEvent.OBJECT_SHOW, 0x10, ObjectId.WINDOW, 0, 7, event_time_ms)
+        with pytest.raises(RuntimeError, match='handler failed'):
+            executor.poll()
+    assert results == [1]
@@ -0,0 +1,327 @@
+"""
+Stand-in for the Win32 DLLs used by win32_window_monitor.win32api, to run tests and benchmarks on
+platforms without Windows, or with a deterministic simulated desktop.
+
+install() must be called before win32_window_monitor is imported: it replaces ctypes.windll with a
+simulated desktop of processes, threads and windows, whose functions follow the Win32 API calling
+conventions used by win32api (out parameters passed with ctypes.byref(), buffers...). Event hooks
+registered with set_win_event_hook() are called through their real ctypes trampoline.
+
+Example::
+
+    from tests import fake_win32
+    desktop = fake_win32.install()
+    from win32_window_monitor import *
+
+    desktop.add_process(100, r'C:\\Windows\\notepad.exe')
+    desktop.add_window(0x10, 100, 1000, 'Untitled - Notepad')
+    desktop.post_event(HookEvent.SYSTEM_FOREGROUND, 0x10)
+    run_message_loop()  # dispatches the posted events, returns when no message is left
+"""
+
+import collections
+import ctypes
+import sys
+import types
+from typing import Callable, Dict, NamedTuple, Optional
+
+WM_QUIT = 0x0012
+ERROR_INVALID_PARAMETER = 87
+ERROR_INVALID_HANDLE = 6
+INFINITE = 0xFFFFFFFF
+WAIT_TIMEOUT = 0x102
+WAIT_FAILED = 0xFFFFFFFF
+
+
+class FakeProcess(NamedTuple):
+    process_id: int
+    exe_path: str
+    #: Creation time, as a FILETIME value (100ns intervals since 1601).
+    creation_time: int
+
+
+class FakeWindow(NamedTuple):
+    hwnd: int
+    process_id: int
+    thread_id: int
+    title: str
+
+
+class _FakeFunction:
+    """Callable with the argtypes/restype attributes of a ctypes foreign function."""
+
+    def __init__(self, name: str, implementation: Callable, call_counts: collections.Counter):
+        self.__name__ = name
+        self.implementation = implementation
+        self.call_counts = call_counts
+        self.argtypes = None
+        self.restype = None
+
+    def __call__(self, *args):
+        self.call_counts[self.__name__] += 1
+        return self.implementation(*args)
+
+
+class _FakeDll:
+    def __init__(self, desktop: 'FakeDesktop', prefix: str):
+        self._desktop = desktop
+        self._prefix = prefix
+        self._functions = {}
+
+    def __getattr__(self, name: str):
+        function = self._functions.get(name)
+        if function is None:
+            implementation = getattr(self._desktop, self._prefix + name, None)
+            if implementation is None:
+                raise AttributeError(f'function {name!r} not found in the Win32 stand-in')
+            function = self._functions[name] = _FakeFunction(name, implementation, self._desktop.call_counts)
+        return function
+
+
+def _out(pointer):
+    """Returns the object referenced by a ctypes.byref() or pointer parameter."""
+    return getattr(pointer, '_obj', pointer)
+
+
+class FakeDesktop:
+    """Simulated processes, threads, windows, event hooks and message queue."""
+
+    def __init__(self):
+        self.user32 = _FakeDll(self, '_user32_')
+        self.kernel32 = _FakeDll(self, '_kernel32_')
+        self.ole32 = _FakeDll(self, '_ole32_')
+        #: Number of calls of each Win32 function.
+        self.call_counts = collections.Counter()
+        self.reset()
+
+    def reset(self):
+        """Removes all the processes, windows, hooks and messages."""
+        self.processes: Dict[int, FakeProcess] = {}
+        self.windows: Dict[int, FakeWindow] = {}
+        self.threads: Dict[int, int] = {}  # thread id => process id
+        self.hooks: Dict[int, tuple] = {}  # hook handle => (event_min, event_max, trampoline)
+        self.handles: Dict[int, tuple] = {}  # open handle => ('process' or 'thread', id)
+        self.messages = collections.deque()
+        self.events: Dict[int, bool] = {}  # auto-reset event handle => signaled
+        #: Current GetTickCount() value.
+        self.tick_ms = 1000
+        self.last_error = 0
+        self._next_handle = 0x100
+        self.call_counts.clear()
+
+    # Simulated desktop
+    # ###################################################################
+
+    def add_process(self, process_id: int, exe_path: str, creation_time: int = 133_000_000_000_000_000):
+        self.processes[process_id] = FakeProcess(process_id, exe_path, creation_time)
+
+    def remove_process(self, process_id: int):
+        self.processes.pop(process_id, None)
+        for hwnd in [hwnd for hwnd, window in self.windows.items() if window.process_id == process_id]:
+            del self.windows[hwnd]
+
+    def add_window(self, hwnd: int, process_id: int, thread_id: int, title: str = ''):
+        self.windows[hwnd] = FakeWindow(hwnd, process_id, thread_id, title)
+        self.threads[thread_id] = process_id
+
+    def set_title(self, hwnd: int, title: str):
+        self.windows[hwnd] = self.windows[hwnd]._replace(title=title)
+
+    def remove_window(self, hwnd: int):
+        self.windows.pop(hwnd, None)
+
+    def post_event(self, event_id: int, hwnd: int, id_object: int = 0, id_child: int = 0,
+                   thread_id: Optional[int] = None, event_time_ms: Optional[int] = None):
+        """Queues an event, dispatched to the hooks by the message loop."""
+        if thread_id is None:
+            window = self.windows.get(hwnd)
+            thread_id = window.thread_id if window else 0
+        self.messages.append(('event', (int(event_id), hwnd, id_object, id_child, thread_id,
+                                         self.tick_ms if event_time_ms is None else event_time_ms)))
+
+    def fire_event(self, event_id: int, hwnd: int, id_object: int = 0, id_child: int = 0,
+                   thread_id: int = 0, event_time_ms: Optional[int] = None):
+        """Calls the hooks registered for event_id immediately."""
+        event_id = int(event_id)
+        event_time_ms = self.tick_ms if event_time_ms is None else event_time_ms
+        for handle, (event_min, event_max, trampoline) in list(self.hooks.items()):
+            if event_min <= event_id <= event_max:
+                trampoline(handle, event_id, hwnd, id_object, id_child, thread_id, event_time_ms)
+
+    def post_message(self, message: int, wparam: int = 0):
+        """Queues a posted thread message, returned by GetMessageW or PeekMessageW."""
+        self.messages.append(('message', (message, wparam)))
+
+    def create_event(self) -> int:
+        """Returns the handle of a new non-signaled auto-reset event, waitable with MsgWaitForMultipleObjectsEx."""
+        handle = self._new_handle('event', 0)
+        del self.handles[handle]
+        self.events[handle] = False
+        return handle
+
+    def set_event(self, handle: int):
+        self.events[handle] = True
+
+    @property
+    def open_handle_count(self) -> int:
+        """Number of process and thread handles not closed yet."""
+        return len(self.handles)
+
+    def _new_handle(self, kind: str, object_id: int) -> int:
+        self._next_handle += 4
+        self.handles[self._next_handle] = (kind, object_id)
+        return self._next_handle
+
+    # kernel32
+    # ###################################################################
+
+    def _kernel32_OpenProcess(self, access, inherit, process_id):
+        if process_id not in self.processes:
+            self.last_error = ERROR_INVALID_PARAMETER
+            return 0
+        return self._new_handle('process', process_id)
+
+    def _kernel32_OpenThread(self, access, inherit, thread_id):
+        if thread_id not in self.threads or self.threads[thread_id] not in self.processes:
+            self.last_error = ERROR_INVALID_PARAMETER
+            return 0
+        return self._new_handle('thread', thread_id)
+
+    def _kernel32_CloseHandle(self, handle):
+        return 1 if self.handles.pop(handle, None) else 0
+
+    def _kernel32_GetProcessIdOfThread(self, handle):
+        kind, thread_id = self.handles[handle]
+        return self.threads.get(thread_id, 0)
+
+    def _kernel32_QueryFullProcessImageNameW(self, handle, flags, buffer, size):
+        kind, process_id = self.handles[handle]
+        _out(buffer).value = self.processes[process_id].exe_path
+        return 1
+
+    def _kernel32_GetProcessTimes(self, handle, creation_time, exit_time, kernel_time, user_time):
+        kind, process_id = self.handles[handle]
+        value = self.processes[process_id].creation_time
+        _out(creation_time).dwLowDateTime = value & 0xFFFFFFFF
+        _out(creation_time).dwHighDateTime = value >> 32
+        return 1
+
+    def _kernel32_GetTickCount(self):
+        return self.tick_ms & 0xFFFFFFFF
+
+    # user32
+    # ###################################################################
+
+    def _user32_GetWindowThreadProcessId(self, hwnd, process_id):
+        window = self.windows.get(hwnd)
+        if window is None:
+            self.last_error = ERROR_INVALID_PARAMETER
+            return 0
+        _out(process_id).value = window.process_id
+        return window.thread_id
+
+    def _user32_GetWindowTextLengthW(self, hwnd):
+        window = self.windows.get(hwnd)
+        return len(window.title) if window else 0
+
+    def _user32_GetWindowTextW(self, hwnd, buffer, max_count):
+        window = self.windows.get(hwnd)
+        title = window.title[:max_count - 1] if window else ''
+        buffer.value = title
+        return len(title)
+
+    def _user32_SetWinEventHook(self, event_min, event_max, module, trampoline, process_id, thread_id, flags):
+        handle = self._new_handle('hook', 0)
+        del self.handles[handle]
+        self.hooks[handle] = (event_min, event_max, trampoline)
+        return handle
+
+    def _user32_UnhookWinEvent(self, handle):
+        return 1 if self.hooks.pop(handle, None) else 0
+
+    def _next_message(self, msg) -> bool:
+        """Dispatches the queued events up to the next posted message, stored in msg. False if there is none."""
+        while self.messages:
+            kind, payload = self.messages.popleft()
+            if kind == 'event':
+                self.fire_event(*payload)
+            elif kind == 'message':
+                _out(msg).message, _out(msg).wParam = payload
+                return True
+            else:
+                _out(msg).message = WM_QUIT
+                _out(msg).wParam = payload
+                return True
+        return False
+
+    def _user32_GetMessageW(self, msg, hwnd, filter_min, filter_max):
+        """Dispatches the queued events. The queue being empty is treated as WM_QUIT, so loops terminate."""
+        if not self._next_message(msg):
+            _out(msg).message = WM_QUIT
+        return 0 if _out(msg).message == WM_QUIT else 1
+
+    def _user32_PeekMessageW(self, msg, hwnd, filter_min, filter_max, remove):
+        return 1 if self._next_message(msg) else 0
+
+    def _user32_MsgWaitForMultipleObjectsEx(self, count, handles, milliseconds, wake_mask, flags):
+        """Returns the first signaled event, else WAIT_OBJECT_0 + count if messages are queued, else simulates
+        the timeout by advancing tick_ms. An infinite wait with nothing to wait for is treated as WM_QUIT, so
+        loops terminate."""
+        handles = [handles[index] for index in range(count)]
+        for index, handle in enumerate(handles):
+            if handle not in self.events:
+                self.last_error = ERROR_INVALID_HANDLE
+                return WAIT_FAILED
+            if self.events[handle]:
+                self.events[handle] = False
+                return index
+        if self.messages:
+            return count
+        if milliseconds == INFINITE:
+            self.messages.append(('quit', 0))
+            return count
+        self.tick_ms += milliseconds
+        return WAIT_TIMEOUT
+
+    def _user32_TranslateMessage(self, msg):
+        return 0
+
+    def _user32_DispatchMessageW(self, msg):
+        return 0
+
+    def _user32_PostQuitMessage(self, exit_code):
+        self.messages.append(('quit', exit_code))
+
+    # ole32
+    # ###################################################################
+
+    def _ole32_CoInitialize(self, reserved):
+        return 0
+
+    def _ole32_CoUninitialize(self):
+        return None
+
+
+#: Simulated desktop installed by install().
+desktop: Optional[FakeDesktop] = None
+
+
+def install() -> FakeDesktop:
+    """Installs the stand-in in ctypes (once) and returns the simulated desktop.
+
+    Must be called before win32_window_monitor.win32api is imported.
+    """
+    global desktop
+    if desktop is not None:
+        return desktop
+    if 'win32_window_monitor.win32api' in sys.modules:
+        raise RuntimeError('fake_win32.install() must be called before importing win32_window_monitor')
+    desktop = FakeDesktop()
+    ctypes.windll = types.SimpleNamespace(user32=desktop.user32, kernel32=desktop.kernel32, ole32=desktop.ole32)
+    if not hasattr(ctypes, 'WINFUNCTYPE'):
+        ctypes.WINFUNCTYPE = ctypes.CFUNCTYPE
+    ctypes.GetLastError = lambda: desktop.last_error
+    ctypes.WinError = lambda code=None, descr=None: OSError(
+        None, descr or f'[WinError {desktop.last_error if code is None else code}]', None,
+        desktop.last_error if code is None else code)
+    return desktop
@@ -0,0 +1,68 @@
+import pytest
+from win32_window_monitor.archive import ArchiveError, ArchiveReader, ArchiveWriter
+from win32_window_monitor.ids import HookEvent
+from win32_window_monitor.merge import MergedEvent, anchor_metadata, iter_merged, merge_captures
+from win32_window_monitor.records import EventRecord
+
+WALL_TIME_MS = 1_700_000_000_000
+
+
+def write_capture(path, source, anchor_tick_ms, ticks):
+    metadata = anchor_metadata(anchor_tick_ms, WALL_TIME_MS, source)
+    with ArchiveWriter(str(path), chunk_ms=1000, metadata=metadata) as writer:
+        for index, tick_ms in enumerate(ticks):
+            writer.write(EventRecord(tick_ms, HookEvent.SYSTEM_FOREGROUND, index, 0, 0, 1, 1, f'{source}.exe'))
+    return str(path)
+
+
+@pytest.fixture
+def captures(tmp_path):
+    return [
+        write_capture(tmp_path / 'pc1.w32a', 'pc1', 10_000, range(10_000, 20_000, 300)),
+        # Tick count wraps around during the capture
+        write_capture(tmp_path / 'pc2.w32a', None, 0xFFFF_F000,
+                      [(0xFFFF_F000 + delta) % 2 ** 32 for delta in range(0, 8_000, 500)]),
+    ]
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_iter_merged(captures, workers):
+    events = list(iter_merged(captures, workers=workers))
+    assert len(events) == 34 + 16
+    assert [event.wall_time_ms for event in events] == sorted(event.wall_time_ms for event in events)
+    pc1 = [event for event in events if event.source == 'pc1']
+    pc2 = [event for event in events if event.source == 'pc2']
+    assert [event.wall_time_ms - WALL_TIME_MS for event in pc1] == list(range(0, 10_000, 300))
+    assert [event.wall_time_ms - WALL_TIME_MS for event in pc2] == list(range(0, 8_000, 500))
+    assert pc2[-1].record.event_time_ms == 7_500 - 0x1000
+
+
+def test_merge_captures_to_archive_and_sink(captures, tmp_path):
+    output = str(tmp_path / 'merged.w32a')
+    sunk = []
+    stats = merge_captures(captures, output, sink=sunk.append, workers=0)
+    assert stats.sources == 2
+    assert stats.events == 50
+    assert stats.events_per_second > 0
+    assert all(isinstance(event, MergedEvent) for event in sunk)
+    with ArchiveReader(output) as reader:
+        assert [(source, record.event_time_ms) for source, record in reader.tagged_records()] == \
+            [(event.source, event.wall_time_ms) for event in sunk]
+
+
+def test_missing_anchor(tmp_path):
+    path = str(tmp_path / 'no_anchor.w32a')
+    with ArchiveWriter(path) as writer:
+        writer.write(EventRecord(1, HookEvent.SYSTEM_FOREGROUND, 0, 0, 0, 0))
+    with pytest.raises(ArchiveError, match='missing clock anchor'):
+        list(iter_merged([path], workers=0))
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_events_out_of_order_across_chunks(tmp_path, workers):
+    # The event at 1998 is recorded after the event at 2000, in the next chunk.
+    path = write_capture(tmp_path / 'pc1.w32a', 'pc1', 1000, [1000, 1500, 1999, 2000, 1998, 2500])
+    with ArchiveReader(path) as reader:
+        assert [chunk.t_min for chunk in reader.chunks] == [1000, 1998]
+    events = list(iter_merged([path], workers=workers))
+    assert [event.wall_time_ms - WALL_TIME_MS for event in events] == [0, 500, 998, 999, 1000, 1500]
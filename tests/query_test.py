@@ -0,0 +1,133 @@
+import pytest
+from win32_window_monitor.archive import ArchiveWriter
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.query import Query, numpy
+from win32_window_monitor.records import EventRecord
+
+USE_NUMPY = [False, True] if numpy is not None else [False]
+
+FIREFOX = r'C:\Program Files\Mozilla Firefox\firefox.exe'
+EXPLORER = r'C:\Windows\explorer.exe'
+NOTEPAD = r'C:\Windows\notepad.exe'
+
+
+def foreground(event_time_ms, process_id, exe_path):
+    return EventRecord(event_time_ms, HookEvent.SYSTEM_FOREGROUND, process_id, ObjectId.WINDOW, 0, 1,
+                       process_id, exe_path, exe_path)
+
+
+def show(event_time_ms, process_id, exe_path):
+    return EventRecord(event_time_ms, HookEvent.OBJECT_SHOW, process_id, ObjectId.WINDOW, 0, 1,
+                       process_id, exe_path, '')
+
+
+@pytest.fixture
+def capture(tmp_path):
+    records = [
+        foreground(0, 10, FIREFOX),
+        show(1_000, 10, FIREFOX),
+        show(30_000, 20, EXPLORER),
+        foreground(60_000, 20, EXPLORER),
+        show(61_000, 10, FIREFOX),
+        show(62_000, 10, FIREFOX),
+        foreground(90_000, 30, NOTEPAD),
+        foreground(150_000, 10, FIREFOX),
+        show(180_000, 30, NOTEPAD),
+    ]
+    path = str(tmp_path / 'capture.w32a')
+    with ArchiveWriter(path, chunk_ms=20_000) as writer:
+        writer.write_many(records)
+    return path, records
+
+
+def test_records(capture):
+    path, records = capture
+    assert list(Query(path).records()) == records
+    assert list(Query(path).between(60_000, 90_000).where(event_ids=[HookEvent.OBJECT_SHOW]).records()) == \
+        records[4:6]
+    assert list(Query(path).where(exe_paths=[NOTEPAD], process_ids=[30]).records()) == [records[6], records[8]]
+    assert list(Query(path).where(object_ids=[ObjectId.CURSOR]).records()) == []
+
+
+def test_count(capture):
+    path, records = capture
+    assert Query(path).count() == len(records)
+    assert Query(path).where(event_ids=[HookEvent.SYSTEM_FOREGROUND]).count() == 4
+    assert Query(path).between(200_000, None).count() == 0
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_count_by_process_per_minute(capture, use_numpy):
+    path, _ = capture
+    query = Query(path, use_numpy=use_numpy).where(event_ids=[HookEvent.OBJECT_SHOW])
+    assert query.count_by('process_id', bucket_ms=60_000) == {
+        (10, 0): 1,
+        (20, 0): 1,
+        (10, 60_000): 2,
+        (30, 180_000): 1,
+    }
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_count_by_strings(capture, use_numpy):
+    path, _ = capture
+    assert Query(path, use_numpy=use_numpy).count_by('exe_path', 'event_id') == {
+        (FIREFOX, HookEvent.SYSTEM_FOREGROUND): 2,
+        (FIREFOX, HookEvent.OBJECT_SHOW): 3,
+        (EXPLORER, HookEvent.SYSTEM_FOREGROUND): 1,
+        (EXPLORER, HookEvent.OBJECT_SHOW): 1,
+        (NOTEPAD, HookEvent.SYSTEM_FOREGROUND): 1,
+        (NOTEPAD, HookEvent.OBJECT_SHOW): 1,
+    }
+
+
+def test_count_by_invalid_key(capture):
+    path, _ = capture
+    with pytest.raises(ValueError, match='invalid group key'):
+        Query(path).count_by('color')
+
+
+def test_focus_time_by_exe(capture):
+    path, _ = capture
+    assert Query(path).focus_time_by_exe() == [(FIREFOX, 90_000), (NOTEPAD, 60_000), (EXPLORER, 30_000)]
+    assert Query(path).focus_time_by_exe(top=1) == [(FIREFOX, 90_000)]
+
+
+def test_focus_time_by_exe_between_seeks_previous_foreground(capture):
+    path, _ = capture
+    # Explorer had the focus since 60_000.
+    assert Query(path).between(70_000, 100_000).focus_time_by_exe() == [(EXPLORER, 20_000), (NOTEPAD, 10_000)]
+    assert Query(path).between(70_000, 100_000).where(process_ids=[30]).focus_time_by_exe() == [(NOTEPAD, 10_000)]
+
+
+def test_multiple_files(capture, tmp_path):
+    path, records = capture
+    other_path = str(tmp_path / 'other.w32a')
+    with ArchiveWriter(other_path) as writer:
+        writer.write_many(records[:3])
+    assert Query([path, other_path]).count() == len(records) + 3
+
+
+def test_process_pool(capture):
+    path, records = capture
+    query = Query(path, workers=2)
+    assert list(query.records()) == records
+    assert query.count_by('process_id') == Query(path).count_by('process_id')
+    assert query.focus_time_by_exe() == Query(path).focus_time_by_exe()
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_capture_across_tick_wraparound(tmp_path, use_numpy):
+    # Foreground changes every 10ms, GetTickCount wraps around between the 5th and the 6th.
+    records = [foreground((2 ** 32 - 50 + index * 10) % 2 ** 32, 10 + index % 2, NOTEPAD if index % 2 else FIREFOX)
+               for index in range(10)]
+    path = str(tmp_path / 'capture.w32a')
+    with ArchiveWriter(path, chunk_ms=20) as writer:
+        writer.write_many(records)
+    query = Query(path, use_numpy=use_numpy)
+    assert list(query.records()) == records
+    assert query.focus_time_by_exe() == [(FIREFOX, 50), (NOTEPAD, 40)]
+    assert query.between(2 ** 32 - 30, 2 ** 32 + 20).focus_time_by_exe() == [(FIREFOX, 30), (NOTEPAD, 20)]
+    assert list(query.between(2 ** 32, None).records()) == records[5:]
+    assert query.count_by('process_id', bucket_ms=2 ** 32) == {(10, 0): 3, (11, 0): 2, (10, 2 ** 32): 2,
+                                                                (11, 2 ** 32): 3}
@@ -0,0 +1,141 @@
+import fnmatch
+import json
+import random
+import re
+import threading
+
+import pytest
+from win32_window_monitor.ids import HookEvent
+from win32_window_monitor.records import EventRecord
+from win32_window_monitor.rules import Rule, RuleEngine, load_rules
+
+RULES = [
+    Rule('browser', 'firefox.exe', field='exe'),
+    Rule('browser', 'chrome*', field='exe'),
+    Rule('meeting', '* - Zoom Meeting'),
+    Rule('meeting', 'Meet - ???-????-???'),
+    Rule('work', r'\bJIRA-\d+', kind='regex'),
+    Rule('work', 'Visual Studio', kind='prefix'),
+    Rule('chat', 'Slack', kind='exact'),
+    Rule('repeat', r'\b(\w+) \1\b', kind='regex'),
+]
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine(RULES)
+
+
+def test_classify_exact_and_prefix(engine):
+    assert engine.classify('firefox.exe', '') == {'browser'}
+    assert engine.classify('chrome_proxy.exe', '') == {'browser'}
+    assert engine.classify('notepad.exe', 'Slack') == {'chat'}
+    assert engine.classify('notepad.exe', 'Slack - general') == frozenset()
+    assert engine.classify('devenv.exe', 'Visual Studio 2022') == {'work'}
+
+
+def test_classify_glob_and_regex(engine):
+    assert engine.classify('Zoom.exe', 'Team sync - Zoom Meeting') == {'meeting'}
+    assert engine.classify('firefox.exe', 'Meet - abc-defg-hij - Mozilla Firefox') == {'browser'}
+    assert engine.classify('firefox.exe', 'Meet - abc-defg-hij') == {'browser', 'meeting'}
+    assert engine.classify('firefox.exe', 'JIRA-123 - Mozilla Firefox') == {'browser', 'work'}
+    assert engine.classify('x.exe', 'hello hello') == {'repeat'}
+
+
+def test_classify_ignore_case(engine):
+    assert engine.classify('FireFox.EXE', 'jira-1') == {'browser', 'work'}
+    assert RuleEngine(RULES, ignore_case=False).classify('FireFox.EXE', 'jira-1') == frozenset()
+
+
+def test_classify_suffix_and_substring():
+    engine = RuleEngine([
+        Rule('pdf', '*.pdf'),
+        Rule('invoice', '*invoice*'),
+        Rule('voice', 'voice', kind='substring'),
+        Rule('all', '**'),
+        Rule('report', 'report', kind='suffix'),
+    ])
+    assert engine.classify('', 'Invoice 2023.pdf') == {'pdf', 'invoice', 'voice', 'all'}
+    assert engine.classify('', 'annual report') == {'report', 'all'}
+    assert engine.classify('', '') == {'all'}
+
+
+def test_classify_globs_same_as_fnmatch():
+    rng = random.Random(1)
+    alphabet = 'abc'
+    glob_parts = ['a', 'b', 'c', 'ab', '*', '?', '[ab]']
+    rules = [Rule(f'c{index}', ''.join(rng.choice(glob_parts) for _ in range(rng.randint(1, 4))))
+             for index in range(200)]
+    engine = RuleEngine(rules)
+    for _ in range(500):
+        title = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        expected = {rule.category for rule in rules if fnmatch.fnmatchcase(title, rule.pattern)}
+        assert engine.classify('', title) == expected, title
+
+
+def test_classify_record():
+    # exe rules match the executable short name printed by log_focused_window.
+    engine = RuleEngine([
+        Rule('browser', r'Mozilla Firefox\firefox.exe', kind='exact', field='exe'),
+        Rule('system', 'Windows\\*', field='exe'),
+        Rule('bare', 'firefox.exe', kind='exact', field='exe'),
+    ])
+    record = EventRecord(0, HookEvent.SYSTEM_FOREGROUND, 1, 0, 0, 1, 1,
+                         r'C:\Program Files\Mozilla Firefox\firefox.exe', 'JIRA-1')
+    assert engine.classify_record(record) == {'browser'}
+    assert engine.classify_record(record._replace(exe_path=r'C:\Windows\notepad.exe')) == {'system'}
+    assert engine.classify_record(record._replace(exe_path='')) == frozenset()
+
+
+def test_classify_is_memoized(engine):
+    engine.classify('firefox.exe', 'a')
+    engine.classify('firefox.exe', 'a')
+    assert engine.cache_info().hits == 1
+
+
+def test_combined_regex_fallback():
+    engine = RuleEngine([Rule('a', '(?P<x>a)', kind='regex'), Rule('a', '(?P<x>b)', kind='regex')])
+    assert engine.classify('', 'b') == {'a'}
+
+
+def test_invalid_rules(engine):
+    with pytest.raises(ValueError, match='invalid rule kind'):
+        RuleEngine([Rule('a', 'b', kind='fuzzy')])
+    with pytest.raises(ValueError, match='invalid rule field'):
+        RuleEngine([Rule('a', 'b', field='class')])
+    with pytest.raises(re.error):
+        engine.reload([Rule('a', '(', kind='regex')])
+    # Current rules are kept on error
+    assert engine.classify('firefox.exe', '') == {'browser'}
+
+
+def test_reload(engine):
+    assert engine.classify('firefox.exe', '') == {'browser'}
+    engine.reload([Rule('fox', 'fire*', field='exe')])
+    assert engine.rule_count == 1
+    assert engine.classify('firefox.exe', '') == {'fox'}
+
+
+def test_reload_while_classifying(engine):
+    stop = threading.Event()
+    errors = []
+
+    def classify_loop():
+        while not stop.is_set():
+            if engine.classify('firefox.exe', 'x') not in ({'browser'}, {'fox'}):
+                errors.append('unexpected result')
+
+    thread = threading.Thread(target=classify_loop)
+    thread.start()
+    for _ in range(50):
+        engine.reload([Rule('fox', 'fire*', field='exe')])
+        engine.reload(RULES)
+    stop.set()
+    thread.join()
+    assert errors == []
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps([{'category': 'browser', 'pattern': 'firefox.exe', 'field': 'exe'}]))
+    assert load_rules(str(path)) == [Rule('browser', 'firefox.exe', field='exe')]
@@ -0,0 +1,120 @@
+import pytest
+from win32_window_monitor import timestamps
+from win32_window_monitor.timestamps import ClockAnchor, TickNormalizer, anchors_to_wall_time, extend_ticks, tick_delta
+
+WALL_TIME_MS = 1_700_000_000_000
+USE_NUMPY = [False, pytest.param(True, marks=pytest.mark.skipif(timestamps.numpy is None, reason='requires numpy'))]
+
+
+class FakeClocks:
+    """Tick count, monotonic and wall clocks, advanced together by advance()."""
+
+    def __init__(self, tick_ms: int):
+        self.tick_ms = tick_ms
+        self.monotonic_ms = 5_000.0
+        self.wall_time_ms = WALL_TIME_MS
+
+    def advance(self, elapsed_ms: int, wall_drift_ms: int = 0):
+        self.tick_ms += elapsed_ms
+        self.monotonic_ms += elapsed_ms
+        self.wall_time_ms += elapsed_ms + wall_drift_ms
+
+    def normalizer(self, **kwargs) -> TickNormalizer:
+        return TickNormalizer(tick_clock=lambda: self.tick_ms % 2 ** 32,
+                              monotonic_clock=lambda: self.monotonic_ms / 1000,
+                              wall_clock=lambda: self.wall_time_ms / 1000, **kwargs)
+
+
+def test_tick_delta():
+    assert tick_delta(10, 5) == 5
+    assert tick_delta(5, 10) == -5
+    assert tick_delta(3, 2 ** 32 - 2) == 5
+    assert tick_delta(2 ** 32 - 2, 3) == -5
+    assert tick_delta(3, 5 * 2 ** 32 - 2) == 5
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_extend_ticks(use_numpy):
+    ticks_ms = [2 ** 32 - 10, 2 ** 32 - 1, 0, 20]
+    assert list(extend_ticks(ticks_ms, 2 ** 32 - 5, use_numpy)) == [2 ** 32 - 10, 2 ** 32 - 1, 2 ** 32, 2 ** 32 + 20]
+    assert list(extend_ticks(ticks_ms, 3 * 2 ** 32 + 5, use_numpy)) == \
+        [3 * 2 ** 32 - 10, 3 * 2 ** 32 - 1, 3 * 2 ** 32, 3 * 2 ** 32 + 20]
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_anchors_to_wall_time_interpolates_offsets(use_numpy):
+    anchors = [ClockAnchor(1_000, 0.0, WALL_TIME_MS), ClockAnchor(2_000, 0.0, WALL_TIME_MS + 1_100)]
+    assert list(anchors_to_wall_time([0, 1_000, 1_500, 2_000, 3_000], anchors, use_numpy)) == \
+        [WALL_TIME_MS - 1_000, WALL_TIME_MS, WALL_TIME_MS + 550, WALL_TIME_MS + 1_100, WALL_TIME_MS + 2_100]
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+def test_normalizer_across_wraparound(use_numpy):
+    clocks = FakeClocks(2 ** 32 - 1_000)
+    normalizer = clocks.normalizer(use_numpy=use_numpy)
+    assert normalizer.to_wall_time(2 ** 32 - 1_500) == WALL_TIME_MS - 500
+    wall_times_ms = normalizer.to_wall_time_batch([2 ** 32 - 100, 0, 400])
+    assert list(wall_times_ms) == [WALL_TIME_MS + 900, WALL_TIME_MS + 1_000, WALL_TIME_MS + 1_400]
+    assert normalizer.extend(500) == 2 ** 32 + 500
+    assert list(normalizer.extend_batch([])) == []
+    assert len(normalizer.anchors) == 1
+
+
+def test_normalizer_resync_drift_and_long_gaps():
+    clocks = FakeClocks(1_000)
+    normalizer = clocks.normalizer(resync_interval_ms=60_000, use_numpy=False)
+    clocks.advance(30_000)
+    assert normalizer.to_wall_time(clocks.tick_ms) == WALL_TIME_MS + 30_000
+    assert len(normalizer.anchors) == 1
+
+    # The wall clock gains 60ms in a minute: the next conversion resynchronizes, and the correction is
+    # spread over the next minute.
+    clocks.advance(60_000, wall_drift_ms=60)
+    assert normalizer.to_wall_time(clocks.tick_ms) == WALL_TIME_MS + 90_000
+    assert normalizer.drift_ms == 60
+    assert len(normalizer.anchors) == 2
+    assert normalizer.to_wall_time(clocks.tick_ms + 30_000) == WALL_TIME_MS + 120_030
+    assert normalizer.to_wall_time(clocks.tick_ms + 59_000) == WALL_TIME_MS + 149_059
+    # Events before the resync keep the offset they were converted with.
+    assert normalizer.to_wall_time(1_000 + 45_000) == WALL_TIME_MS + 45_000
+
+    # No event for 60 days, more than the 49.7 days of a wraparound
+    gap_ms = 60 * 24 * 3600 * 1000
+    clocks.advance(gap_ms)
+    assert normalizer.maybe_resync()
+    assert normalizer.anchors[-1].tick_ms == 1_000 + 90_000 + gap_ms
+    assert normalizer.to_wall_time(clocks.tick_ms % 2 ** 32) == WALL_TIME_MS + 90_060 + gap_ms
+    assert not normalizer.maybe_resync()
+
+
+@pytest.mark.parametrize('use_numpy', USE_NUMPY)
+@pytest.mark.parametrize('resync_interval_ms', [1_000, 60_000])
+def test_normalizer_never_goes_backwards(use_numpy, resync_interval_ms):
+    clocks = FakeClocks(2 ** 32 - 30_000)
+    normalizer = clocks.normalizer(resync_interval_ms=resync_interval_ms, use_numpy=use_numpy)
+    wall_times_ms = []
+    for second in range(200):
+        # The wall clock is 5% slow, and is set back by 2 seconds after 10 seconds.
+        clocks.advance(1_000, wall_drift_ms=-50 - (2_000 if second == 10 else 0))
+        wall_times_ms.extend(normalizer.to_wall_time_batch([(clocks.tick_ms - 500) % 2 ** 32,
+                                                            clocks.tick_ms % 2 ** 32]))
+    assert all(later > earlier for earlier, later in zip(wall_times_ms, wall_times_ms[1:]))
+    # The live offset converged to the wall clock.
+    normalizer.resync()
+    assert abs(normalizer.drift_ms) <= resync_interval_ms * 0.05 + 1
+    assert abs(normalizer.to_wall_time(clocks.tick_ms % 2 ** 32) - clocks.wall_time_ms) <= resync_interval_ms * 0.05 + 1
+
+
+def test_normalizer_max_anchors():
+    clocks = FakeClocks(1_000)
+    normalizer = clocks.normalizer(max_anchors=3)
+    for _ in range(5):
+        clocks.advance(1_000)
+        normalizer.resync()
+    assert [anchor.tick_ms for anchor in normalizer.anchors] == [4_000, 5_000, 6_000]
+
+
+def test_from_tick_never_resyncs():
+    normalizer = TickNormalizer.from_tick(2 ** 32 - 10, WALL_TIME_MS, monotonic_clock=lambda: 1e9)
+    assert not normalizer.maybe_resync()
+    assert normalizer.to_wall_time(10) == WALL_TIME_MS + 20
@@ -0,0 +1,139 @@
+import gzip
+
+import pytest
+from win32_window_monitor.enrichment import EventBatcher, enrich_batch
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.warm_cache import CacheStats, ProcessEntry, WarmStartCache, WindowEntry
+from win32_window_monitor.win32api import get_process_creation_time
+
+NOTEPAD = r'C:\Windows\notepad.exe'
+CODE = r'C:\Program Files\Code\Code.exe'
+
+
+class Clock:
+    def __init__(self):
+        self.seconds = 1000.0
+
+    def __call__(self):
+        return self.seconds
+
+
+@pytest.fixture
+def desktop(fake_desktop):
+    fake_desktop.add_process(100, NOTEPAD, creation_time=133_000_000_000_000_001)
+    fake_desktop.add_window(0x10, 100, 1000, 'Untitled - Notepad')
+    fake_desktop.add_process(200, CODE, creation_time=133_000_000_000_000_002)
+    fake_desktop.add_window(0x20, 200, 2000, 'a.txt - Code')
+    return fake_desktop
+
+
+def raw_event(hwnd, thread_id, event_id=HookEvent.OBJECT_SHOW, id_object=ObjectId.WINDOW):
+    return 0x100, event_id, hwnd, id_object, 0, thread_id, 5000
+
+
+def test_get_process_creation_time(desktop):
+    assert get_process_creation_time(100) == 133_000_000_000_000_001
+    assert get_process_creation_time(999, log_error=False) is None
+    assert desktop.open_handle_count == 0
+
+
+def test_lookups_hit_after_first_miss(desktop):
+    clock = Clock()
+    cache = WarmStartCache(clock=clock, cache_titles=True)
+    for _ in range(2):
+        assert cache.hwnd_process_id(1000, 0x10) == 100
+        assert cache.process_filename(100) == NOTEPAD
+        assert cache.window_title(0x10) == 'Untitled - Notepad'
+    assert cache.stats == CacheStats(1, 1, 1, 1, 1, 1, 0)
+
+    desktop.set_title(0x10, 'notes.txt - Notepad')
+    cache.observe_event(HookEvent.OBJECT_NAMECHANGE, 0x10, ObjectId.WINDOW, 0)
+    assert cache.window_title(0x10) == 'notes.txt - Notepad'
+    assert cache.stats.title_misses == 2
+
+    # Revalidation after revalidate_interval_ms: the process id was reused by another process.
+    clock.seconds += 61
+    desktop.add_process(100, CODE, creation_time=133_000_000_000_000_003)
+    assert cache.process_filename(100) == CODE
+    assert cache.stats.revalidations == 1
+    assert cache.stats.filename_misses == 2
+
+
+def test_titles_not_cached_by_default(desktop):
+    cache = WarmStartCache()
+    cache.hwnd_process_id(1000, 0x10)
+    cache.process_filename(100)
+    cache.window_title(0x10)
+    desktop.set_title(0x10, 'notes.txt - Notepad')
+    assert cache.window_title(0x10) == 'notes.txt - Notepad'
+    assert cache.stats.title_hits == 0
+
+
+def test_snapshot_warm_start(desktop, tmp_path):
+    path = str(tmp_path / 'cache.json.gz')
+    desktop.add_window(0x11, 100, 1000, 'b.txt - Notepad')
+    with WarmStartCache(path, cache_titles=True) as cache:
+        records, _ = enrich_batch([raw_event(0x10, 1000), raw_event(0x11, 1000), raw_event(0x20, 2000)], cache=cache)
+        assert [record.exe_path for record in records] == [NOTEPAD, NOTEPAD, CODE]
+
+    # While the collector is stopped, window 0x11 is renamed, process 200 exits and its id is reused, and
+    # the handle of window 0x10 is reused by a window of the new process.
+    desktop.set_title(0x11, 'notes.txt - Notepad')
+    desktop.remove_process(200)
+    desktop.remove_window(0x20)
+    desktop.add_process(200, NOTEPAD, creation_time=133_000_000_000_000_004)
+    desktop.remove_window(0x10)
+    desktop.add_window(0x10, 200, 3000, 'Untitled - Notepad')
+
+    cache = WarmStartCache(path, cache_titles=True)
+    assert sorted(cache._processes.values()) == [
+        ProcessEntry(100, 133_000_000_000_000_001, NOTEPAD), ProcessEntry(200, 133_000_000_000_000_002, CODE)]
+    assert sorted(cache._windows.values()) == [WindowEntry(0x10, 100), WindowEntry(0x11, 100), WindowEntry(0x20, 200)]
+    desktop.call_counts.clear()
+    events = [raw_event(0x10, 3000), raw_event(0x11, 1000)]
+    records, _ = enrich_batch(events, cache=cache)
+    assert [(record.process_id, record.exe_path, record.title) for record in records] == [
+        (200, NOTEPAD, 'Untitled - Notepad'), (100, NOTEPAD, 'notes.txt - Notepad')]
+    # Windows were revalidated with GetWindowThreadProcessId, and process 100 with GetProcessTimes: only the
+    # reused window handle and process id, and the titles, were looked up again.
+    assert cache.stats == CacheStats(process_id_hits=1, process_id_misses=1, filename_hits=1, filename_misses=1,
+                                     title_hits=0, title_misses=2, revalidations=4)
+    assert desktop.call_counts['OpenThread'] == 1
+    assert desktop.call_counts['QueryFullProcessImageNameW'] == 1
+
+    stats = cache.stats
+    enrich_batch(events, cache=cache)
+    assert cache.stats - stats == CacheStats(process_id_hits=2, filename_hits=2, title_hits=2)
+
+
+def test_destroy_events_drop_windows(desktop):
+    cache = WarmStartCache()
+    batcher = EventBatcher(cache=cache)
+    batcher.on_event(*raw_event(0x10, 1000))
+    batcher.on_event(*raw_event(0x10, 1000, HookEvent.OBJECT_DESTROY))
+    assert [record.process_id for record in batcher.drain()] == [100, 100]
+    assert 0x10 not in cache._windows
+    assert len(cache) == 1
+
+
+def test_save_prunes_unused_processes(desktop, tmp_path):
+    clock = Clock()
+    cache = WarmStartCache(str(tmp_path / 'cache.json.gz'), save_interval_ms=1000, prune_after_ms=10_000, clock=clock)
+    enrich_batch([raw_event(0x10, 1000), raw_event(0x20, 2000)], cache=cache)
+    assert not cache.maybe_save()
+    clock.seconds += 5
+    cache.process_filename(100)
+    assert cache.maybe_save()
+    clock.seconds += 6
+    cache.save()
+    assert len(cache) == 2  # process 100 and its window
+    assert len(WarmStartCache(cache.path)) == 2
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path, caplog):
+    path = tmp_path / 'cache.json.gz'
+    with gzip.open(str(path), 'wt') as snapshot_file:
+        snapshot_file.write('{"version": 99}')
+    cache = WarmStartCache(str(path))
+    assert len(cache) == 0
+    assert 'unsupported snapshot version' in caplog.text
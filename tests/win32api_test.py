@@ -0,0 +1,139 @@
+import pytest
+from win32_window_monitor.ids import HookEvent, ObjectId
+from win32_window_monitor.win32api import (
+    MessagePump, get_hwnd_process_id, get_process_filename, get_tick_count, get_window_process_id, get_window_title,
+    post_quit_message, run_message_loop, set_win_event_hook,
+)
+
+# Tests of the win32api wrappers against the simulated desktop of tests/fake_win32.py.
+
+
+@pytest.fixture
+def desktop(fake_desktop):
+    fake_desktop.add_process(100, r'C:\Windows\notepad.exe')
+    fake_desktop.add_window(0x10, 100, 1000, 'Untitled - Notepad')
+    return fake_desktop
+
+
+def test_get_process_filename(desktop):
+    assert get_process_filename(100) == r'C:\Windows\notepad.exe'
+    assert get_process_filename(999, log_error=False) is None
+    assert desktop.open_handle_count == 0
+
+
+def test_get_hwnd_process_id(desktop):
+    assert get_hwnd_process_id(1000, 0x10) == 100
+    assert get_hwnd_process_id(0, 0x10, log_error=False) == 100
+    assert get_hwnd_process_id(1000, None) == 100
+    assert get_hwnd_process_id(0, None) is None
+    assert get_hwnd_process_id(5, 0x99, log_error=False) is None
+
+
+def test_get_window_process_id(desktop):
+    assert get_window_process_id(0x10) == 100
+    assert get_window_process_id(0x99, log_error=False) is None
+    assert desktop.call_counts['OpenThread'] == 0
+    assert desktop.open_handle_count == 0
+
+
+def test_get_window_title(desktop):
+    assert get_window_title(0x10) == 'Untitled - Notepad'
+    assert get_window_title(0x99) == ''
+
+
+def test_get_tick_count(desktop):
+    desktop.tick_ms = 2 ** 32 + 5
+    assert get_tick_count() == 5
+
+
+def test_set_win_event_hook(desktop):
+    events = []
+
+    def on_event(win_event_hook_handle, event_id, hwnd, id_object, id_child, event_thread_id, event_time_ms):
+        events.append((HookEvent(event_id), hwnd, ObjectId(id_object), event_thread_id, event_time_ms))
+
+    event_hook_handle = set_win_event_hook(on_event, HookEvent.SYSTEM_FOREGROUND)
+    desktop.post_event(HookEvent.SYSTEM_FOREGROUND, 0x10, event_time_ms=1234)
+    desktop.post_event(HookEvent.OBJECT_SHOW, 0x10)
+    post_quit_message()
+    desktop.post_event(HookEvent.SYSTEM_FOREGROUND, 0x10)
+    run_message_loop()
+    assert events == [(HookEvent.SYSTEM_FOREGROUND, 0x10, ObjectId.WINDOW, 1000, 1234)]
+    assert len(desktop.messages) == 1
+
+    event_hook_handle.unhook()
+    assert desktop.hooks == {}
+    run_message_loop()
+    assert len(events) == 1
+
+
+def test_set_win_event_hook_requires_callable(desktop):
+    with pytest.raises(ValueError, match='must be a callable'):
+        set_win_event_hook(None, HookEvent.SYSTEM_FOREGROUND)
+
+
+def test_message_pump_drains_in_batches(desktop):
+    events = []
+    batches = []
+    pump = MessagePump(on_batch=lambda: batches.append(len(events)))
+    event_hook_handle = set_win_event_hook(lambda *args: events.append(args[1]), HookEvent.OBJECT_SHOW)
+    for _ in range(3):
+        desktop.post_event(HookEvent.OBJECT_SHOW, 0x10)
+    desktop.post_message(0x0400)  # WM_USER
+    desktop.post_event(HookEvent.OBJECT_SHOW, 0x10)
+    post_quit_message(3)
+    assert pump.run() == 3
+    assert events == [HookEvent.OBJECT_SHOW] * 4
+    assert batches == [4]
+    assert pump.wakeups == 0
+    event_hook_handle.unhook()
+
+
+def test_message_pump_max_messages(desktop):
+    batches = []
+    pump = MessagePump(on_batch=lambda: batches.append(len(desktop.messages)), max_messages=2)
+    for message in range(5):
+        desktop.post_message(0x0400 + message)
+    assert pump.run() == 0
+    assert batches == [3, 1, 0, 0]
+
+
+def test_message_pump_handles(desktop):
+    calls = []
+    event_handle = desktop.create_event()
+    pump = MessagePump(on_batch=lambda: calls.append('batch'))
+
+    def on_signaled():
+        calls.append('signaled')
+        desktop.post_event(HookEvent.OBJECT_SHOW, 0x10)
+        post_quit_message()
+
+    pump.add_handle(event_handle, on_signaled)
+    desktop.set_event(event_handle)
+    assert pump.run() == 0
+    assert calls == ['batch', 'signaled', 'batch']
+    assert desktop.events[event_handle] is False
+
+    pump.remove_handle(event_handle)
+    assert pump.run() == 0
+    pump.add_handle(0x9999, lambda: None)  # not a valid handle
+    with pytest.raises(OSError):
+        pump.run()
+
+
+def test_message_pump_timers(desktop):
+    calls = []
+    desktop.tick_ms = 2 ** 32 - 1500  # GetTickCount wraps around during the test
+    pump = MessagePump()
+    pump.call_every(1000, lambda: calls.append(('every', desktop.tick_ms % 2 ** 32)))
+    once = pump.call_later(2500, lambda: calls.append(('once', desktop.tick_ms % 2 ** 32)))
+    cancelled = pump.call_later(500, lambda: calls.append('cancelled'))
+    pump.cancel_timer(cancelled)
+    pump.call_later(3500, post_quit_message)
+    assert pump.run() == 0
+    assert calls == [('every', 2 ** 32 - 500), ('every', 500), ('once', 1000), ('every', 1500)]
+    assert once not in pump._timers
+    assert pump.wakeups == 5
+
+    with pytest.raises(ValueError):
+        pump.call_every(0, lambda: None)
@@ -0,0 +1,116 @@
+import pytest
+from win32_window_monitor.ids import HookEvent
+from win32_window_monitor.records import EventRecord
+from win32_window_monitor.windowing import HyperLogLog, WindowedAggregator, WindowResult
+
+
+def event(event_time_ms, event_id=HookEvent.OBJECT_SHOW, hwnd=1):
+    return EventRecord(event_time_ms, int(event_id), hwnd, 0, 0, 1)
+
+
+# HyperLogLog
+# ###################################################################
+
+@pytest.mark.parametrize('count', [0, 1, 10, 1000, 50_000])
+def test_hyperloglog_estimate(count):
+    sketch = HyperLogLog(12)
+    for value in range(count):
+        sketch.add(value)
+        sketch.add(value)
+    assert abs(sketch.estimate() - count) <= max(1, count * 0.05)
+
+
+def test_hyperloglog_merge():
+    first, second = HyperLogLog(), HyperLogLog()
+    for value in range(500):
+        first.add(value)
+        second.add(value + 250)
+    first.merge(second)
+    assert abs(first.estimate() - 750) <= 750 * 0.1
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(8))
+
+
+def test_hyperloglog_invalid_precision():
+    with pytest.raises(ValueError, match='precision must be between 4 and 16'):
+        HyperLogLog(3)
+
+
+# WindowedAggregator
+# ###################################################################
+
+def test_tumbling_counts_per_key():
+    windows = []
+    aggregator = WindowedAggregator(1000, windows.append, key=lambda record: record.event_id)
+    for event_time_ms in (100, 200, 900):
+        aggregator.add(event(event_time_ms))
+    aggregator.add(event(1500, HookEvent.SYSTEM_FOREGROUND))
+    assert windows == [WindowResult(0, 1000, {HookEvent.OBJECT_SHOW: 3}, {})]
+    # Empty windows are skipped
+    aggregator.add(event(5200))
+    assert windows[1:] == [WindowResult(1000, 2000, {HookEvent.SYSTEM_FOREGROUND: 1}, {})]
+    aggregator.flush()
+    assert windows[2:] == [WindowResult(5000, 6000, {HookEvent.OBJECT_SHOW: 1}, {})]
+
+
+def test_sliding_counts():
+    windows = []
+    aggregator = WindowedAggregator(3000, windows.append, slide_ms=1000)
+    for event_time_ms in (0, 1000, 1001, 2000, 3500):
+        aggregator.add(event(event_time_ms))
+    aggregator.flush()
+    assert [(window.start_ms, window.end_ms, window.counts) for window in windows] == [
+        (-2000, 1000, {None: 1}),
+        (-1000, 2000, {None: 3}),
+        (0, 3000, {None: 4}),
+        (1000, 4000, {None: 4}),
+        (2000, 5000, {None: 2}),
+        (3000, 6000, {None: 1}),
+    ]
+
+
+def test_distinct_counts():
+    windows = []
+    aggregator = WindowedAggregator(60_000, windows.append, key=lambda record: record.event_id,
+                                    distinct=lambda record: record.hwnd)
+    for index in range(1000):
+        aggregator.add(event(index * 10, hwnd=index % 50))
+    aggregator.flush()
+    (window,) = windows
+    assert window.counts == {HookEvent.OBJECT_SHOW: 1000}
+    assert abs(window.distinct[HookEvent.OBJECT_SHOW] - 50) <= 2
+
+
+def test_late_events_are_dropped():
+    windows = []
+    aggregator = WindowedAggregator(1000, windows.append)
+    aggregator.add(event(1500))
+    aggregator.add(event(999))
+    aggregator.flush()
+    assert aggregator.late_events == 1
+    assert windows == [WindowResult(1000, 2000, {None: 1}, {})]
+
+
+def test_memory_is_bounded():
+    aggregator = WindowedAggregator(10_000, lambda window: None, slide_ms=1000, key=lambda record: record.hwnd)
+    for index in range(100_000):
+        aggregator.add(event(index * 7, hwnd=index % 1000))
+    assert len(aggregator._buckets) <= 10
+    assert len(aggregator._totals) <= 1000
+
+
+def test_invalid_window():
+    with pytest.raises(ValueError, match='multiple of slide_ms'):
+        WindowedAggregator(1000, print, slide_ms=300)
+
+
+def test_tick_wraparound():
+    windows = []
+    aggregator = WindowedAggregator(1000, windows.append)
+    start_ms = 2 ** 32 - 3296  # multiple of the window duration
+    for offset_ms in range(0, 6000, 200):
+        aggregator.add(event((start_ms + offset_ms) % 2 ** 32))
+    aggregator.flush()
+    assert aggregator.late_events == 0
+    assert [(window.start_ms - start_ms, window.counts) for window in windows] == \
+        [(offset_ms, {None: 5}) for offset_ms in range(0, 6000, 1000)]
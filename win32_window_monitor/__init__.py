@@ -6,11 +6,15 @@ from win32_window_monitor.win32api import (
     EventHookHandle,
     HWINEVENTHOOK,
     get_process_filename,
+    get_process_creation_time,
     get_hwnd_process_id,
+    get_window_process_id,
     get_window_title,
+    get_tick_count,
     set_win_event_hook,
     init_com,
     run_message_loop,
+    MessagePump,
     post_quit_message,
     post_quit_message_on_break_signal,
 )
@@ -25,11 +29,15 @@ __all__ = [
     'EventHookFuncType',
     'HWINEVENTHOOK',
     'get_process_filename',
+    'get_process_creation_time',
     'get_hwnd_process_id',
+    'get_window_process_id',
     'get_window_title',
+    'get_tick_count',
     'set_win_event_hook',
     'init_com',
     'run_message_loop',
+    'MessagePump',
     'post_quit_message',
     'post_quit_message_on_break_signal',
 ]
@@ -0,0 +1,594 @@
+"""
+Columnar compressed archive of EventRecord, for long-term retention of window activity.
+
+Events are grouped in time-bounded chunks. Each chunk stores its events column by column:
+
+- `event_time_ms` is delta-encoded,
+- event ids are dictionary-encoded and bit-packed,
+- executable paths, titles and the optional event source tags are dictionary-encoded,
+- other integer columns are stored as zigzag varints.
+
+Chunks are compressed independently. A footer index stores, for each chunk, its time range,
+a bitmap of the event ids it contains and the executables it references, so that queries can
+skip chunks without decompressing them.
+
+Keyframes (compressed JSON snapshots, see win32_window_monitor.desktop_state) can be stored between
+chunks. The footer index records the chunk that follows each keyframe.
+
+File layout::
+
+    MAGIC | chunk 0 | [keyframe] | chunk 1 | ... | footer (zlib compressed JSON) | footer offset (u64) | MAGIC
+
+Only the standard library is required (zlib, lzma). The faster `zstd` codec is used when the
+optional `zstandard` package is installed.
+"""
+
+import json
+import lzma
+import struct
+import zlib
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .records import EventRecord
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, falls back on zlib.
+    zstandard = None
+
+MAGIC = b'W32WMAR1'
+_TRAILER = struct.Struct('<Q8s')
+
+#: Codecs that can be used to compress chunks.
+CODECS = ('zlib', 'lzma', 'zstd', 'none') if zstandard is not None else ('zlib', 'lzma', 'none')
+#: Codec used when none is specified: the fastest available one.
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'zlib'
+
+
+class ArchiveError(ValueError):
+    """Raised when an archive file is invalid or uses an unsupported codec."""
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    elif codec == 'lzma':
+        return lzma.compress(data, preset=6)
+    elif codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    elif codec == 'none':
+        return data
+    raise ArchiveError(f'unsupported codec {codec!r}, available codecs: {", ".join(CODECS)}')
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    elif codec == 'lzma':
+        return lzma.decompress(data)
+    elif codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    elif codec == 'none':
+        return data
+    raise ArchiveError(f'unsupported codec {codec!r}, available codecs: {", ".join(CODECS)}')
+
+
+# Column encoding
+# ###################################################################
+
+def _encode_varints(values: Iterable[int], out: bytearray):
+    """Appends the zigzag LEB128 encoding of each value to out."""
+    append = out.append
+    for value in values:
+        value = value << 1 if value >= 0 else ((-value) << 1) - 1
+        while value >= 0x80:
+            append((value & 0x7F) | 0x80)
+            value >>= 7
+        append(value)
+
+
+def _decode_varints(data: bytes, pos: int, count: int) -> Tuple[List[int], int]:
+    """Decodes count zigzag LEB128 values from data starting at pos. Returns the values and the end position."""
+    values = []
+    append = values.append
+    for _ in range(count):
+        value = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        append(value >> 1 if not value & 1 else -((value + 1) >> 1))
+    return values, pos
+
+
+def _pack_width(dictionary_size: int) -> int:
+    """Returns the bit width used to pack indexes into a dictionary of the given size (0, 1, 2, 4, 8 or 16)."""
+    bits = (dictionary_size - 1).bit_length()
+    for width in (0, 1, 2, 4, 8, 16):
+        if bits <= width:
+            return width
+    raise ArchiveError(f'too many distinct values to bit-pack: {dictionary_size}')
+
+
+def _bit_pack(indexes: Sequence[int], width: int) -> bytes:
+    if width == 0:
+        return b''
+    if width == 16:
+        return b''.join(struct.pack('<H', index) for index in indexes)
+    per_byte = 8 // width
+    packed = bytearray((len(indexes) + per_byte - 1) // per_byte)
+    for position, index in enumerate(indexes):
+        packed[position // per_byte] |= index << (width * (position % per_byte))
+    return bytes(packed)
+
+
+def _bit_unpack(data: bytes, width: int, count: int) -> List[int]:
+    if width == 0:
+        return [0] * count
+    if width == 16:
+        return list(struct.unpack(f'<{count}H', data[:count * 2]))
+    per_byte = 8 // width
+    mask = (1 << width) - 1
+    return [(data[position // per_byte] >> (width * (position % per_byte))) & mask for position in range(count)]
+
+
+def _dictionary_encode(values: Sequence) -> Tuple[list, List[int]]:
+    """Returns the list of distinct values (in first seen order) and the index of each value in it."""
+    index_by_value = {}
+    indexes = [index_by_value.setdefault(value, len(index_by_value)) for value in values]
+    return list(index_by_value), indexes
+
+
+def _encode_strings(strings: Sequence[str], out: bytearray):
+    _encode_varints([len(strings)], out)
+    for string in strings:
+        # Window titles may contain lone surrogates.
+        encoded = string.encode('utf-8', 'surrogatepass')
+        _encode_varints([len(encoded)], out)
+        out += encoded
+
+
+def _decode_strings(data: bytes, pos: int) -> Tuple[List[str], int]:
+    (count,), pos = _decode_varints(data, pos, 1)
+    strings = []
+    for _ in range(count):
+        (length,), pos = _decode_varints(data, pos, 1)
+        strings.append(data[pos:pos + length].decode('utf-8', 'surrogatepass'))
+        pos += length
+    return strings, pos
+
+
+class ChunkColumns(NamedTuple):
+    """Decoded columns of an archive chunk.
+
+    `exe_index`, `title_index` and `source_index` are indexes into the chunk dictionaries `exe_paths`,
+    `titles` and `sources`. `sources` is `['']` if the events have no source tag.
+    """
+    event_time_ms: List[int]
+    event_id: List[int]
+    hwnd: List[int]
+    id_object: List[int]
+    id_child: List[int]
+    thread_id: List[int]
+    process_id: List[int]
+    exe_index: List[int]
+    exe_paths: List[str]
+    title_index: List[int]
+    titles: List[str]
+    source_index: List[int]
+    sources: List[str]
+
+    @property
+    def event_count(self) -> int:
+        """Number of events in the chunk."""
+        return len(self.event_time_ms)
+
+    def record(self, position: int) -> EventRecord:
+        """Returns the EventRecord at the given position in the chunk."""
+        return EventRecord(self.event_time_ms[position], self.event_id[position], self.hwnd[position],
+                           self.id_object[position], self.id_child[position], self.thread_id[position],
+                           self.process_id[position], self.exe_paths[self.exe_index[position]],
+                           self.titles[self.title_index[position]])
+
+    def records(self) -> List[EventRecord]:
+        """Returns all the records of the chunk."""
+        exe_paths = self.exe_paths
+        titles = self.titles
+        return [EventRecord(*fields[:7], exe_paths[fields[7]], titles[fields[8]])
+                for fields in zip(self.event_time_ms, self.event_id, self.hwnd, self.id_object, self.id_child,
+                                  self.thread_id, self.process_id, self.exe_index, self.title_index)]
+
+    def record_sources(self) -> List[str]:
+        """Returns the source tag of each record of the chunk."""
+        sources = self.sources
+        return [sources[index] for index in self.source_index]
+
+
+def encode_chunk(records: Sequence[EventRecord], sources: Optional[Sequence[str]] = None) -> bytes:
+    """Encodes the records in the uncompressed columnar chunk format.
+
+    :param records: records to encode.
+    :param sources: optional source tag of each record.
+    """
+    out = bytearray()
+    _encode_varints([len(records)], out)
+    if not records:
+        return bytes(out)
+    (times, event_ids, hwnds, id_objects, id_childs, thread_ids,
+     process_ids, exe_paths, titles) = zip(*records)
+
+    previous_time = 0
+    deltas = []
+    for event_time_ms in times:
+        deltas.append(event_time_ms - previous_time)
+        previous_time = event_time_ms
+    _encode_varints(deltas, out)
+
+    event_id_dictionary, event_id_indexes = _dictionary_encode(event_ids)
+    width = _pack_width(len(event_id_dictionary))
+    _encode_varints([len(event_id_dictionary), width], out)
+    _encode_varints(event_id_dictionary, out)
+    out += _bit_pack(event_id_indexes, width)
+
+    for column in (hwnds, id_objects, id_childs, thread_ids, process_ids):
+        _encode_varints(column, out)
+
+    for column in (exe_paths, titles):
+        dictionary, indexes = _dictionary_encode(column)
+        _encode_strings(dictionary, out)
+        _encode_varints(indexes, out)
+
+    if sources is not None and any(sources):
+        dictionary, indexes = _dictionary_encode(sources)
+        _encode_strings(dictionary, out)
+        _encode_varints(indexes, out)
+    else:
+        _encode_strings([], out)
+    return bytes(out)
+
+
+def decode_chunk(data: bytes) -> ChunkColumns:
+    """Decodes an uncompressed chunk created by encode_chunk()."""
+    (count,), pos = _decode_varints(data, 0, 1)
+    if not count:
+        return ChunkColumns(*([] for _ in ChunkColumns._fields))
+    deltas, pos = _decode_varints(data, pos, count)
+    times = []
+    event_time_ms = 0
+    for delta in deltas:
+        event_time_ms += delta
+        times.append(event_time_ms)
+
+    (dictionary_size, width), pos = _decode_varints(data, pos, 2)
+    event_id_dictionary, pos = _decode_varints(data, pos, dictionary_size)
+    packed_length = count * 2 if width == 16 else (count * width + 7) // 8
+    event_ids = [event_id_dictionary[index] for index in _bit_unpack(data[pos:pos + packed_length], width, count)]
+    pos += packed_length
+
+    int_columns = []
+    for _ in range(5):
+        column, pos = _decode_varints(data, pos, count)
+        int_columns.append(column)
+
+    exe_paths, pos = _decode_strings(data, pos)
+    exe_index, pos = _decode_varints(data, pos, count)
+    titles, pos = _decode_strings(data, pos)
+    title_index, pos = _decode_varints(data, pos, count)
+    sources, pos = _decode_strings(data, pos)
+    if sources:
+        source_index, pos = _decode_varints(data, pos, count)
+    else:
+        sources = ['']
+        source_index = [0] * count
+    return ChunkColumns(times, event_ids, *int_columns, exe_index, exe_paths, title_index, titles,
+                        source_index, sources)
+
+
+# Archive writer and reader
+# ###################################################################
+
+class ChunkInfo(NamedTuple):
+    """Footer index entry describing a chunk, used to skip chunks without decompressing them."""
+    index: int
+    offset: int
+    length: int
+    codec: str
+    count: int
+    t_min: int
+    t_max: int
+    #: Event ids present in the chunk.
+    event_ids: frozenset
+    #: Executable paths referenced by the chunk events.
+    exe_paths: frozenset
+
+    def matches(self, t_min: Optional[int] = None, t_max: Optional[int] = None,
+                event_ids: Optional[Iterable[int]] = None, exe_paths: Optional[Iterable[str]] = None) -> bool:
+        """Returns False if the chunk can not contain an event matching all the given criteria.
+
+        `t_min` and `t_max` are inclusive, None means no bound.
+        """
+        if t_min is not None and self.t_max < t_min:
+            return False
+        if t_max is not None and self.t_min > t_max:
+            return False
+        if event_ids is not None and self.event_ids.isdisjoint(event_ids):
+            return False
+        if exe_paths is not None and self.exe_paths.isdisjoint(exe_paths):
+            return False
+        return True
+
+
+class KeyframeInfo(NamedTuple):
+    """Footer index entry describing a keyframe."""
+    #: Index of the first chunk written after the keyframe.
+    chunk_index: int
+    #: Time of the keyframe, as given to ArchiveWriter.write_keyframe().
+    event_time_ms: int
+    offset: int
+    length: int
+    codec: str
+
+
+class ArchiveWriter:
+    """Writes EventRecord to a columnar compressed archive.
+
+    A chunk is written before it would span `chunk_ms` milliseconds or more, or hold more than `chunk_events`
+    events. The footer index is written by close(), the archive is unreadable until then.
+
+    :param file: path or binary file object open for writing.
+    :param chunk_ms: maximum time span of the events of a chunk.
+    :param chunk_events: maximum number of events of a chunk.
+    :param codec: chunk compression codec, one of CODECS. Defaults to DEFAULT_CODEC.
+    :param metadata: JSON serializable dict stored in the footer (machine name, clock anchor...).
+    """
+
+    def __init__(self, file: Union[str, BinaryIO], chunk_ms: int = 60_000, chunk_events: int = 65536,
+                 codec: Optional[str] = None, metadata: Optional[dict] = None):
+        codec = codec or DEFAULT_CODEC
+        if codec not in CODECS:
+            raise ArchiveError(f'unsupported codec {codec!r}, available codecs: {", ".join(CODECS)}')
+        if isinstance(file, str):
+            self._file = open(file, 'wb')
+            self._owns_file = True
+        else:
+            self._file = file
+            self._owns_file = False
+        self.chunk_ms = chunk_ms
+        self.chunk_events = chunk_events
+        self.codec = codec
+        self.metadata = dict(metadata or {})
+        self._pending: List[EventRecord] = []
+        self._pending_sources: List[str] = []
+        self._pending_t_min = 0
+        self._pending_t_max = 0
+        self._chunks: List[ChunkInfo] = []
+        self._keyframes: List[KeyframeInfo] = []
+        self._event_ids: Dict[int, int] = {}  # event id => bit in the chunk event ids bitmap
+        self._exe_paths: Dict[str, int] = {}  # exe path => index in the footer exe paths table
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def chunk_count(self) -> int:
+        """Number of chunks written so far."""
+        return len(self._chunks)
+
+    def write(self, record: EventRecord, source: str = ''):
+        """Adds a record to the current chunk, writing the chunk first if the record does not fit in it.
+
+        :param record: record to write.
+        :param source: optional tag identifying the origin of the record (machine name...).
+        """
+        event_time_ms = record[0]
+        if self._pending:
+            t_min = min(self._pending_t_min, event_time_ms)
+            t_max = max(self._pending_t_max, event_time_ms)
+            if t_max - t_min >= self.chunk_ms or len(self._pending) >= self.chunk_events:
+                self.flush()
+                t_min = t_max = event_time_ms
+        else:
+            t_min = t_max = event_time_ms
+        self._pending.append(record)
+        self._pending_sources.append(source)
+        self._pending_t_min = t_min
+        self._pending_t_max = t_max
+
+    def write_many(self, records: Iterable[EventRecord]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Writes the current chunk, if any."""
+        records = self._pending
+        if not records:
+            return
+        sources = self._pending_sources
+        self._pending = []
+        self._pending_sources = []
+        data = _compress(self.codec, encode_chunk(records, sources))
+        self._file.write(data)
+        event_ids = frozenset(record[1] for record in records)
+        exe_paths = frozenset(record[7] for record in records)
+        for event_id in event_ids:
+            self._event_ids.setdefault(event_id, len(self._event_ids))
+        for exe_path in exe_paths:
+            self._exe_paths.setdefault(exe_path, len(self._exe_paths))
+        self._chunks.append(ChunkInfo(len(self._chunks), self._offset, len(data), self.codec, len(records),
+                                      self._pending_t_min, self._pending_t_max, event_ids, exe_paths))
+        self._offset += len(data)
+
+    def write_keyframe(self, event_time_ms: int, keyframe: dict):
+        """Writes the pending chunk, then the given JSON serializable keyframe.
+
+        The keyframe describes the state resulting from all the events written so far.
+        """
+        self.flush()
+        data = _compress(self.codec, json.dumps(keyframe, separators=(',', ':')).encode('utf-8'))
+        self._file.write(data)
+        self._keyframes.append(KeyframeInfo(len(self._chunks), event_time_ms, self._offset, len(data), self.codec))
+        self._offset += len(data)
+
+    def _footer(self) -> dict:
+        chunks = []
+        for chunk in self._chunks:
+            bitmap = 0
+            for event_id in chunk.event_ids:
+                bitmap |= 1 << self._event_ids[event_id]
+            chunks.append({
+                'offset': chunk.offset, 'length': chunk.length, 'codec': chunk.codec, 'count': chunk.count,
+                't_min': chunk.t_min, 't_max': chunk.t_max, 'event_ids': bitmap,
+                'exe_paths': sorted(self._exe_paths[exe_path] for exe_path in chunk.exe_paths),
+            })
+        return {
+            'version': 1,
+            'metadata': self.metadata,
+            'event_ids': list(self._event_ids),
+            'exe_paths': list(self._exe_paths),
+            'chunks': chunks,
+            'keyframes': [keyframe._asdict() for keyframe in self._keyframes],
+        }
+
+    def close(self):
+        """Writes the pending chunk and the footer index, then closes the file if it was opened by the writer."""
+        if self._file is None:
+            return
+        self.flush()
+        footer = zlib.compress(json.dumps(self._footer(), separators=(',', ':')).encode('utf-8'))
+        self._file.write(footer)
+        self._file.write(_TRAILER.pack(self._offset, MAGIC))
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+        self._file = None
+
+
+class ArchiveReader:
+    """Reads an archive created by ArchiveWriter.
+
+    The footer index is loaded on open; chunks are only read and decompressed on demand.
+
+    :param path: path of the archive file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._load_footer()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _load_footer(self):
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ArchiveError(f'{self.path}: not an archive file (bad magic)')
+        self._file.seek(-_TRAILER.size, 2)
+        trailer_offset = self._file.tell()
+        footer_offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+        if magic != MAGIC:
+            raise ArchiveError(f'{self.path}: truncated archive file (missing footer)')
+        self._file.seek(footer_offset)
+        footer = json.loads(zlib.decompress(self._file.read(trailer_offset - footer_offset)))
+        self.footer = footer
+        #: Metadata dict given to ArchiveWriter.
+        self.metadata: dict = footer['metadata']
+        event_ids = footer['event_ids']
+        exe_paths = footer['exe_paths']
+        self.chunks: List[ChunkInfo] = []
+        for index, chunk in enumerate(footer['chunks']):
+            bitmap = chunk['event_ids']
+            chunk_event_ids = frozenset(event_id for bit, event_id in enumerate(event_ids) if bitmap >> bit & 1)
+            chunk_exe_paths = frozenset(exe_paths[exe_index] for exe_index in chunk['exe_paths'])
+            self.chunks.append(ChunkInfo(index, chunk['offset'], chunk['length'], chunk['codec'], chunk['count'],
+                                         chunk['t_min'], chunk['t_max'], chunk_event_ids, chunk_exe_paths))
+        self.keyframes: List[KeyframeInfo] = [KeyframeInfo(**keyframe) for keyframe in footer.get('keyframes', [])]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        """Returns the number of events in the archive."""
+        return sum(chunk.count for chunk in self.chunks)
+
+    def __iter__(self) -> Iterator[EventRecord]:
+        return self.records()
+
+    def select_chunks(self, t_min: Optional[int] = None, t_max: Optional[int] = None,
+                      event_ids: Optional[Iterable[int]] = None,
+                      exe_paths: Optional[Iterable[str]] = None) -> List[ChunkInfo]:
+        """Returns the chunks that may contain events matching all the criteria, using only the footer index.
+
+        See ChunkInfo.matches() for the meaning of the parameters.
+        """
+        if event_ids is not None:
+            event_ids = frozenset(int(event_id) for event_id in event_ids)
+        if exe_paths is not None:
+            exe_paths = frozenset(exe_paths)
+        return [chunk for chunk in self.chunks if chunk.matches(t_min, t_max, event_ids, exe_paths)]
+
+    def read_columns(self, chunk: ChunkInfo) -> ChunkColumns:
+        """Reads and decodes the columns of the given chunk."""
+        self._file.seek(chunk.offset)
+        return decode_chunk(_decompress(chunk.codec, self._file.read(chunk.length)))
+
+    def read_keyframe(self, keyframe: KeyframeInfo) -> dict:
+        """Reads the given keyframe."""
+        self._file.seek(keyframe.offset)
+        return json.loads(_decompress(keyframe.codec, self._file.read(keyframe.length)))
+
+    def records(self, t_min: Optional[int] = None, t_max: Optional[int] = None,
+                event_ids: Optional[Iterable[int]] = None,
+                exe_paths: Optional[Iterable[str]] = None) -> Iterator[EventRecord]:
+        """Yields the records matching all the given criteria, in archive order.
+
+        Chunks that can not contain matching records are skipped without being read.
+        """
+        if event_ids is not None:
+            event_ids = frozenset(int(event_id) for event_id in event_ids)
+        if exe_paths is not None:
+            exe_paths = frozenset(exe_paths)
+        for chunk in self.select_chunks(t_min, t_max, event_ids, exe_paths):
+            for record in self.read_columns(chunk).records():
+                if t_min is not None and record.event_time_ms < t_min:
+                    continue
+                if t_max is not None and record.event_time_ms > t_max:
+                    continue
+                if event_ids is not None and record.event_id not in event_ids:
+                    continue
+                if exe_paths is not None and record.exe_path not in exe_paths:
+                    continue
+                yield record
+
+    def tagged_records(self) -> Iterator[Tuple[str, EventRecord]]:
+        """Yields (source tag, record) for each record of the archive, in archive order."""
+        for chunk in self.chunks:
+            columns = self.read_columns(chunk)
+            yield from zip(columns.record_sources(), columns.records())
+
+
+def read_chunk_columns(path: str, chunk: ChunkInfo) -> ChunkColumns:
+    """Reads the columns of a chunk of the archive at path.
+
+    Unlike ArchiveReader.read_columns(), this function can be used in worker processes as
+    its parameters are picklable.
+    """
+    with open(path, 'rb') as file:
+        file.seek(chunk.offset)
+        return decode_chunk(_decompress(chunk.codec, file.read(chunk.length)))
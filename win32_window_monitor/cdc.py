@@ -0,0 +1,138 @@
+"""
+Change data capture: stream of per-window state deltas derived from events.
+
+Hook events often repeat an unchanged state (the same window shown again, a title "changed" to the same
+value, the foreground window activated twice...). ChangeDataCapture tracks the state of the top-level
+windows and of the foreground window with a DesktopState (see win32_window_monitor.desktop_state), and
+emits a Delta only when a field actually changes:
+
+- WINDOW: a window was first seen, or its title, process id, executable path, visibility (OBJECT_SHOW,
+  OBJECT_HIDE) or cloaking (OBJECT_CLOAKED, OBJECT_UNCLOAKED) changed.
+- DESTROYED: a window was destroyed.
+- FOREGROUND: the foreground window, or its title, changed.
+
+Every `resync_interval_ms`, a Resync message with the full state is emitted, so that consumers joining
+the stream late can catch up. snapshot() returns one on demand.
+
+Example::
+
+    cdc = ChangeDataCapture(on_message=print)
+    for record in batcher.drain():
+        cdc.apply(record)
+    # Delta(event_time_ms=..., kind='foreground', hwnd=1234, changes={'hwnd': (5678, 1234),
+    #       'exe_path': ('C:\\...\\Code.exe', 'C:\\...\\firefox.exe'), 'title': (...)})
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+from .desktop_state import DesktopState, WindowState
+from .records import EventRecord
+from .timestamps import tick_delta
+
+WINDOW = 'window'
+DESTROYED = 'destroyed'
+FOREGROUND = 'foreground'
+
+
+class ForegroundSlot(NamedTuple):
+    """Last known foreground window. hwnd is 0 if unknown or destroyed."""
+    hwnd: int = 0
+    process_id: int = 0
+    exe_path: str = ''
+    title: str = ''
+
+
+class Delta(NamedTuple):
+    """Change of the state of a window or of the foreground slot."""
+    event_time_ms: int
+    #: WINDOW, DESTROYED or FOREGROUND.
+    kind: str
+    #: Window handle. For FOREGROUND, the handle of the new foreground window.
+    hwnd: int
+    #: Changed fields: name => (old value, new value). Old values are None for a window seen for the first
+    #: time. Empty for DESTROYED.
+    changes: Dict[str, Tuple[Any, Any]]
+
+
+class Resync(NamedTuple):
+    """Full state, periodically emitted so that late consumers can catch up."""
+    event_time_ms: int
+    windows: Dict[int, WindowState]
+    foreground: ForegroundSlot
+
+
+def _changes(old: Optional[NamedTuple], new: NamedTuple) -> Dict[str, Tuple[Any, Any]]:
+    if old is None:
+        return {field: (None, value) for field, value in zip(new._fields[1:], new[1:])}
+    return {field: (old_value, value) for field, old_value, value in zip(new._fields[1:], old[1:], new[1:])
+            if old_value != value}
+
+
+class ChangeDataCapture:
+    """Converts a stream of enriched events into deltas of the window states, tracked by a DesktopState.
+
+    :param on_message: called with each Delta and Resync.
+    :param resync_interval_ms: minimum event time between two Resync messages, None to disable them.
+    """
+
+    def __init__(self, on_message: Callable[[Union[Delta, Resync]], None],
+                 resync_interval_ms: Optional[int] = 60_000):
+        self.on_message = on_message
+        self.resync_interval_ms = resync_interval_ms
+        self.state = DesktopState()
+        #: Number of applied events and of emitted deltas.
+        self.events = 0
+        self.deltas = 0
+        self._last_resync_ms: Optional[int] = None
+
+    @property
+    def windows(self) -> Dict[int, WindowState]:
+        """Tracked top-level windows by hwnd."""
+        return self.state.windows
+
+    @property
+    def foreground(self) -> ForegroundSlot:
+        window = self.state.foreground
+        return ForegroundSlot() if window is None else ForegroundSlot(*window[:len(ForegroundSlot._fields)])
+
+    @property
+    def reduction_ratio(self) -> float:
+        """Number of applied events divided by the number of emitted deltas."""
+        return self.events / self.deltas if self.deltas else float(self.events)
+
+    def snapshot(self, event_time_ms: int) -> Resync:
+        """Returns the full state."""
+        return Resync(event_time_ms, dict(self.windows), self.foreground)
+
+    def apply(self, record: EventRecord):
+        """Updates the state with an enriched event, emitting deltas for the fields that changed.
+
+        A Resync message is emitted first if resync_interval_ms elapsed since the last one.
+        """
+        self.events += 1
+        event_time_ms = record.event_time_ms
+        if self.resync_interval_ms is not None:
+            if self._last_resync_ms is None:
+                self._last_resync_ms = event_time_ms
+            elif tick_delta(event_time_ms, self._last_resync_ms) >= self.resync_interval_ms:
+                self.on_message(self.snapshot(event_time_ms))
+                self._last_resync_ms = event_time_ms
+
+        hwnd = record.hwnd
+        old = self.windows.get(hwnd)
+        old_foreground = self.foreground
+        self.state.apply(record)
+        window = self.windows.get(hwnd)
+        if window is None and old is not None:
+            self._emit(Delta(event_time_ms, DESTROYED, hwnd, {}))
+        elif window != old:
+            self._emit(Delta(event_time_ms, WINDOW, hwnd, _changes(old, window)))
+        foreground = self.foreground
+        if foreground != old_foreground:
+            changes = {field: (old_value, value) for field, old_value, value
+                       in zip(ForegroundSlot._fields, old_foreground, foreground) if old_value != value}
+            self._emit(Delta(event_time_ms, FOREGROUND, foreground.hwnd, changes))
+
+    def _emit(self, delta: Delta):
+        self.deltas += 1
+        self.on_message(delta)
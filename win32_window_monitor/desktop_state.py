@@ -0,0 +1,192 @@
+"""
+Point-in-time reconstruction of the desktop state: open windows and foreground window.
+
+The state is derived from the events of STATE_EVENT_IDS: window creation, destruction, title, visibility
+and cloaking changes, and foreground changes. KeyframeRecorder periodically stores the full state as a keyframe in the
+archive, alongside the recorded events. state_at() reconstructs the state at a given time by loading
+the nearest preceding keyframe and applying only the events recorded after it, so reconstruction time
+is bounded by the keyframe interval rather than by the length of the capture.
+
+Keyframe times and state_at() times are extended tick counts: the first recorded event_time_ms plus the
+ticks elapsed since, so they keep increasing after GetTickCount wraps around (see
+win32_window_monitor.timestamps). They are equal to event_time_ms until the first wraparound.
+"""
+
+import bisect
+from typing import Dict, NamedTuple, Optional
+
+from .archive import ArchiveReader, ArchiveWriter
+from .ids import HookEvent
+from .records import FOREGROUND_EVENT_IDS, EventRecord, is_window_object
+from .timestamps import tick_delta
+
+#: Events that change the desktop state.
+STATE_EVENT_IDS = frozenset(int(event_id) for event_id in (
+    HookEvent.OBJECT_CREATE,
+    HookEvent.OBJECT_DESTROY,
+    HookEvent.OBJECT_SHOW,
+    HookEvent.OBJECT_HIDE,
+    HookEvent.OBJECT_NAMECHANGE,
+    HookEvent.OBJECT_CLOAKED,
+    HookEvent.OBJECT_UNCLOAKED,
+    HookEvent.SYSTEM_FOREGROUND,
+    HookEvent.SYSTEM_MINIMIZEEND,
+))
+
+_VISIBLE_BY_EVENT_ID = {int(HookEvent.OBJECT_SHOW): True, int(HookEvent.OBJECT_HIDE): False}
+_CLOAKED_BY_EVENT_ID = {int(HookEvent.OBJECT_CLOAKED): True, int(HookEvent.OBJECT_UNCLOAKED): False}
+
+
+class WindowState(NamedTuple):
+    """Last known state of a top-level window."""
+    hwnd: int
+    process_id: int
+    exe_path: str
+    title: str
+    #: Shown (OBJECT_SHOW, foreground events) or hidden (OBJECT_HIDE), False until known.
+    visible: bool = False
+    #: Cloaked (OBJECT_CLOAKED) or uncloaked (OBJECT_UNCLOAKED), False until known.
+    cloaked: bool = False
+
+
+class DesktopState:
+    """Open windows and foreground window, as derived from the events applied so far."""
+
+    def __init__(self, windows: Optional[Dict[int, WindowState]] = None, foreground_hwnd: int = 0,
+                 event_time_ms: Optional[int] = None):
+        #: Open windows by hwnd.
+        self.windows: Dict[int, WindowState] = dict(windows or {})
+        #: Foreground window handle, 0 if unknown.
+        self.foreground_hwnd = foreground_hwnd
+        #: Time of the last applied event, None if no event was applied.
+        self.event_time_ms = event_time_ms
+
+    def __eq__(self, other):
+        return (isinstance(other, DesktopState) and self.windows == other.windows
+                and self.foreground_hwnd == other.foreground_hwnd and self.event_time_ms == other.event_time_ms)
+
+    def __repr__(self):
+        return (f'DesktopState(windows={len(self.windows)}, foreground_hwnd={self.foreground_hwnd:#x}, '
+                f'event_time_ms={self.event_time_ms})')
+
+    @property
+    def foreground(self) -> Optional[WindowState]:
+        """State of the foreground window, None if unknown."""
+        return self.windows.get(self.foreground_hwnd)
+
+    def apply(self, record: EventRecord):
+        """Updates the state with the given event. Events not in STATE_EVENT_IDS only update event_time_ms."""
+        self.event_time_ms = record.event_time_ms
+        event_id = record.event_id
+        hwnd = record.hwnd
+        if event_id not in STATE_EVENT_IDS or not hwnd:
+            return
+        is_foreground = event_id in FOREGROUND_EVENT_IDS
+        if not is_foreground and not is_window_object(record.id_object, record.id_child):
+            return
+        if event_id == HookEvent.OBJECT_DESTROY:
+            self.windows.pop(hwnd, None)
+            if self.foreground_hwnd == hwnd:
+                self.foreground_hwnd = 0
+            return
+        old = self.windows.get(hwnd)
+        if old is None:
+            window = WindowState(hwnd, record.process_id, record.exe_path, record.title)
+        else:
+            # The process of a window never changes: keep the known values if the lookups failed.
+            window = old._replace(process_id=record.process_id or old.process_id,
+                                  exe_path=record.exe_path or old.exe_path, title=record.title)
+        if is_foreground:
+            window = window._replace(visible=True)
+            self.foreground_hwnd = hwnd
+        elif event_id in _VISIBLE_BY_EVENT_ID:
+            window = window._replace(visible=_VISIBLE_BY_EVENT_ID[event_id])
+        elif event_id in _CLOAKED_BY_EVENT_ID:
+            window = window._replace(cloaked=_CLOAKED_BY_EVENT_ID[event_id])
+        self.windows[hwnd] = window
+
+    def to_keyframe(self) -> dict:
+        """Returns the state as a JSON serializable dict."""
+        return {
+            'event_time_ms': self.event_time_ms,
+            'foreground_hwnd': self.foreground_hwnd,
+            'windows': [list(window) for window in self.windows.values()],
+        }
+
+    @classmethod
+    def from_keyframe(cls, keyframe: dict) -> 'DesktopState':
+        """Creates a state from a dict returned by to_keyframe()."""
+        windows = (WindowState(*window) for window in keyframe['windows'])
+        return cls({window.hwnd: window for window in windows}, keyframe['foreground_hwnd'],
+                   keyframe['event_time_ms'])
+
+
+class KeyframeRecorder:
+    """Writes events to an archive, with a keyframe of the desktop state every `keyframe_interval_ms`.
+
+    :param writer: archive writer, closed by close().
+    :param keyframe_interval_ms: minimum time between two keyframes.
+    """
+
+    def __init__(self, writer: ArchiveWriter, keyframe_interval_ms: int = 60_000):
+        self.writer = writer
+        self.keyframe_interval_ms = keyframe_interval_ms
+        self.state = DesktopState()
+        self._last_keyframe_ms = None  # extended tick count
+        self._last_event_ms = None  # extended tick count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, record: EventRecord):
+        """Writes the record, preceded by a keyframe of the current state if the keyframe interval elapsed."""
+        if self._last_event_ms is None:
+            event_time_ms = self._last_keyframe_ms = record.event_time_ms
+        else:
+            event_time_ms = self._last_event_ms + tick_delta(record.event_time_ms, self._last_event_ms)
+            if event_time_ms - self._last_keyframe_ms >= self.keyframe_interval_ms:
+                self.writer.write_keyframe(self._last_event_ms, self.state.to_keyframe())
+                self._last_keyframe_ms = event_time_ms
+        self._last_event_ms = event_time_ms
+        self.writer.write(record)
+        self.state.apply(record)
+
+    def close(self):
+        self.writer.close()
+
+
+def state_at(reader: ArchiveReader, event_time_ms: int) -> DesktopState:
+    """Reconstructs the desktop state after the events that occurred at or before event_time_ms.
+
+    Loads the nearest keyframe preceding event_time_ms, and applies the events of the chunks following it.
+
+    :param event_time_ms: extended tick count, see the module documentation.
+    """
+    keyframe_times = [keyframe.event_time_ms for keyframe in reader.keyframes]
+    keyframe_index = bisect.bisect_right(keyframe_times, event_time_ms) - 1
+    if keyframe_index >= 0:
+        keyframe = reader.keyframes[keyframe_index]
+        state = DesktopState.from_keyframe(reader.read_keyframe(keyframe))
+        first_chunk = keyframe.chunk_index
+        reference_ms = keyframe.event_time_ms
+    else:
+        state = DesktopState()
+        first_chunk = 0
+        reference_ms = reader.chunks[0].t_min if reader.chunks else 0
+    # Chunks span less than chunk_ms, so never a wraparound: each chunk t_min is extended from the previous
+    # chunk, and the chunk events from its t_min.
+    for chunk in reader.chunks[first_chunk:]:
+        reference_ms += tick_delta(chunk.t_min, reference_ms)
+        if reference_ms > event_time_ms:
+            break
+        if chunk.event_ids.isdisjoint(STATE_EVENT_IDS):
+            continue
+        for record in reader.read_columns(chunk).records():
+            if reference_ms + tick_delta(record.event_time_ms, reference_ms) > event_time_ms:
+                break
+            state.apply(record)
+    state.event_time_ms = event_time_ms
+    return state
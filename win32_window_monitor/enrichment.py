@@ -0,0 +1,136 @@
+"""
+Batch enrichment of raw event hook callback parameters into EventRecord.
+
+During bursts, a batch of pending events often holds many events for the same few windows and
+threads. enrich_batch() resolves each distinct (thread id, hwnd) pair, process id and hwnd exactly once
+with get_hwnd_process_id(), get_process_filename() and get_window_title(), and attaches the results to
+all the events of the batch.
+
+Example::
+
+    batcher = EventBatcher()
+    event_hook_handle = set_win_event_hook(batcher.on_event, HookEvent.SYSTEM_FOREGROUND)
+    ...
+    for record in batcher.drain():  # for example, from a timer on the message loop thread
+        print(record)
+    print(batcher.stats.dedupe_ratio)
+
+Lookups can also be cached across batches, and across collector restarts, with a WarmStartCache (see
+win32_window_monitor.warm_cache).
+"""
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from .ids import HookEvent
+from .records import EventRecord
+from .warm_cache import WarmStartCache
+from .win32api import get_hwnd_process_id, get_process_filename, get_window_title
+
+
+class EnrichmentStats(NamedTuple):
+    """Number of enriched events and of Win32 lookups performed to enrich them."""
+    events: int = 0
+    pid_lookups: int = 0
+    filename_lookups: int = 0
+    title_lookups: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.pid_lookups + self.filename_lookups + self.title_lookups
+
+    @property
+    def dedupe_ratio(self) -> float:
+        """Number of lookups an event-by-event enrichment would perform, divided by the lookups performed.
+
+        An event-by-event enrichment performs 3 lookups per event (process id, process filename, title).
+        """
+        return self.events * 3 / self.lookups if self.lookups else 1.0
+
+    def __add__(self, other: 'EnrichmentStats') -> 'EnrichmentStats':
+        return EnrichmentStats(*(value + other_value for value, other_value in zip(self, other)))
+
+
+def enrich_batch(raw_events: Sequence[tuple], log_error: bool = True,
+                 cache: Optional[WarmStartCache] = None) -> Tuple[List[EventRecord], EnrichmentStats]:
+    """Enriches the raw event hook callback parameters with their process id, executable path and window title.
+
+    Each distinct (thread id, hwnd) pair is resolved once with get_hwnd_process_id(): events get the same
+    process id, or lack of it, as if it was called for each event, but errors are logged once per pair.
+
+    :param raw_events: tuples of the event hook callback parameters (win_event_hook_handle, event_id, hwnd,
+        id_object, id_child, event_thread_id, event_time_ms).
+    :param log_error: passed to get_hwnd_process_id() and get_process_filename().
+    :param cache: if not None, lookups go through this cache, which is kept up to date with the window
+        destructions and title changes of the batch. The statistics then count the lookups made on the cache.
+    :return: the EventRecord of each raw event, in the same order, and the enrichment statistics.
+    """
+    if cache is None:
+        lookup_process_id, lookup_filename, lookup_title = get_hwnd_process_id, get_process_filename, get_window_title
+    else:
+        lookup_process_id, lookup_filename, lookup_title = \
+            cache.hwnd_process_id, cache.process_filename, cache.window_title
+        for _, event_id, hwnd, id_object, id_child, _, _ in raw_events:
+            if event_id == HookEvent.OBJECT_NAMECHANGE:
+                cache.observe_event(event_id, hwnd, id_object, id_child)
+
+    process_ids = {}
+    titles = {}
+    for _, _, hwnd, _, _, event_thread_id, _ in raw_events:
+        key = (event_thread_id, hwnd)
+        if key not in process_ids:
+            process_ids[key] = lookup_process_id(event_thread_id, hwnd, log_error=log_error)
+        if hwnd and hwnd not in titles:
+            titles[hwnd] = lookup_title(hwnd)
+
+    filenames = {}
+    for process_id in set(process_ids.values()):
+        if process_id:
+            filenames[process_id] = lookup_filename(process_id, log_error=log_error)
+
+    if cache is not None:
+        # Destroyed windows are dropped after the lookups, so earlier events of the batch still get their process.
+        for _, event_id, hwnd, id_object, id_child, _, _ in raw_events:
+            if event_id == HookEvent.OBJECT_DESTROY:
+                cache.observe_event(event_id, hwnd, id_object, id_child)
+
+    records = []
+    for _, event_id, hwnd, id_object, id_child, event_thread_id, event_time_ms in raw_events:
+        process_id = process_ids[event_thread_id, hwnd]
+        records.append(EventRecord(event_time_ms, event_id, hwnd or 0, id_object, id_child, event_thread_id or 0,
+                                   process_id or 0, filenames.get(process_id) or '', titles.get(hwnd, '')))
+    return records, EnrichmentStats(len(raw_events), len(process_ids), len(filenames), len(titles))
+
+
+class EventBatcher:
+    """Event hook callback that queues raw events, enriched in batch by drain().
+
+    Both on_event() and drain() must be called from the thread running the Windows message loop.
+
+    :param log_error: see enrich_batch().
+    :param cache: see enrich_batch(). Its snapshot is saved by drain() every cache.save_interval_ms.
+    """
+
+    def __init__(self, log_error: bool = True, cache: Optional[WarmStartCache] = None):
+        self.log_error = log_error
+        self.cache = cache
+        self.pending: List[tuple] = []
+        #: Cumulative enrichment statistics.
+        self.stats = EnrichmentStats()
+
+    def on_event(self, win_event_hook_handle, event_id: int, hwnd, id_object: int, id_child: int,
+                 event_thread_id: int, event_time_ms: int):
+        """Event hook callback, see set_win_event_hook()."""
+        self.pending.append((win_event_hook_handle, event_id, hwnd, id_object, id_child, event_thread_id,
+                             event_time_ms))
+
+    def drain(self) -> List[EventRecord]:
+        """Enriches and returns the pending events."""
+        raw_events = self.pending
+        if not raw_events:
+            return []
+        self.pending = []
+        records, stats = enrich_batch(raw_events, self.log_error, self.cache)
+        self.stats += stats
+        if self.cache is not None:
+            self.cache.maybe_save()
+        return records
@@ -0,0 +1,174 @@
+"""
+Process pool executor for CPU heavy event handlers.
+
+Event hook callbacks run on the thread of the Windows message loop, so pure Python handlers are limited to
+one core. ProcessPoolEventExecutor queues the events of the hook callback, enriches them in batch on the
+message loop thread (Win32 lookups must be done while the windows still exist, see
+win32_window_monitor.enrichment), and runs a picklable handler on the batches in a process pool.
+
+Results are delivered to `on_result` on the thread calling on_event(), poll() or flush(), in the original
+event order (hook callback order within a batch, batches in submission order), or as soon as a batch
+completes with `ordered=False`. At most `max_in_flight` batches are submitted at a time: when the limit is
+reached, on_event() blocks until the oldest batch completes.
+
+If the handler raises, the results of its batch are lost and the exception is raised by the next call to
+poll(), flush() or close(): on_event() runs in the hook callback, where ctypes would print and ignore it.
+
+Example::
+
+    def classify(record: EventRecord) -> str:  # must be a module level function to be picklable
+        return ...
+
+    with ProcessPoolEventExecutor(classify, on_result=print) as executor:
+        event_hook_handle = set_win_event_hook(executor.on_event, HookEvent.SYSTEM_FOREGROUND)
+        run_message_loop()  # call executor.poll() regularly, for example from a timer
+        event_hook_handle.unhook()
+"""
+
+import collections
+import concurrent.futures
+import os
+from typing import Any, Callable, Deque, List, Optional, Sequence
+
+from .enrichment import enrich_batch
+from .records import EventRecord
+
+_worker_handler: Optional[Callable[[EventRecord], Any]] = None
+
+
+def _init_worker(handler: Callable[[EventRecord], Any]):
+    """Process pool initializer: the handler is sent once per worker rather than with each batch."""
+    global _worker_handler
+    _worker_handler = handler
+
+
+def _run_batch(batch: List[tuple]) -> List[Any]:
+    make_record = EventRecord._make
+    handler = _worker_handler
+    return [handler(make_record(fields)) for fields in batch]
+
+
+class ProcessPoolEventExecutor:
+    """Runs a picklable event handler on batches of events in a process pool.
+
+    :param handler: picklable callable, called in a worker process with each EventRecord.
+    :param on_result: called with each (record, handler result) on the thread calling on_event(), poll() or
+        flush().
+    :param workers: number of worker processes, defaults to os.cpu_count().
+    :param batch_size: number of events queued before a batch is submitted.
+    :param max_in_flight: maximum number of submitted batches. Defaults to twice the number of workers.
+    :param ordered: deliver results in event order. If False, batches are delivered as they complete.
+    :param enrich: enrich events with their process id, executable path and title before submitting them.
+    """
+
+    def __init__(self, handler: Callable[[EventRecord], Any], on_result: Callable[[EventRecord, Any], None],
+                 workers: Optional[int] = None, batch_size: int = 256, max_in_flight: Optional[int] = None,
+                 ordered: bool = True, enrich: bool = True):
+        self.on_result = on_result
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.enrich = enrich
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self._pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                            initargs=(handler,))
+        self._pending: List[tuple] = []
+        self._in_flight: Deque = collections.deque()  # (records, future)
+        self._error: Optional[BaseException] = None  # first handler exception not raised yet
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of submitted batches whose results were not delivered yet."""
+        return len(self._in_flight)
+
+    def on_event(self, win_event_hook_handle, event_id: int, hwnd, id_object: int, id_child: int,
+                 event_thread_id: int, event_time_ms: int):
+        """Event hook callback, see set_win_event_hook(). Submits a batch every batch_size events."""
+        self._pending.append((win_event_hook_handle, event_id, hwnd, id_object, id_child, event_thread_id,
+                              event_time_ms))
+        if len(self._pending) >= self.batch_size:
+            self.submit_pending()
+
+    def submit_pending(self):
+        """Enriches the queued events and submits them as a batch, then delivers the completed results."""
+        raw_events = self._pending
+        if not raw_events:
+            return
+        self._pending = []
+        if self.enrich:
+            records, _ = enrich_batch(raw_events)
+        else:
+            records = [EventRecord(event_time_ms, event_id, hwnd or 0, id_object, id_child, event_thread_id or 0)
+                       for _, event_id, hwnd, id_object, id_child, event_thread_id, event_time_ms in raw_events]
+        self.submit(records)
+
+    def submit(self, records: Sequence[EventRecord]):
+        """Submits already enriched records as a batch, then delivers the completed results.
+
+        Records are kept in the given order: event_time_ms is not sorted, as it wraps around every 49.7 days.
+        Blocks until a batch completes if max_in_flight batches are already submitted.
+        """
+        records = list(records)
+        while len(self._in_flight) >= self.max_in_flight:
+            self._deliver(block=True)
+        # Plain tuples are more compact to pickle than named tuples.
+        self._in_flight.append((records, self._pool.submit(_run_batch, [tuple(record) for record in records])))
+        self._deliver(block=False)
+
+    def poll(self):
+        """Delivers the results of the completed batches without blocking. Raises the pending handler exception."""
+        self._deliver(block=False)
+        self._raise_error()
+
+    def flush(self):
+        """Submits the queued events, and waits for all the results to be delivered. Raises the pending handler
+        exception."""
+        self.submit_pending()
+        while self._in_flight:
+            self._deliver(block=True)
+        self._raise_error()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Flushes the executor, then shuts down the process pool."""
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
+
+    def _deliver(self, block: bool):
+        """Delivers completed batches. If block is True, first waits for at least one batch to complete."""
+        if self.ordered:
+            if block:
+                self._deliver_batch(*self._in_flight.popleft())
+            while self._in_flight and self._in_flight[0][1].done():
+                self._deliver_batch(*self._in_flight.popleft())
+        else:
+            if block:
+                concurrent.futures.wait([future for _, future in self._in_flight],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+            completed = [batch for batch in self._in_flight if batch[1].done()]
+            for batch in completed:
+                self._in_flight.remove(batch)
+            for batch in completed:
+                self._deliver_batch(*batch)
+
+    def _deliver_batch(self, records: List[EventRecord], future: concurrent.futures.Future):
+        try:
+            results = future.result()
+        except Exception as error:
+            if self._error is None:
+                self._error = error
+            return
+        for record, result in zip(records, results):
+            self.on_result(record, result)
@@ -2,6 +2,8 @@
 """
 
 from win32_window_monitor import *
+from win32_window_monitor.records import exe_short_name as get_exe_short_name
+from win32_window_monitor.timestamps import tick_delta
 from ctypes import wintypes
 
 # The types of events we want to listen for, and the names we'll use for
@@ -35,14 +37,14 @@ class WindowEventLogger:
         if process_id:
             filename = get_process_filename(process_id)
             if filename:
-                exe_short_name = '\\'.join(filename.rsplit('\\', 2)[-2:])
+                exe_short_name = get_exe_short_name(filename)
 
         if hwnd:
             hwnd = hex(hwnd)
         elif id_object == ObjectId.CURSOR:
             hwnd = '<Cursor>'
 
-        elapsed_second = float(event_time_ms - self.last_time if self.last_time else 0) / 1000
+        elapsed_second = float(tick_delta(event_time_ms, self.last_time) if self.last_time else 0) / 1000
         event_name = EVENT_TYPES.get(event_id, event_id.name)
         print("%s:%04.2f\t%-10s\t"
               "W:%-8s\tP:%-8d\tT:%-8d\t"
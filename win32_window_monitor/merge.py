@@ -0,0 +1,212 @@
+"""
+Merge of captures recorded on many machines into a single stream ordered by wall clock time.
+
+`event_time_ms` is a per machine GetTickCount() value. Each archive must store a clock anchor in its
+metadata (see anchor_metadata()): the tick count and the wall clock time measured at the same instant.
+Event times are converted to wall clock time using this anchor and TickNormalizer, accounting for the
+32-bit tick count wraparound.
+
+Chunks are decoded and normalized in parallel by a process pool, then merged with a heap-based k-way
+merge. Each source only keeps a few decoded chunks in memory, regardless of the size of the captures.
+Hook events can be recorded slightly out of order, so the events of a chunk are held back until no later
+chunk of the same capture can hold an earlier event.
+
+Command line usage::
+
+    merge_window_captures merged.w32a pc1.w32a pc2.w32a ...
+"""
+
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import heapq
+import os
+import time
+from typing import Callable, Deque, Iterator, List, NamedTuple, Optional, Sequence
+
+from .archive import ArchiveError, ArchiveReader, ArchiveWriter, ChunkInfo, read_chunk_columns
+from .records import EventRecord
+from .timestamps import ClockAnchor, TickNormalizer, anchors_to_wall_time, extend_ticks
+
+#: Metadata keys of the clock anchor.
+ANCHOR_TICK_KEY = 'anchor_tick_ms'
+ANCHOR_WALL_TIME_KEY = 'anchor_wall_time_ms'
+#: Metadata key of the source name. The archive file name is used if missing.
+SOURCE_KEY = 'source'
+
+
+def anchor_metadata(tick_ms: Optional[int] = None, wall_time_ms: Optional[int] = None,
+                    source: Optional[str] = None) -> dict:
+    """Returns the archive metadata needed to merge a capture: its clock anchor and source name.
+
+    Should be called when the recording starts and passed to ArchiveWriter.
+
+    :param tick_ms: current tick count, defaults to get_tick_count().
+    :param wall_time_ms: current wall clock time in milliseconds since epoch, defaults to time.time().
+    :param source: name of the capture source, for example the machine name.
+    """
+    if tick_ms is None:
+        from .win32api import get_tick_count
+        tick_ms = get_tick_count()
+    if wall_time_ms is None:
+        wall_time_ms = int(time.time() * 1000)
+    metadata = {ANCHOR_TICK_KEY: tick_ms, ANCHOR_WALL_TIME_KEY: wall_time_ms}
+    if source is not None:
+        metadata[SOURCE_KEY] = source
+    return metadata
+
+
+class MergedEvent(NamedTuple):
+    """An event of the merged stream."""
+    #: Wall clock time of the event, in milliseconds since epoch.
+    wall_time_ms: int
+    #: Name of the capture the event comes from.
+    source: str
+    record: EventRecord
+
+
+class MergeStats(NamedTuple):
+    """Statistics of a merge."""
+    sources: int
+    events: int
+    seconds: float
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds > 0 else 0.0
+
+
+def _decode_normalized_chunk(path: str, chunk: ChunkInfo, source: str, reference_tick_ms: int,
+                             anchors: Sequence[ClockAnchor]) -> List[MergedEvent]:
+    """Decodes a chunk and converts its event times to wall clock time, given the extended tick count of a tick
+    close to the chunk events. Returns the events sorted by wall clock time."""
+    columns = read_chunk_columns(path, chunk)
+    wall_times_ms = anchors_to_wall_time(extend_ticks(columns.event_time_ms, reference_tick_ms), anchors)
+    if not isinstance(wall_times_ms, list):
+        wall_times_ms = wall_times_ms.tolist()  # NumPy array
+    events = [MergedEvent(wall_time_ms, source, record)
+              for wall_time_ms, record in zip(wall_times_ms, columns.records())]
+    events.sort(key=lambda event: event.wall_time_ms)
+    return events
+
+
+class _SourceStream:
+    """Normalized events of one archive, decoded chunk by chunk with at most `prefetch` chunks in flight."""
+
+    def __init__(self, path: str, executor: Optional[concurrent.futures.Executor], prefetch: int):
+        self.path = path
+        self.executor = executor
+        self.prefetch = prefetch
+        with ArchiveReader(path) as reader:
+            metadata = reader.metadata
+            chunks = reader.chunks
+        if ANCHOR_TICK_KEY not in metadata or ANCHOR_WALL_TIME_KEY not in metadata:
+            raise ArchiveError(f'{path}: missing clock anchor in archive metadata, see anchor_metadata()')
+        self.source = metadata.get(SOURCE_KEY) or os.path.splitext(os.path.basename(path))[0]
+        # Chunks span less than chunk_ms (see ArchiveWriter), so each chunk t_min is extended from the previous
+        # chunk, tracking wraparounds across the whole capture, and the chunk events from its t_min.
+        normalizer = TickNormalizer.from_tick(metadata[ANCHOR_TICK_KEY], metadata[ANCHOR_WALL_TIME_KEY])
+        self._tasks: Deque[tuple] = collections.deque()
+        for chunk in chunks:
+            self._tasks.append((path, chunk, self.source, normalizer.extend(chunk.t_min), normalizer.anchors))
+        # Wall clock time of the earliest event of the chunks following each chunk, None for the last chunk.
+        self._later_min_ms: Deque[Optional[int]] = collections.deque()
+        later_min_ms = None
+        for _, _, _, reference_tick_ms, anchors in reversed(self._tasks):
+            self._later_min_ms.appendleft(later_min_ms)
+            t_min_ms = anchors_to_wall_time([reference_tick_ms], anchors, use_numpy=False)[0]
+            later_min_ms = t_min_ms if later_min_ms is None else min(later_min_ms, t_min_ms)
+        self._pending: Deque = collections.deque()
+        self.fill()
+
+    def fill(self):
+        """Submits chunk decoding tasks until `prefetch` chunks are in flight."""
+        if self.executor is None:
+            return
+        while self._tasks and len(self._pending) < self.prefetch:
+            self._pending.append(self.executor.submit(_decode_normalized_chunk, *self._tasks.popleft()))
+
+    def __iter__(self) -> Iterator[MergedEvent]:
+        held: List[MergedEvent] = []  # decoded events, sorted, that a later chunk may precede
+        while self._pending or self._tasks:
+            if self.executor is None:
+                events = _decode_normalized_chunk(*self._tasks.popleft())
+            else:
+                events = self._pending.popleft().result()
+                self.fill()
+            if held:
+                events = list(heapq.merge(held, events, key=lambda event: event.wall_time_ms))
+            later_min_ms = self._later_min_ms.popleft()
+            count = len(events)
+            if later_min_ms is not None:
+                count = bisect.bisect_right([event.wall_time_ms for event in events], later_min_ms)
+            yield from events[:count]
+            held = events[count:]
+
+
+def iter_merged(paths: Sequence[str], workers: Optional[int] = None, prefetch: int = 2) -> Iterator[MergedEvent]:
+    """Yields the events of all the archives, ordered by wall clock time.
+
+    :param paths: archive paths, each archive must have a clock anchor (see anchor_metadata()).
+    :param workers: number of processes used to decode chunks. None uses os.cpu_count(), 0 decodes chunks
+        in the calling thread.
+    :param prefetch: maximum number of decoded chunks in flight per archive.
+    """
+    if workers == 0:
+        streams = [_SourceStream(path, None, prefetch) for path in paths]
+        yield from heapq.merge(*streams, key=lambda event: event.wall_time_ms)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # Streams submit their first chunks on creation so that all sources are decoded in parallel.
+        streams = [_SourceStream(path, executor, prefetch) for path in paths]
+        yield from heapq.merge(*streams, key=lambda event: event.wall_time_ms)
+
+
+def merge_captures(paths: Sequence[str], output: Optional[str] = None,
+                   sink: Optional[Callable[[MergedEvent], None]] = None,
+                   workers: Optional[int] = None, prefetch: int = 2, **writer_kwargs) -> MergeStats:
+    """Merges archives into a single stream ordered by wall clock time.
+
+    :param paths: archive paths, each archive must have a clock anchor (see anchor_metadata()).
+    :param output: path of the merged archive. Its events `event_time_ms` is the wall clock time in milliseconds
+        since epoch and each event is tagged with its source (see ArchiveReader.tagged_records()).
+    :param sink: callable called with each MergedEvent.
+    :param workers: see iter_merged().
+    :param prefetch: see iter_merged().
+    :param writer_kwargs: additional parameters for the ArchiveWriter of the output.
+    :return: merge statistics, including the throughput in events per second.
+    """
+    start = time.perf_counter()
+    writer = None
+    if output is not None:
+        writer = ArchiveWriter(output, metadata={'time_base': 'wall_time_ms'}, **writer_kwargs)
+    events = 0
+    try:
+        for event in iter_merged(paths, workers, prefetch):
+            if writer is not None:
+                writer.write(event.record._replace(event_time_ms=event.wall_time_ms), event.source)
+            if sink is not None:
+                sink(event)
+            events += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return MergeStats(len(paths), events, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge window event captures into an archive ordered by '
+                                                 'wall clock time.')
+    parser.add_argument('output', help='path of the merged archive')
+    parser.add_argument('inputs', nargs='+', help='paths of the archives to merge')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of decoding processes, defaults to the number of CPUs')
+    args = parser.parse_args()
+    stats = merge_captures(args.inputs, args.output, workers=args.workers)
+    print(f'Merged {stats.events} events from {stats.sources} sources in {stats.seconds:.2f}s '
+          f'({stats.events_per_second:.0f} events/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Query and aggregation engine over archives recorded with win32_window_monitor.archive.
+
+Example::
+
+    from win32_window_monitor.query import Query
+
+    # Top 10 executables by focus time between t1 and t2
+    Query('capture.w32a').between(t1, t2).focus_time_by_exe(top=10)
+
+    # Count of OBJECT_SHOW per process per minute
+    Query('capture.w32a').where(event_ids=[HookEvent.OBJECT_SHOW]).count_by('process_id', bucket_ms=60_000)
+
+Archives are processed one chunk at a time, and chunks that can not match the time range, event ids
+or executables of the query are skipped using the archive footer index. Group-by aggregations use
+NumPy vectorization when it is installed, and fall back on pure Python otherwise. Chunks can be
+processed in parallel by a process pool with the `workers` parameter.
+
+Times of between(), of count_by() buckets and of focus_time_by_exe() are extended tick counts: the first
+event_time_ms of each archive plus the ticks elapsed since, so they keep increasing after GetTickCount
+wraps around (see win32_window_monitor.timestamps). They are equal to event_time_ms until the first
+wraparound. records() yields the records unchanged.
+"""
+
+import collections
+import concurrent.futures
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .archive import ArchiveReader, ChunkColumns, ChunkInfo, read_chunk_columns
+from .records import FOREGROUND_EVENT_IDS, EventRecord
+from .timestamps import extend_ticks, tick_delta
+
+try:
+    import numpy
+except ImportError:  # optional dependency, falls back on pure Python aggregation.
+    numpy = None
+
+#: EventRecord fields that can be used as count_by() keys.
+GROUP_KEYS = ('event_id', 'hwnd', 'id_object', 'id_child', 'thread_id', 'process_id', 'exe_path', 'title')
+
+
+class QueryFilters(NamedTuple):
+    """Predicates of a query. None means no filtering; `t_min` and `t_max` are inclusive extended tick counts."""
+    t_min: Optional[int] = None
+    t_max: Optional[int] = None
+    event_ids: Optional[frozenset] = None
+    object_ids: Optional[frozenset] = None
+    process_ids: Optional[frozenset] = None
+    exe_paths: Optional[frozenset] = None
+
+    def matches_chunk(self, chunk: ChunkInfo, reference_ms: int) -> bool:
+        """Returns False if the chunk can not match, given the extended tick count of its t_min."""
+        # Chunks span less than chunk_ms, so never a wraparound: compare the bounds with the chunk tick counts.
+        shift_ms = reference_ms - chunk.t_min
+        return chunk.matches(None if self.t_min is None else self.t_min - shift_ms,
+                             None if self.t_max is None else self.t_max - shift_ms, self.event_ids, self.exe_paths)
+
+
+def _extended_chunks(reader: ArchiveReader) -> List[Tuple[ChunkInfo, int]]:
+    """Returns the chunks of an archive with the extended tick count of their t_min.
+
+    Each chunk t_min is extended from the previous chunk, tracking wraparounds across the whole archive.
+    """
+    chunks = []
+    reference_ms = None
+    for chunk in reader.chunks:
+        reference_ms = chunk.t_min if reference_ms is None else reference_ms + tick_delta(chunk.t_min, reference_ms)
+        chunks.append((chunk, reference_ms))
+    return chunks
+
+
+def _frozen_ints(values: Optional[Iterable[int]]) -> Optional[frozenset]:
+    return None if values is None else frozenset(int(value) for value in values)
+
+
+# Per chunk processing, executed in worker processes when parallelism is enabled.
+# ###################################################################
+
+def _selected_positions(columns: ChunkColumns, times: Sequence[int], filters: QueryFilters) -> List[int]:
+    """Returns the positions of the chunk events matching the filters, given their extended tick counts."""
+    t_min, t_max, event_ids, object_ids, process_ids, exe_paths = filters
+    exe_indexes = None
+    if exe_paths is not None:
+        exe_indexes = {index for index, exe_path in enumerate(columns.exe_paths) if exe_path in exe_paths}
+    positions = []
+    for position, (event_time_ms, event_id, id_object, process_id, exe_index) in enumerate(zip(
+            times, columns.event_id, columns.id_object, columns.process_id, columns.exe_index)):
+        if ((t_min is None or event_time_ms >= t_min) and (t_max is None or event_time_ms <= t_max)
+                and (event_ids is None or event_id in event_ids)
+                and (object_ids is None or id_object in object_ids)
+                and (process_ids is None or process_id in process_ids)
+                and (exe_indexes is None or exe_index in exe_indexes)):
+            positions.append(position)
+    return positions
+
+
+def _numpy_mask(columns: ChunkColumns, times, filters: QueryFilters):
+    """Returns a boolean array of the chunk events matching the filters, given their extended tick counts."""
+    t_min, t_max, event_ids, object_ids, process_ids, exe_paths = filters
+    mask = numpy.ones(len(times), dtype=bool)
+    if t_min is not None:
+        mask &= times >= t_min
+    if t_max is not None:
+        mask &= times <= t_max
+    for values, column in ((event_ids, columns.event_id), (object_ids, columns.id_object),
+                           (process_ids, columns.process_id)):
+        if values is not None:
+            mask &= numpy.isin(numpy.asarray(column, dtype=numpy.int64), list(values))
+    if exe_paths is not None:
+        exe_indexes = [index for index, exe_path in enumerate(columns.exe_paths) if exe_path in exe_paths]
+        mask &= numpy.isin(numpy.asarray(columns.exe_index, dtype=numpy.int64), exe_indexes)
+    return mask
+
+
+def _count_by_numpy(columns: ChunkColumns, reference_ms: int, filters: QueryFilters, keys: Sequence[str],
+                    bucket_ms: Optional[int]) -> Dict[tuple, int]:
+    times = extend_ticks(columns.event_time_ms, reference_ms, use_numpy=True)
+    mask = _numpy_mask(columns, times, filters)
+    key_arrays = []
+    for key in keys:
+        if key == 'exe_path':
+            key_arrays.append(numpy.asarray(columns.exe_index, dtype=numpy.int64)[mask])
+        elif key == 'title':
+            key_arrays.append(numpy.asarray(columns.title_index, dtype=numpy.int64)[mask])
+        else:
+            key_arrays.append(numpy.asarray(getattr(columns, key), dtype=numpy.int64)[mask])
+    if bucket_ms:
+        times = times[mask]
+        key_arrays.append(times - times % bucket_ms)
+    if not key_arrays:
+        return {(): int(mask.sum())} if mask.any() else {}
+    unique_keys, counts = numpy.unique(numpy.stack(key_arrays, axis=1), axis=0, return_counts=True)
+    dictionaries = [columns.exe_paths if key == 'exe_path' else columns.titles if key == 'title' else None
+                    for key in keys]
+    counters = {}
+    for unique_key, count in zip(unique_keys.tolist(), counts.tolist()):
+        counters[tuple(dictionary[value] if dictionary is not None else value
+                       for dictionary, value in zip(dictionaries + [None], unique_key))] = count
+    return counters
+
+
+def _count_by_python(columns: ChunkColumns, reference_ms: int, filters: QueryFilters, keys: Sequence[str],
+                     bucket_ms: Optional[int]) -> Dict[tuple, int]:
+    key_columns = []
+    for key in keys:
+        if key == 'exe_path':
+            key_columns.append([columns.exe_paths[index] for index in columns.exe_index])
+        elif key == 'title':
+            key_columns.append([columns.titles[index] for index in columns.title_index])
+        else:
+            key_columns.append(getattr(columns, key))
+    times = extend_ticks(columns.event_time_ms, reference_ms, use_numpy=False)
+    counters = collections.Counter()
+    for position in _selected_positions(columns, times, filters):
+        key = tuple(column[position] for column in key_columns)
+        if bucket_ms:
+            key += (times[position] - times[position] % bucket_ms,)
+        counters[key] += 1
+    return counters
+
+
+def _scan_chunk(path: str, chunk: ChunkInfo, reference_ms: int, filters: QueryFilters, task: tuple):
+    """Runs a query task on a chunk, given the extended tick count of its t_min, and returns its partial result.
+
+    Supported tasks:
+
+    - ('records',): list of matching EventRecord.
+    - ('count_by', keys, bucket_ms, use_numpy): dict of group key => count.
+    - ('foreground',): list of (extended tick count, process_id, exe_path) foreground changes, ignoring filters.
+    """
+    columns = read_chunk_columns(path, chunk)
+    if task[0] == 'records':
+        times = extend_ticks(columns.event_time_ms, reference_ms, use_numpy=False)
+        return [columns.record(position) for position in _selected_positions(columns, times, filters)]
+    elif task[0] == 'count_by':
+        _, keys, bucket_ms, use_numpy = task
+        if use_numpy:
+            try:
+                return _count_by_numpy(columns, reference_ms, filters, keys, bucket_ms)
+            except OverflowError:  # integer values not representable as int64
+                pass
+        return _count_by_python(columns, reference_ms, filters, keys, bucket_ms)
+    elif task[0] == 'foreground':
+        times = extend_ticks(columns.event_time_ms, reference_ms, use_numpy=False)
+        return [(event_time_ms, process_id, columns.exe_paths[exe_index])
+                for event_time_ms, event_id, process_id, exe_index in zip(
+                    times, columns.event_id, columns.process_id, columns.exe_index)
+                if event_id in FOREGROUND_EVENT_IDS]
+    raise ValueError(f'unknown query task {task[0]!r}')
+
+
+# Query
+# ###################################################################
+
+class Query:
+    """Immutable query over one or several archive files.
+
+    between() and where() return a new query with additional predicates. Results are computed
+    by records(), count(), count_by() and focus_time_by_exe().
+
+    :param paths: archive file path, or sequence of archive file paths.
+    :param workers: number of worker processes used to scan chunks. 0 scans chunks in the calling thread.
+    :param use_numpy: use NumPy for aggregations. Defaults to True when NumPy is installed.
+    """
+
+    def __init__(self, paths: Union[str, Sequence[str]], workers: int = 0, use_numpy: Optional[bool] = None,
+                 filters: QueryFilters = QueryFilters()):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.workers = workers
+        if use_numpy and numpy is None:
+            raise ValueError('use_numpy=True but numpy is not installed')
+        self.use_numpy = numpy is not None if use_numpy is None else use_numpy
+        self.filters = filters
+
+    def _with_filters(self, **changes) -> 'Query':
+        return Query(self.paths, self.workers, self.use_numpy, self.filters._replace(**changes))
+
+    def between(self, t_min: Optional[int], t_max: Optional[int]) -> 'Query':
+        """Returns a query restricted to events with t_min <= extended tick count <= t_max. None means no bound."""
+        return self._with_filters(t_min=t_min, t_max=t_max)
+
+    def where(self, event_ids: Optional[Iterable[int]] = None, object_ids: Optional[Iterable[int]] = None,
+              process_ids: Optional[Iterable[int]] = None, exe_paths: Optional[Iterable[str]] = None) -> 'Query':
+        """Returns a query restricted to events matching all the given predicates.
+
+        Each predicate is a collection of accepted values: HookEvent, ObjectId, process ids or full
+        executable paths. None keeps the predicate of this query.
+        """
+        changes = {}
+        if event_ids is not None:
+            changes['event_ids'] = _frozen_ints(event_ids)
+        if object_ids is not None:
+            changes['object_ids'] = _frozen_ints(object_ids)
+        if process_ids is not None:
+            changes['process_ids'] = _frozen_ints(process_ids)
+        if exe_paths is not None:
+            changes['exe_paths'] = frozenset(exe_paths)
+        return self._with_filters(**changes)
+
+    def _chunks(self, filters: QueryFilters) -> List[Tuple[str, ChunkInfo, int]]:
+        chunks = []
+        for path in self.paths:
+            with ArchiveReader(path) as reader:
+                chunks.extend((path, chunk, reference_ms) for chunk, reference_ms in _extended_chunks(reader)
+                              if filters.matches_chunk(chunk, reference_ms))
+        return chunks
+
+    def _map_chunks(self, chunks: Sequence[Tuple[str, ChunkInfo, int]], filters: QueryFilters,
+                    task: tuple) -> Iterator:
+        """Yields the partial result of task for each chunk, in chunk order.
+
+        With workers, at most 2 chunks per worker are in flight to bound memory usage.
+        """
+        if self.workers <= 0 or len(chunks) <= 1:
+            for path, chunk, reference_ms in chunks:
+                yield _scan_chunk(path, chunk, reference_ms, filters, task)
+            return
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            in_flight = collections.deque()
+            for path, chunk, reference_ms in chunks:
+                if len(in_flight) >= self.workers * 2:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(_scan_chunk, path, chunk, reference_ms, filters, task))
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    def records(self) -> Iterator[EventRecord]:
+        """Yields the matching records, in archive order (files are processed in the order given)."""
+        for records in self._map_chunks(self._chunks(self.filters), self.filters, ('records',)):
+            yield from records
+
+    def count(self) -> int:
+        """Returns the number of matching events."""
+        return sum(self.count_by().values())
+
+    def count_by(self, *keys: str, bucket_ms: Optional[int] = None) -> Dict[tuple, int]:
+        """Counts matching events grouped by the given EventRecord fields (see GROUP_KEYS).
+
+        :param keys: fields of the group key.
+        :param bucket_ms: if set, the extended tick count rounded down to a multiple of bucket_ms is appended to the
+            group key.
+        :return: dict of group key tuple => count.
+        """
+        for key in keys:
+            if key not in GROUP_KEYS:
+                raise ValueError(f'invalid group key {key!r}, expected one of: {", ".join(GROUP_KEYS)}')
+        counters = collections.Counter()
+        task = ('count_by', tuple(keys), bucket_ms, self.use_numpy)
+        for partial in self._map_chunks(self._chunks(self.filters), self.filters, task):
+            counters.update(partial)
+        return dict(counters)
+
+    def _foreground_changes(self, path: str) -> Tuple[List[Tuple[int, int, str]], Optional[int]]:
+        """Returns the foreground changes of the archive within the query time range, preceded by the last change
+        before the time range, and the time of the last event of the archive. Times are extended tick counts."""
+        t_min, t_max = self.filters.t_min, self.filters.t_max
+        with ArchiveReader(path) as reader:
+            all_chunks = _extended_chunks(reader)
+        chunks = [(chunk, reference_ms) for chunk, reference_ms in all_chunks
+                  if not FOREGROUND_EVENT_IDS.isdisjoint(chunk.event_ids)]
+        end_ms = max((reference_ms + chunk.t_max - chunk.t_min for chunk, reference_ms in all_chunks), default=None)
+        time_range = QueryFilters(t_min, t_max)
+        in_range = [(path, chunk, reference_ms) for chunk, reference_ms in chunks
+                    if time_range.matches_chunk(chunk, reference_ms)]
+        before = [(path, chunk, reference_ms) for chunk, reference_ms in chunks
+                  if t_min is not None and reference_ms < t_min]
+        changes = []
+        # Seek backward for the foreground window at t_min.
+        for path_chunk in reversed(before):
+            previous = [change for change in _scan_chunk(*path_chunk, self.filters, ('foreground',))
+                        if change[0] < t_min]
+            if previous:
+                changes.append(max(previous, key=lambda change: change[0]))
+                break
+        for partial in self._map_chunks(in_range, self.filters, ('foreground',)):
+            changes.extend(change for change in partial
+                           if (t_min is None or change[0] >= t_min) and (t_max is None or change[0] <= t_max))
+        changes.sort(key=lambda change: change[0])
+        return changes, end_ms
+
+    def focus_time_by_exe(self, top: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Returns the time in milliseconds each executable had the foreground window, in decreasing order.
+
+        The foreground window is tracked using the SYSTEM_FOREGROUND and SYSTEM_MINIMIZEEND events, regardless
+        of the event_ids and object_ids predicates. The process_ids and exe_paths predicates filter the result.
+        Focus time is clipped to the query time range; without upper bound, the last foreground window is
+        focused until the last event of its archive.
+
+        :param top: maximum number of executables to return. None returns all of them.
+        :return: list of (exe_path, focus time in ms).
+        """
+        process_ids, exe_paths = self.filters.process_ids, self.filters.exe_paths
+        focus_time = collections.Counter()
+        for path in self.paths:
+            changes, end_ms = self._foreground_changes(path)
+            if self.filters.t_max is not None:
+                end_ms = self.filters.t_max
+            for (start_ms, process_id, exe_path), next_change in zip(changes, changes[1:] + [None]):
+                if self.filters.t_min is not None:
+                    start_ms = max(start_ms, self.filters.t_min)
+                stop_ms = next_change[0] if next_change is not None else end_ms
+                if ((process_ids is None or process_id in process_ids)
+                        and (exe_paths is None or exe_path in exe_paths) and stop_ms > start_ms):
+                    focus_time[exe_path] += stop_ms - start_ms
+        return focus_time.most_common(top)
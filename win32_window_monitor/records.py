@@ -0,0 +1,54 @@
+"""
+Compact event record shared by the recording, query and processing modules.
+"""
+
+from typing import NamedTuple
+
+from .ids import HookEvent, ObjectId
+
+#: Events that change the foreground window, see README.
+FOREGROUND_EVENT_IDS = frozenset([int(HookEvent.SYSTEM_FOREGROUND), int(HookEvent.SYSTEM_MINIMIZEEND)])
+
+
+def exe_short_name(exe_path: str) -> str:
+    """Returns the parent directory and file name of an executable path, as printed by log_focused_window.
+
+    For example `Mozilla Firefox\\firefox.exe` for `C:\\Program Files\\Mozilla Firefox\\firefox.exe`.
+    """
+    return '\\'.join(exe_path.rsplit('\\', 2)[-2:])
+
+
+def is_window_object(id_object: int, id_child: int) -> bool:
+    """Returns True if an event concerns a window itself.
+
+    Most object events are also sent for the window children (caret, scrollbars...), which must be ignored
+    when tracking windows. Foreground events are always about a window, whatever their object id.
+    """
+    return id_object == ObjectId.WINDOW and id_child == 0
+
+
+class EventRecord(NamedTuple):
+    """A window event reported by set_win_event_hook() and its enrichment (process, executable and title).
+
+    Unlike the raw callback parameters, all fields are plain Python values so that records can be
+    stored, pickled and sent to other processes. Unknown values are stored as 0 or the empty string
+    (for example when get_hwnd_process_id() returned None).
+    """
+    #: Event time as reported by the hook callback (GetTickCount() value, in milliseconds).
+    event_time_ms: int
+    #: Event id, see HookEvent.
+    event_id: int
+    #: Window handle, 0 if the event is not associated with a window.
+    hwnd: int
+    #: Object id, see ObjectId.
+    id_object: int
+    #: Child id, 0 (CHILDID_SELF) if the event was triggered by the object itself.
+    id_child: int
+    #: Thread that generated the event.
+    thread_id: int
+    #: Process id of the window/thread, 0 if unknown.
+    process_id: int = 0
+    #: Full executable path of the process, empty if unknown.
+    exe_path: str = ''
+    #: Window title, empty if unknown.
+    title: str = ''
@@ -0,0 +1,270 @@
+"""
+Rule engine classifying events in categories ("work", "browser", "meeting"...) by matching the window title
+and executable against glob and regex rules.
+
+Rules are compiled into indexes to avoid evaluating each rule for each event:
+
+- exact, prefix and suffix hash indexes for literal rules (including globs such as `firefox.exe`,
+  `Zoom*` or `*.pdf`),
+- an Aho-Corasick automaton for substring rules (including globs such as `*invoice*`),
+- a single combined regex per field and category for the other globs and regex rules.
+
+Results are memoized per (exe, title) in a bounded LRU cache. reload() compiles a new rule set and
+swaps it atomically, so it is safe to reload rules while another thread classifies events.
+
+Example::
+
+    engine = RuleEngine([
+        Rule('browser', r'*\\firefox.exe', field='exe'),
+        Rule('meeting', '* - Zoom Meeting'),
+        Rule('work', r'\\bJIRA-\\d+', kind='regex'),
+    ])
+    engine.classify(r'Mozilla Firefox\\firefox.exe', 'JIRA-123 - Mozilla Firefox')  # frozenset({'browser', 'work'})
+
+classify_record() matches `exe` rules against the executable short name, the parent directory and file name
+printed by log_focused_window (see exe_short_name()).
+"""
+
+import collections
+import fnmatch
+import functools
+import json
+import re
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Tuple
+
+from .records import EventRecord, exe_short_name
+
+#: Rule kinds. Globs and exact rules match the whole value, prefix and suffix rules its start and end,
+#: substring and regex rules any part of it (re.search).
+RULE_KINDS = ('glob', 'regex', 'exact', 'prefix', 'suffix', 'substring')
+#: Matched fields: the window title or the executable.
+RULE_FIELDS = ('title', 'exe')
+
+_GLOB_SPECIAL = re.compile(r'[*?\[]')
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+class Rule(NamedTuple):
+    """A classification rule: events whose `field` matches `pattern` belong to `category`."""
+    category: str
+    pattern: str
+    #: One of RULE_KINDS.
+    kind: str = 'glob'
+    #: One of RULE_FIELDS.
+    field: str = 'title'
+
+
+class _SubstringIndex:
+    """Aho-Corasick automaton finding the categories of all the literals contained in a value in a single pass."""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.output: List[set] = [set()]
+        self.fail: List[int] = [0]
+
+    def add(self, literal: str, category: str):
+        node = 0
+        for char in literal:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto.append({})
+                self.output.append(set())
+                self.goto[node][char] = child
+            node = child
+        self.output[node].add(category)
+
+    def compile(self):
+        """Computes the failure links, breadth first, and merges the output of each node with its failure node."""
+        goto, output = self.goto, self.output
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0) if node else 0
+                output[child] |= output[fail[child]]
+        self.fail = fail
+
+    def match(self, value: str) -> set:
+        goto, output, fail = self.goto, self.output, self.fail
+        categories = set()
+        node = 0
+        for char in value:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                categories |= output[node]
+        return categories
+
+
+class _FieldIndex:
+    """Compiled rules of a field."""
+
+    def __init__(self):
+        self.exact: Dict[str, set] = {}
+        self.prefix: Dict[str, set] = {}
+        self.prefix_lengths: List[int] = []
+        self.suffix: Dict[str, set] = {}
+        self.suffix_lengths: List[int] = []
+        self.substring = _SubstringIndex()
+        self.has_substring = False
+        self.regexes: Dict[str, List[str]] = {}  # category => regex sources, compiled by compile()
+        self.compiled_regexes: List[Tuple[str, list]] = []
+
+    def compile(self, flags: int):
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefix})
+        self.suffix_lengths = sorted({len(suffix) for suffix in self.suffix})
+        self.substring.compile()
+        for category, sources in self.regexes.items():
+            combinable = [source for source in sources if not _BACKREFERENCE.search(source)]
+            separate = [re.compile(source, flags) for source in sources if _BACKREFERENCE.search(source)]
+            compiled = separate
+            if combinable:
+                try:
+                    compiled.insert(0, re.compile('|'.join(f'(?:{source})' for source in combinable), flags))
+                except re.error:  # inline global flags, duplicate group names...
+                    compiled.extend(re.compile(source, flags) for source in combinable)
+            self.compiled_regexes.append((category, compiled))
+
+    def match(self, value: str) -> set:
+        categories = set(self.exact.get(value, ()))
+        for length in self.prefix_lengths:
+            if length > len(value):
+                break
+            prefix_categories = self.prefix.get(value[:length])
+            if prefix_categories:
+                categories |= prefix_categories
+        for length in self.suffix_lengths:
+            if length > len(value):
+                break
+            suffix_categories = self.suffix.get(value[len(value) - length:])
+            if suffix_categories:
+                categories |= suffix_categories
+        if self.has_substring:
+            categories |= self.substring.match(value)
+        for category, regexes in self.compiled_regexes:
+            if category not in categories:
+                for regex in regexes:
+                    if regex.search(value):
+                        categories.add(category)
+                        break
+        return categories
+
+
+class _CompiledRules:
+    """Immutable compiled rule set, with its memoized classify function."""
+
+    def __init__(self, rules: Iterable[Rule], ignore_case: bool, cache_size: int):
+        self.ignore_case = ignore_case
+        self.rule_count = 0
+        self.fields = {field: _FieldIndex() for field in RULE_FIELDS}
+        for rule in rules:
+            self._add(rule)
+        flags = re.IGNORECASE if ignore_case else 0
+        for field_index in self.fields.values():
+            field_index.compile(flags)
+        self.classify: Callable[[str, str], FrozenSet[str]] = functools.lru_cache(maxsize=cache_size)(
+            self._classify)
+
+    def _add(self, rule: Rule):
+        if rule.kind not in RULE_KINDS:
+            raise ValueError(f'invalid rule kind {rule.kind!r} in {rule}, '
+                             f'expected one of: {", ".join(RULE_KINDS)}')
+        if rule.field not in RULE_FIELDS:
+            raise ValueError(f'invalid rule field {rule.field!r} in {rule}, '
+                             f'expected one of: {", ".join(RULE_FIELDS)}')
+        field_index = self.fields[rule.field]
+        kind = rule.kind
+        pattern = rule.pattern
+        if kind == 'glob':
+            if not _GLOB_SPECIAL.search(pattern):
+                kind = 'exact'
+            elif pattern.endswith('*') and not _GLOB_SPECIAL.search(pattern[:-1]):
+                kind = 'prefix'
+                pattern = pattern[:-1]
+            elif pattern.startswith('*') and not _GLOB_SPECIAL.search(pattern[1:]):
+                kind = 'suffix'
+                pattern = pattern[1:]
+            elif pattern[:1] == pattern[-1:] == '*' and not _GLOB_SPECIAL.search(pattern[1:-1]):
+                kind = 'substring'
+                pattern = pattern[1:-1]
+            else:
+                kind = 'regex'
+                pattern = r'\A' + fnmatch.translate(pattern)
+        elif kind == 'regex':
+            re.compile(pattern)  # report invalid regex with the rule, rather than in the combined regex
+        if kind != 'regex' and self.ignore_case:
+            pattern = pattern.lower()
+        if kind == 'substring' and not pattern:
+            kind = 'prefix'  # matches any value
+        if kind == 'exact':
+            field_index.exact.setdefault(pattern, set()).add(rule.category)
+        elif kind == 'prefix':
+            field_index.prefix.setdefault(pattern, set()).add(rule.category)
+        elif kind == 'suffix':
+            field_index.suffix.setdefault(pattern, set()).add(rule.category)
+        elif kind == 'substring':
+            field_index.substring.add(pattern, rule.category)
+            field_index.has_substring = True
+        else:
+            field_index.regexes.setdefault(rule.category, []).append(pattern)
+        self.rule_count += 1
+
+    def _classify(self, exe: str, title: str) -> FrozenSet[str]:
+        if self.ignore_case:
+            exe = exe.lower()
+            title = title.lower()
+        return frozenset(self.fields['exe'].match(exe) | self.fields['title'].match(title))
+
+
+class RuleEngine:
+    """Classifies events according to a compiled set of rules.
+
+    :param rules: classification rules.
+    :param ignore_case: match rules case-insensitively.
+    :param cache_size: maximum number of (exe, title) results kept in the LRU cache.
+    """
+
+    def __init__(self, rules: Iterable[Rule] = (), ignore_case: bool = True, cache_size: int = 4096):
+        self.ignore_case = ignore_case
+        self.cache_size = cache_size
+        self._compiled = _CompiledRules(rules, ignore_case, cache_size)
+
+    @property
+    def rule_count(self) -> int:
+        return self._compiled.rule_count
+
+    def reload(self, rules: Iterable[Rule]):
+        """Compiles the new rules, then replaces the current rules and clears the cache.
+
+        If a rule is invalid, ValueError or re.error is raised and the current rules are kept.
+        """
+        self._compiled = _CompiledRules(rules, self.ignore_case, self.cache_size)
+
+    def classify(self, exe: str, title: str) -> FrozenSet[str]:
+        """Returns the categories of the rules matching the executable or the window title."""
+        return self._compiled.classify(exe, title)
+
+    def classify_record(self, record: EventRecord) -> FrozenSet[str]:
+        """Returns the categories of the rules matching the record title, or its executable short name (see
+        exe_short_name()): rules written against the log_focused_window output match the same events."""
+        return self._compiled.classify(exe_short_name(record.exe_path), record.title)
+
+    def cache_info(self):
+        """Returns the LRU cache statistics of the current rules, see functools.lru_cache."""
+        return self._compiled.classify.cache_info()
+
+
+def load_rules(path: str) -> List[Rule]:
+    """Loads rules from a JSON file containing a list of objects with the fields of Rule.
+
+    For example: `[{"category": "browser", "pattern": "firefox.exe", "field": "exe"}]`
+    """
+    with open(path, 'rt', encoding='utf-8') as rules_file:
+        return [Rule(**rule) for rule in json.load(rules_file)]
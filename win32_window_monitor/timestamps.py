@@ -0,0 +1,276 @@
+"""
+Conversion of event hook tick counts to wall clock time.
+
+`event_time_ms` is a 32-bit GetTickCount() value: it wraps around every 49.7 days and is not related to
+the wall clock. TickNormalizer anchors the tick count to the monotonic and wall clocks, extends tick
+counts to 64 bits across wraparounds, and converts them to wall clock time in milliseconds since epoch.
+
+Example::
+
+    normalizer = TickNormalizer()  # anchored now, resynchronized every minute
+    batcher = EventBatcher()
+    ...
+    records = batcher.drain()
+    wall_times_ms = normalizer.to_wall_time_batch([record.event_time_ms for record in records])
+
+The tick count and the wall clock drift apart (NTP adjustments, clock changes). While converting live
+events, the normalizer measures a new anchor every `resync_interval_ms`. The offset between the tick count
+and the wall clock used for live events does not jump to the offset of the new anchor: it is slewed toward
+it over `resync_interval_ms`, at most half a millisecond per tick count millisecond. Converted wall clock
+times thus never go backwards as tick counts increase, even if the wall clock was set back. The monotonic
+clock is used to count tick count wraparounds between anchors, even if no event was converted for weeks.
+
+Recorded captures, whose anchors are all known in advance, are converted with anchors_to_wall_time(),
+which linearly interpolates the offset between anchors.
+
+Batches and recorded arrays are converted in one vectorized pass with NumPy when it is installed, and
+with pure Python otherwise.
+"""
+
+import bisect
+import time
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+try:
+    import numpy
+except ImportError:  # optional dependency, falls back on pure Python conversion.
+    numpy = None
+
+TICK_WRAP = 1 << 32
+_HALF_TICK_WRAP = TICK_WRAP >> 1
+#: Maximum change of the live offset per tick count millisecond, see TickNormalizer.
+MAX_SLEW_RATE = 0.5
+
+
+def tick_delta(tick_ms: int, reference_tick_ms: int) -> int:
+    """Returns the signed difference between two tick counts, assuming they are less than 24.8 days apart.
+
+    reference_tick_ms can be a 32-bit or an extended 64-bit tick count.
+    """
+    return (tick_ms - reference_tick_ms + _HALF_TICK_WRAP) % TICK_WRAP - _HALF_TICK_WRAP
+
+
+def extend_ticks(ticks_ms: Sequence[int], reference_tick_ms: int, use_numpy: Optional[bool] = None):
+    """Extends 32-bit tick counts to 64 bits, given an extended tick count less than 24.8 days apart.
+
+    :return: a NumPy int64 array if use_numpy (defaults to True when NumPy is installed), else a list.
+    """
+    if _use_numpy(use_numpy):
+        ticks_ms = numpy.asarray(ticks_ms, dtype=numpy.int64)
+        return reference_tick_ms + ((ticks_ms - reference_tick_ms + _HALF_TICK_WRAP) % TICK_WRAP - _HALF_TICK_WRAP)
+    return [reference_tick_ms + tick_delta(tick_ms, reference_tick_ms) for tick_ms in ticks_ms]
+
+
+class ClockAnchor(NamedTuple):
+    """Tick count, monotonic and wall clock times measured at the same instant."""
+    #: Tick count, extended to 64 bits.
+    tick_ms: int
+    #: time.monotonic() in milliseconds. Not used by conversions, only to count wraparounds on resync.
+    monotonic_ms: float
+    #: Wall clock time in milliseconds since epoch.
+    wall_time_ms: int
+
+    @property
+    def offset_ms(self) -> int:
+        """Wall clock time minus the extended tick count."""
+        return self.wall_time_ms - self.tick_ms
+
+
+def anchors_to_wall_time(extended_ticks_ms, anchors: Sequence[ClockAnchor], use_numpy: Optional[bool] = None):
+    """Converts extended tick counts to wall clock times using anchors sorted by tick count.
+
+    The offset between tick count and wall clock is interpolated between anchors, and the offset of the
+    first (last) anchor is used before (after) them.
+
+    :return: a NumPy int64 array if use_numpy (defaults to True when NumPy is installed), else a list.
+    """
+    if _use_numpy(use_numpy):
+        extended_ticks_ms = numpy.asarray(extended_ticks_ms, dtype=numpy.int64)
+        if len(anchors) == 1:
+            return extended_ticks_ms + anchors[0].offset_ms
+        offsets = numpy.interp(extended_ticks_ms, [anchor.tick_ms for anchor in anchors],
+                               [anchor.offset_ms for anchor in anchors])
+        return extended_ticks_ms + numpy.rint(offsets).astype(numpy.int64)
+    if len(anchors) == 1:
+        offset_ms = anchors[0].offset_ms
+        return [tick_ms + offset_ms for tick_ms in extended_ticks_ms]
+    anchor_ticks_ms = [anchor.tick_ms for anchor in anchors]
+    return [tick_ms + _interpolated_offset(tick_ms, anchors, anchor_ticks_ms) for tick_ms in extended_ticks_ms]
+
+
+def _interpolated_offset(tick_ms: int, anchors: Sequence[ClockAnchor], anchor_ticks_ms: List[int]) -> int:
+    index = bisect.bisect_right(anchor_ticks_ms, tick_ms)
+    if index == 0:
+        return anchors[0].offset_ms
+    if index == len(anchors):
+        return anchors[-1].offset_ms
+    before, after = anchors[index - 1], anchors[index]
+    ratio = (tick_ms - before.tick_ms) / (after.tick_ms - before.tick_ms)
+    return round(before.offset_ms + (after.offset_ms - before.offset_ms) * ratio)
+
+
+class _Slew(NamedTuple):
+    """Linear change of the live offset, from the tick count of an anchor."""
+    tick_ms: int
+    from_offset_ms: int
+    to_offset_ms: int
+    duration_ms: int
+
+    def offset_ms(self, tick_ms: int) -> int:
+        elapsed_ms = tick_ms - self.tick_ms
+        if elapsed_ms <= 0:
+            return self.from_offset_ms
+        if elapsed_ms >= self.duration_ms:
+            return self.to_offset_ms
+        return round(self.from_offset_ms + (self.to_offset_ms - self.from_offset_ms) * elapsed_ms / self.duration_ms)
+
+
+def _use_numpy(use_numpy: Optional[bool]) -> bool:
+    if use_numpy and numpy is None:
+        raise ValueError('use_numpy=True but numpy is not installed')
+    return numpy is not None if use_numpy is None else use_numpy
+
+
+class TickNormalizer:
+    """Converts 32-bit event tick counts to extended 64-bit tick counts and wall clock times.
+
+    Tick counts must be converted roughly in event order: each tick count is extended relative to the
+    latest converted one, so consecutive conversions must be less than 24.8 days apart (resync() takes
+    care of longer gaps between events).
+
+    After each resync(), the offset used by conversions goes linearly from its value at the new anchor
+    tick count to the new anchor offset, over resync_interval_ms or longer if needed to keep the rate
+    under MAX_SLEW_RATE. Converted wall clock times are thus continuous and never decrease as tick counts
+    increase. Tick counts before the first anchor use its offset.
+
+    :param anchor: initial anchor, for example read from a capture metadata. Measured now if None.
+    :param resync_interval_ms: interval between anchor measurements when converting live events. None
+        never measures new anchors, which is needed to convert recorded captures.
+    :param max_anchors: maximum number of anchors kept for conversions, the oldest ones are dropped first.
+    :param tick_clock: returns the current 32-bit tick count, defaults to get_tick_count().
+    :param monotonic_clock: returns the monotonic time in seconds, defaults to time.monotonic().
+    :param wall_clock: returns the wall clock time in seconds since epoch, defaults to time.time().
+    :param use_numpy: convert batches with NumPy. Defaults to True when NumPy is installed.
+    """
+
+    def __init__(self, anchor: Optional[ClockAnchor] = None, resync_interval_ms: Optional[int] = 60_000,
+                 max_anchors: int = 1024, tick_clock: Optional[Callable[[], int]] = None,
+                 monotonic_clock: Callable[[], float] = time.monotonic, wall_clock: Callable[[], float] = time.time,
+                 use_numpy: Optional[bool] = None):
+        self.tick_clock = tick_clock
+        self.monotonic_clock = monotonic_clock
+        self.wall_clock = wall_clock
+        self.resync_interval_ms = resync_interval_ms
+        self.max_anchors = max_anchors
+        self.use_numpy = _use_numpy(use_numpy)
+        if anchor is None:
+            tick_ms, monotonic_ms, wall_time_ms = self._measure()
+            anchor = ClockAnchor(tick_ms, monotonic_ms, wall_time_ms)
+        #: Anchors sorted by tick count.
+        self.anchors: List[ClockAnchor] = [anchor]
+        #: Wall clock correction started by the last resync(): measured minus predicted wall clock time.
+        self.drift_ms = 0
+        self._last_tick_ms = anchor.tick_ms
+        # Live offset changes, sorted by tick count, at most one per anchor.
+        self._slews: List[_Slew] = [_Slew(anchor.tick_ms, anchor.offset_ms, anchor.offset_ms, 0)]
+
+    @classmethod
+    def from_tick(cls, tick_ms: int, wall_time_ms: int, **kwargs) -> 'TickNormalizer':
+        """Returns a normalizer anchored by a 32-bit tick count and the wall clock time measured at the same instant.
+
+        resync_interval_ms defaults to None: such anchors usually come from a recorded capture.
+        """
+        kwargs.setdefault('resync_interval_ms', None)
+        return cls(ClockAnchor(tick_ms, 0.0, wall_time_ms), **kwargs)
+
+    def _measure(self):
+        """Returns the tick count, monotonic and wall clock times measured as close to each other as possible."""
+        tick_clock = self.tick_clock
+        if tick_clock is None:
+            from .win32api import get_tick_count
+            tick_clock = get_tick_count
+        monotonic_ms = self.monotonic_clock() * 1000
+        tick_ms = tick_clock()
+        wall_time_ms = int(self.wall_clock() * 1000)
+        return tick_ms, monotonic_ms, wall_time_ms
+
+    def resync(self) -> ClockAnchor:
+        """Measures and adds a new anchor, updating drift_ms. Returns the new anchor.
+
+        The number of tick count wraparounds since the last anchor is deduced from the monotonic clock.
+        """
+        tick_ms, monotonic_ms, wall_time_ms = self._measure()
+        last = self.anchors[-1]
+        expected_tick_ms = last.tick_ms + round(monotonic_ms - last.monotonic_ms)
+        anchor = ClockAnchor(expected_tick_ms + tick_delta(tick_ms, expected_tick_ms), monotonic_ms, wall_time_ms)
+        from_offset_ms = self._live_offsets([anchor.tick_ms])[0]
+        self.drift_ms = anchor.offset_ms - from_offset_ms
+        duration_ms = max(self.resync_interval_ms or 0, round(abs(self.drift_ms) / MAX_SLEW_RATE))
+        self.anchors.append(anchor)
+        self._slews.append(_Slew(anchor.tick_ms, from_offset_ms, anchor.offset_ms, duration_ms))
+        if len(self.anchors) > self.max_anchors:
+            del self.anchors[0]
+            del self._slews[0]
+        self._last_tick_ms = max(self._last_tick_ms, anchor.tick_ms)
+        return anchor
+
+    def maybe_resync(self) -> bool:
+        """Calls resync() if resync_interval_ms elapsed since the last anchor. Returns True if it did."""
+        if self.resync_interval_ms is None:
+            return False
+        if self.monotonic_clock() * 1000 - self.anchors[-1].monotonic_ms < self.resync_interval_ms:
+            return False
+        self.resync()
+        return True
+
+    def extend(self, tick_ms: int) -> int:
+        """Returns the 64-bit extension of a 32-bit tick count."""
+        extended_tick_ms = self._last_tick_ms + tick_delta(tick_ms, self._last_tick_ms)
+        self._last_tick_ms = max(self._last_tick_ms, extended_tick_ms)
+        return extended_tick_ms
+
+    def extend_batch(self, ticks_ms: Sequence[int]):
+        """Returns the 64-bit extension of 32-bit tick counts, as a NumPy array if use_numpy else a list."""
+        if not len(ticks_ms):
+            return numpy.zeros(0, dtype=numpy.int64) if self.use_numpy else []
+        extended_ticks_ms = extend_ticks(ticks_ms, self._last_tick_ms, self.use_numpy)
+        last_tick_ms = extended_ticks_ms.max() if self.use_numpy else max(extended_ticks_ms)
+        self._last_tick_ms = max(self._last_tick_ms, int(last_tick_ms))
+        return extended_ticks_ms
+
+    def _live_offsets(self, extended_ticks_ms, use_numpy: bool = False):
+        """Returns the live offsets of extended tick counts, as a NumPy array if use_numpy else a list."""
+        slews = self._slews
+        if len(slews) == 1 and slews[0].from_offset_ms == slews[0].to_offset_ms:
+            offset_ms = slews[0].to_offset_ms
+            if use_numpy:
+                return numpy.full(len(extended_ticks_ms), offset_ms, dtype=numpy.int64)
+            return [offset_ms] * len(extended_ticks_ms)
+        slew_ticks_ms = [slew.tick_ms for slew in slews]
+        if use_numpy:
+            indexes = numpy.maximum(numpy.searchsorted(slew_ticks_ms, extended_ticks_ms, side='right') - 1, 0)
+            slew_columns = numpy.array(slews, dtype=numpy.int64)[indexes]
+            tick_ms, from_offset_ms, to_offset_ms, duration_ms = slew_columns.T
+            elapsed_ms = numpy.clip(extended_ticks_ms - tick_ms, 0, duration_ms)
+            offsets = from_offset_ms + (to_offset_ms - from_offset_ms) * elapsed_ms / numpy.maximum(duration_ms, 1)
+            return numpy.rint(offsets).astype(numpy.int64)
+        return [slews[max(bisect.bisect_right(slew_ticks_ms, tick_ms) - 1, 0)].offset_ms(tick_ms)
+                for tick_ms in extended_ticks_ms]
+
+    def to_wall_time(self, tick_ms: int) -> int:
+        """Returns the wall clock time, in milliseconds since epoch, of a 32-bit tick count."""
+        self.maybe_resync()
+        extended_tick_ms = self.extend(tick_ms)
+        return extended_tick_ms + self._live_offsets([extended_tick_ms])[0]
+
+    def to_wall_time_batch(self, ticks_ms: Sequence[int]):
+        """Returns the wall clock times, in milliseconds since epoch, of 32-bit tick counts.
+
+        :return: a NumPy int64 array if use_numpy, else a list.
+        """
+        self.maybe_resync()
+        extended_ticks_ms = self.extend_batch(ticks_ms)
+        offsets_ms = self._live_offsets(extended_ticks_ms, self.use_numpy)
+        if self.use_numpy:
+            return extended_ticks_ms + offsets_ms
+        return [tick_ms + offset_ms for tick_ms, offset_ms in zip(extended_ticks_ms, offsets_ms)]
@@ -0,0 +1,293 @@
+"""
+Process and window lookup cache, persisted as a warm-start snapshot.
+
+WarmStartCache caches the results of get_hwnd_process_id(), get_process_filename() and optionally
+get_window_title(), and saves them on close() and every `save_interval_ms` to a snapshot file holding
+the process id, process creation time and executable path of the processes, and the handle and process
+id of the windows. When a collector restarts, the snapshot is loaded so that process lookups hit the
+cache immediately instead of all missing during the login storm that often follows.
+
+Process ids are reused, so a process is identified by its (process id, creation time) pair:
+
+- A process entry is valid while get_process_creation_time() returns its creation time. Entries are
+  revalidated lazily: entries loaded from the snapshot on their first use, then every
+  `revalidate_interval_ms`.
+- A window entry is valid while the process entry of its process id is valid. Windows are dropped on
+  OBJECT_DESTROY events. Window handles are reused too, and destroy events are missed while the collector
+  is stopped: on its first use, a window loaded from the snapshot is revalidated with a single
+  get_window_process_id() call, much cheaper than get_hwnd_process_id().
+- Window titles are only cached with `cache_titles=True`, which requires hooking OBJECT_NAMECHANGE
+  events: cached titles are invalidated by them. Titles are not saved in the snapshot: name changes are
+  missed while the collector is stopped, and a title can only be checked by reading it again, which costs
+  as much as the lookup it would save.
+
+Example::
+
+    with WarmStartCache('collector_cache.json.gz') as cache:  # loads the snapshot if it exists
+        batcher = EventBatcher(cache=cache)
+        ...
+    # the snapshot is saved on exit
+"""
+
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Set
+
+from .ids import HookEvent
+from .records import is_window_object
+from .win32api import (
+    get_hwnd_process_id, get_process_creation_time, get_process_filename, get_window_process_id, get_window_title,
+)
+
+SNAPSHOT_VERSION = 1
+
+
+class ProcessEntry(NamedTuple):
+    process_id: int
+    #: FILETIME value, see get_process_creation_time().
+    creation_time: int
+    #: Executable path, None if get_process_filename() failed.
+    exe_path: Optional[str]
+
+
+class WindowEntry(NamedTuple):
+    hwnd: int
+    process_id: int
+    #: Last known title, None if unknown.
+    title: Optional[str] = None
+
+
+class CacheStats(NamedTuple):
+    """Number of lookups answered from the cache (hits) and by Win32 calls (misses)."""
+    process_id_hits: int = 0
+    process_id_misses: int = 0
+    filename_hits: int = 0
+    filename_misses: int = 0
+    title_hits: int = 0
+    title_misses: int = 0
+    #: Number of Win32 calls made to validate cached entries: get_process_creation_time() for processes, and
+    #: get_window_process_id() for windows loaded from the snapshot.
+    revalidations: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.process_id_hits + self.filename_hits + self.title_hits
+
+    @property
+    def misses(self) -> int:
+        return self.process_id_misses + self.filename_misses + self.title_misses
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 1.0
+
+    def __sub__(self, other: 'CacheStats') -> 'CacheStats':
+        return CacheStats(*(value - other_value for value, other_value in zip(self, other)))
+
+
+class WarmStartCache:
+    """Cache of the process and window lookups, saved to and loaded from a snapshot file.
+
+    Must be used from a single thread, usually the thread running the Windows message loop.
+
+    :param path: path of the snapshot file, loaded on creation if it exists. None disables the snapshot.
+    :param save_interval_ms: interval between snapshot saves by maybe_save(). None only saves on close().
+    :param revalidate_interval_ms: interval between two validations of a process entry.
+    :param cache_titles: cache window titles, invalidated by OBJECT_NAMECHANGE events.
+    :param prune_after_ms: processes not looked up for this duration are dropped on save(), with their windows.
+    :param clock: returns the monotonic time in seconds, defaults to time.monotonic().
+    """
+
+    def __init__(self, path: Optional[str] = None, save_interval_ms: Optional[int] = 300_000,
+                 revalidate_interval_ms: int = 60_000, cache_titles: bool = False,
+                 prune_after_ms: int = 24 * 3600 * 1000, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.save_interval_ms = save_interval_ms
+        self.revalidate_interval_ms = revalidate_interval_ms
+        self.cache_titles = cache_titles
+        self.prune_after_ms = prune_after_ms
+        self.clock = clock
+        self._processes: Dict[int, ProcessEntry] = {}
+        self._validated_ms: Dict[int, float] = {}  # process id => last validation time, missing if never validated
+        self._used_ms: Dict[int, float] = {}  # process id => last lookup time, or load time
+        self._windows: Dict[int, WindowEntry] = {}
+        self._unverified_hwnds: Set[int] = set()  # windows loaded from the snapshot and not looked up since
+        self._stats = dict.fromkeys(CacheStats._fields, 0)
+        self._last_save_ms = self._now_ms()
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(**self._stats)
+
+    def __len__(self):
+        """Number of cached processes and windows."""
+        return len(self._processes) + len(self._windows)
+
+    def _now_ms(self) -> float:
+        return self.clock() * 1000
+
+    # Lookups
+    # ###################################################################
+
+    def _is_valid_process(self, process_id: int) -> bool:
+        """Returns True if the process entry is valid, revalidating it if needed. Drops invalid entries."""
+        entry = self._processes.get(process_id)
+        if entry is None:
+            return False
+        now_ms = self._now_ms()
+        self._used_ms[process_id] = now_ms
+        validated_ms = self._validated_ms.get(process_id)
+        if validated_ms is not None and now_ms - validated_ms < self.revalidate_interval_ms:
+            return True
+        self._stats['revalidations'] += 1
+        if get_process_creation_time(process_id, log_error=False) == entry.creation_time:
+            self._validated_ms[process_id] = now_ms
+            return True
+        # The process exited, and its id may have been reused.
+        self._forget_process(process_id)
+        return False
+
+    def _forget_process(self, process_id: int):
+        del self._processes[process_id]
+        self._validated_ms.pop(process_id, None)
+        self._used_ms.pop(process_id, None)
+
+    def hwnd_process_id(self, event_thread_id: int, hwnd: int, log_error=True) -> Optional[int]:
+        """Cached get_hwnd_process_id()."""
+        window = self._windows.get(hwnd) if hwnd else None
+        if window is not None and hwnd in self._unverified_hwnds:
+            # The window handle may have been reused while the collector was stopped.
+            self._unverified_hwnds.discard(hwnd)
+            self._stats['revalidations'] += 1
+            if get_window_process_id(hwnd, log_error=False) != window.process_id:
+                del self._windows[hwnd]
+                window = None
+        if window is not None and self._is_valid_process(window.process_id):
+            self._stats['process_id_hits'] += 1
+            return window.process_id
+        self._stats['process_id_misses'] += 1
+        process_id = get_hwnd_process_id(event_thread_id, hwnd, log_error=log_error)
+        if hwnd and process_id:
+            if window is None or window.process_id != process_id:
+                window = WindowEntry(hwnd, process_id)
+            self._windows[hwnd] = window
+        elif window is not None:
+            del self._windows[hwnd]
+        return process_id
+
+    def process_filename(self, process_id: int, log_error=True) -> Optional[str]:
+        """Cached get_process_filename()."""
+        if self._is_valid_process(process_id):
+            self._stats['filename_hits'] += 1
+            return self._processes[process_id].exe_path
+        self._stats['filename_misses'] += 1
+        exe_path = get_process_filename(process_id, log_error=log_error)
+        creation_time = get_process_creation_time(process_id, log_error=False)
+        if creation_time is not None:
+            self._processes[process_id] = ProcessEntry(process_id, creation_time, exe_path)
+            self._validated_ms[process_id] = self._used_ms[process_id] = self._now_ms()
+        return exe_path
+
+    def window_title(self, hwnd: int) -> str:
+        """get_window_title(), cached if cache_titles is True and the window process id is cached."""
+        window = self._windows.get(hwnd)
+        if self.cache_titles and window is not None and window.title is not None:
+            if self._is_valid_process(window.process_id):
+                self._stats['title_hits'] += 1
+                return window.title
+        self._stats['title_misses'] += 1
+        title = get_window_title(hwnd)
+        if window is not None:
+            self._windows[hwnd] = window._replace(title=title)
+        return title
+
+    def invalidate_title(self, hwnd: int):
+        window = self._windows.get(hwnd)
+        if window is not None and window.title is not None:
+            self._windows[hwnd] = window._replace(title=None)
+
+    def forget_window(self, hwnd: int):
+        self._windows.pop(hwnd, None)
+        self._unverified_hwnds.discard(hwnd)
+
+    def observe_event(self, event_id: int, hwnd: int, id_object: int, id_child: int):
+        """Invalidates the cached title of a window on OBJECT_NAMECHANGE, and drops it on OBJECT_DESTROY."""
+        if not is_window_object(id_object, id_child) or hwnd not in self._windows:
+            return
+        if event_id == HookEvent.OBJECT_NAMECHANGE:
+            self.invalidate_title(hwnd)
+        elif event_id == HookEvent.OBJECT_DESTROY:
+            self.forget_window(hwnd)
+
+    # Snapshot
+    # ###################################################################
+
+    def load(self) -> int:
+        """Loads the snapshot, replacing the cache content. Returns the number of loaded entries.
+
+        Loaded processes and windows are revalidated on their first use. An unreadable snapshot is logged and
+        ignored.
+        """
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8', errors='surrogatepass') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f"unsupported snapshot version {snapshot.get('version')!r}")
+            processes = [ProcessEntry(*process) for process in snapshot['processes']]
+            windows = [WindowEntry(*window[:2]) for window in snapshot['windows']]
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.error("Can not load cache snapshot %s: %s", self.path, error)
+            return 0
+        self._processes = {process.process_id: process for process in processes}
+        self._validated_ms = {}
+        self._used_ms = dict.fromkeys(self._processes, self._now_ms())
+        self._windows = {window.hwnd: window for window in windows}
+        self._unverified_hwnds = set(self._windows)
+        return len(self)
+
+    def save(self):
+        """Prunes the processes not looked up for prune_after_ms, then writes the snapshot.
+
+        The file is replaced atomically, so a crash never leaves a truncated snapshot.
+        """
+        now_ms = self._last_save_ms = self._now_ms()
+        for process_id, used_ms in list(self._used_ms.items()):
+            if now_ms - used_ms > self.prune_after_ms:
+                self._forget_process(process_id)
+        self._windows = {hwnd: window for hwnd, window in self._windows.items()
+                         if window.process_id in self._processes}
+        self._unverified_hwnds.intersection_update(self._windows)
+        if self.path is None:
+            return
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'processes': [list(process) for process in self._processes.values()],
+            'windows': [[window.hwnd, window.process_id] for window in self._windows.values()],
+        }
+        temporary_path = self.path + '.tmp'
+        with gzip.open(temporary_path, 'wt', encoding='utf-8', errors='surrogatepass') as snapshot_file:
+            json.dump(snapshot, snapshot_file, separators=(',', ':'))
+        os.replace(temporary_path, self.path)
+
+    def maybe_save(self) -> bool:
+        """Calls save() if save_interval_ms elapsed since the last save. Returns True if it did."""
+        if self.save_interval_ms is None or self._now_ms() - self._last_save_ms < self.save_interval_ms:
+            return False
+        self.save()
+        return True
+
+    def close(self):
+        """Saves the snapshot."""
+        self.save()
@@ -1,9 +1,10 @@
 import contextlib
 import ctypes
+import heapq
 import logging
 import signal
 from ctypes import wintypes
-from typing import Optional, Union, Callable
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import threading
 
 from .ids import HookEvent
@@ -41,6 +42,16 @@ WINEVENT_OUTOFCONTEXT = 0
 WINEVENT_SKIPOWNTHREAD = 1
 WINEVENT_SKIPOWNPROCESS = 2
 WINEVENT_INCONTEXT = 4
+WM_QUIT = 0x0012
+PM_REMOVE = 0x0001
+QS_ALLINPUT = 0x04FF
+MWMO_INPUTAVAILABLE = 0x0004
+INFINITE = 0xFFFFFFFF
+WAIT_OBJECT_0 = 0
+WAIT_ABANDONED_0 = 0x80
+WAIT_TIMEOUT = 0x102
+WAIT_FAILED = 0xFFFFFFFF
+MAXIMUM_WAIT_OBJECTS = 64
 
 # Could fallback on PROCESS_QUERY_INFORMATION and THREAD_QUERY_INFORMATION for xP
 PROCESS_FLAG = PROCESS_QUERY_LIMITED_INFORMATION
@@ -108,6 +119,19 @@ def get_hwnd_process_id(event_thread_id: wintypes.DWORD, hwnd: wintypes.HWND, lo
     return process_id
 
 
+def get_window_process_id(hwnd: wintypes.HWND, log_error=True) -> Optional[int]:
+    """Returns the processId of the given window handle, or None on error.
+
+    Unlike get_hwnd_process_id(), only calls GetWindowThreadProcessId: cheaper, but requires a window handle.
+    """
+    process_id = wintypes.DWORD()
+    if not user32.GetWindowThreadProcessId(hwnd, ctypes.byref(process_id)) or not process_id.value:
+        if log_error:
+            logging.error("GetWindowThreadProcessId(%s) failed: %s", hwnd, ctypes.WinError())
+        return None
+    return process_id.value
+
+
 def get_window_title(hwnd: wintypes.HWND) -> str:
     """Returns the window title of the given window handle, or an empty string on error."""
     length = user32.GetWindowTextLengthW(hwnd)
@@ -116,6 +140,49 @@ def get_window_title(hwnd: wintypes.HWND) -> str:
     return title.value
 
 
+GetProcessTimes = kernel32.GetProcessTimes
+GetProcessTimes.argtypes = [wintypes.HANDLE] + [ctypes.POINTER(wintypes.FILETIME)] * 4
+GetProcessTimes.restype = wintypes.BOOL
+
+
+def get_process_creation_time(process_id: int, log_error=True) -> Optional[int]:
+    """Returns the creation time of the given process_id, or None on error.
+
+    The creation time is a FILETIME value (100-nanosecond intervals since January 1, 1601 UTC). As process ids
+    are reused, a process is identified by its process id and creation time.
+    """
+    handle_process = kernel32.OpenProcess(PROCESS_FLAG, 0, process_id)
+    if not handle_process:
+        if log_error:
+            logging.error("OpenProcess(%s) failed: %s", process_id, ctypes.WinError())
+        return None
+
+    try:
+        creation_time, exit_time, kernel_time, user_time = (wintypes.FILETIME() for _ in range(4))
+        if not GetProcessTimes(handle_process, ctypes.byref(creation_time), ctypes.byref(exit_time),
+                               ctypes.byref(kernel_time), ctypes.byref(user_time)):
+            if log_error:
+                logging.error("GetProcessTimes(%s) failed: %s", process_id, ctypes.WinError())
+            return None
+        return (creation_time.dwHighDateTime << 32) | creation_time.dwLowDateTime
+    finally:
+        kernel32.CloseHandle(handle_process)
+
+
+GetTickCount = kernel32.GetTickCount
+GetTickCount.argtypes = []
+GetTickCount.restype = wintypes.DWORD
+
+
+def get_tick_count() -> int:
+    """Returns the number of milliseconds elapsed since the system was started (GetTickCount).
+
+    This is the clock of the event_time_ms parameter of the event hook callback. It wraps around to
+    zero every 49.7 days.
+    """
+    return GetTickCount()
+
+
 SetWinEventHook = user32.SetWinEventHook
 SetWinEventHook.argtypes = [
     wintypes.DWORD,  # eventMin
@@ -210,10 +277,174 @@ def run_message_loop():
     """
     msg = ctypes.wintypes.MSG()
     while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) != 0:
-        user32.TranslateMessageW(msg)
+        user32.TranslateMessage(msg)
         user32.DispatchMessageW(msg)
 
 
+PeekMessageW = user32.PeekMessageW
+PeekMessageW.argtypes = [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT, wintypes.UINT]
+PeekMessageW.restype = wintypes.BOOL
+
+MsgWaitForMultipleObjectsEx = user32.MsgWaitForMultipleObjectsEx
+MsgWaitForMultipleObjectsEx.argtypes = [
+    wintypes.DWORD,  # nCount
+    ctypes.POINTER(wintypes.HANDLE),  # pHandles
+    wintypes.DWORD,  # dwMilliseconds
+    wintypes.DWORD,  # dwWakeMask
+    wintypes.DWORD  # dwFlags
+]
+MsgWaitForMultipleObjectsEx.restype = wintypes.DWORD
+
+
+class MessagePump:
+    """Batched WIN32 message loop, alternative to run_message_loop() that can also wait on handles and timers.
+
+    Each time the thread wakes up, all the pending messages are drained with PeekMessageW (event hook
+    callbacks are called during the drain), then on_batch() is called, once per drain. This is the place to
+    process the events queued by the callbacks as a batch, for example with EventBatcher.drain().
+
+    Between drains, the thread waits with MsgWaitForMultipleObjectsEx for a message, one of the handles
+    added with add_handle() to be signaled, or the next timer deadline, all on the thread running the pump.
+
+    Example::
+
+        batcher = EventBatcher()
+        event_hook_handle = set_win_event_hook(batcher.on_event, HookEvent.SYSTEM_FOREGROUND)
+        pump = MessagePump(on_batch=lambda: process(batcher.drain()))
+        pump.call_every(1000, flush_outputs)
+        pump.run()  # until post_quit_message() is called
+
+    :param on_batch: called without parameters after each drain of the message queue.
+    :param max_messages: maximum number of messages dispatched per drain, so that timers and handles are
+        not starved by a flood of messages. 0 for no limit.
+    """
+
+    def __init__(self, on_batch: Optional[Callable[[], None]] = None, max_messages: int = 0):
+        self.on_batch = on_batch
+        self.max_messages = max_messages
+        #: Number of times the thread woke up from MsgWaitForMultipleObjectsEx.
+        self.wakeups = 0
+        #: Number of drains of the message queue.
+        self.batches = 0
+        self._handles: Dict[int, Callable[[], None]] = {}
+        self._timers: Dict[int, Tuple[Callable[[], None], int]] = {}  # timer id => (callback, interval_ms)
+        self._deadlines: List[Tuple[int, int]] = []  # heap of (deadline_ms, timer id)
+        self._next_timer_id = 0
+        self._last_tick_ms = get_tick_count()
+        self._now_ms = 0
+
+    def add_handle(self, handle: int, callback: Callable[[], None]):
+        """Calls callback() on the pump thread each time handle is signaled.
+
+        The handle must be a waitable handle (event, semaphore, process...). As for
+        MsgWaitForMultipleObjectsEx, signaling an auto-reset event resets it. At most
+        MAXIMUM_WAIT_OBJECTS - 1 handles can be added.
+        """
+        if handle not in self._handles and len(self._handles) >= MAXIMUM_WAIT_OBJECTS - 1:
+            raise ValueError(f'at most {MAXIMUM_WAIT_OBJECTS - 1} handles can be waited on')
+        self._handles[handle] = callback
+
+    def remove_handle(self, handle: int):
+        self._handles.pop(handle, None)
+
+    def call_later(self, delay_ms: int, callback: Callable[[], None]) -> int:
+        """Calls callback() on the pump thread once, after delay_ms. Returns the timer id."""
+        return self._add_timer(delay_ms, callback, 0)
+
+    def call_every(self, interval_ms: int, callback: Callable[[], None]) -> int:
+        """Calls callback() on the pump thread every interval_ms. Returns the timer id."""
+        if interval_ms <= 0:
+            raise ValueError(f'interval_ms must be positive, but was {interval_ms}')
+        return self._add_timer(interval_ms, callback, interval_ms)
+
+    def cancel_timer(self, timer_id: int):
+        self._timers.pop(timer_id, None)
+
+    def run(self) -> int:
+        """Runs the pump until WM_QUIT is received (see post_quit_message()), and returns its exit code.
+
+        Throws an OSError exception created by ctypes.WinError() if MsgWaitForMultipleObjectsEx fails.
+        """
+        msg = wintypes.MSG()
+        while True:
+            # Timers run before the drain so that the messages they post are dispatched without another wake up.
+            self._run_timers()
+            exit_code = self._drain(msg)
+            if exit_code is not None:
+                return exit_code
+            handles = list(self._handles)
+            handle_array = (wintypes.HANDLE * len(handles))(*handles)
+            result = MsgWaitForMultipleObjectsEx(len(handles), handle_array, self._timeout_ms(), QS_ALLINPUT,
+                                                 MWMO_INPUTAVAILABLE)
+            self.wakeups += 1
+            if result == WAIT_FAILED:
+                raise ctypes.WinError()
+            if WAIT_OBJECT_0 <= result < WAIT_OBJECT_0 + len(handles):
+                self._signaled(handles[result - WAIT_OBJECT_0])
+            elif WAIT_ABANDONED_0 <= result < WAIT_ABANDONED_0 + len(handles):
+                self._signaled(handles[result - WAIT_ABANDONED_0])
+            # Otherwise, messages are available (WAIT_OBJECT_0 + len(handles)) or a timer is due (WAIT_TIMEOUT)
+
+    def _drain(self, msg: wintypes.MSG) -> Optional[int]:
+        """Dispatches the pending messages, then calls on_batch(). Returns the exit code if WM_QUIT is received."""
+        count = 0
+        exit_code = None
+        while PeekMessageW(ctypes.byref(msg), None, 0, 0, PM_REMOVE):
+            if msg.message == WM_QUIT:
+                exit_code = msg.wParam
+                break
+            user32.TranslateMessage(msg)
+            user32.DispatchMessageW(msg)
+            count += 1
+            if count == self.max_messages:
+                break
+        self.batches += 1
+        if self.on_batch is not None:
+            self.on_batch()
+        return exit_code
+
+    def _signaled(self, handle: int):
+        callback = self._handles.get(handle)
+        if callback is not None:
+            callback()
+
+    def _clock_ms(self) -> int:
+        """Milliseconds elapsed since the pump creation, from GetTickCount, robust to its wrap around."""
+        tick_ms = get_tick_count()
+        self._now_ms += (tick_ms - self._last_tick_ms) & 0xFFFFFFFF
+        self._last_tick_ms = tick_ms
+        return self._now_ms
+
+    def _add_timer(self, delay_ms: int, callback: Callable[[], None], interval_ms: int) -> int:
+        self._next_timer_id += 1
+        self._timers[self._next_timer_id] = (callback, interval_ms)
+        heapq.heappush(self._deadlines, (self._clock_ms() + max(0, delay_ms), self._next_timer_id))
+        return self._next_timer_id
+
+    def _run_timers(self):
+        now_ms = self._clock_ms()
+        while self._deadlines and self._deadlines[0][0] <= now_ms:
+            deadline_ms, timer_id = heapq.heappop(self._deadlines)
+            timer = self._timers.get(timer_id)
+            if timer is None:
+                continue  # cancelled
+            callback, interval_ms = timer
+            if interval_ms:
+                # Next deadline after now, skipping the missed ones
+                missed = (now_ms - deadline_ms) // interval_ms + 1
+                heapq.heappush(self._deadlines, (deadline_ms + missed * interval_ms, timer_id))
+            else:
+                del self._timers[timer_id]
+            callback()
+
+    def _timeout_ms(self) -> int:
+        while self._deadlines and self._deadlines[0][1] not in self._timers:
+            heapq.heappop(self._deadlines)
+        if not self._deadlines:
+            return INFINITE
+        return max(0, self._deadlines[0][0] - self._clock_ms())
+
+
 PostQuitMessage = user32.PostQuitMessage
 PostQuitMessage.argtypes = [ctypes.c_int]
 PostQuitMessage.restype = None
@@ -0,0 +1,191 @@
+"""
+Streaming windowed aggregations over EventRecord: tumbling and sliding window counts, and approximate
+distinct counts.
+
+Examples::
+
+    # Events per second per HookEvent
+    WindowedAggregator(1000, on_window=print, key=lambda record: HookEvent(record.event_id))
+
+    # Distinct windows shown per minute (add only OBJECT_SHOW events)
+    WindowedAggregator(60_000, on_window=print, distinct=lambda record: record.hwnd)
+
+    # Foreground switches per 5 minutes per exe, updated every minute (add only SYSTEM_FOREGROUND events)
+    WindowedAggregator(300_000, on_window=print, slide_ms=60_000, key=lambda record: record.exe_path)
+
+A window of `window_ms` is made of buckets of `slide_ms`, kept in a ring. Counts are maintained as running
+totals, so each event costs O(1), and memory is bounded by the number of buckets and keys of a window,
+regardless of the stream length. Distinct counts use a HyperLogLog sketch per bucket and key, merged when
+the window is emitted.
+
+Windows are emitted when an event (or advance()) reaches the end of the window. Event times must be
+non-decreasing, except for events older than the current bucket, which are dropped and counted in
+late_events.
+
+Event times can be GetTickCount() values or wall clock times. They are compared with the wrap-safe
+tick_delta() of win32_window_monitor.timestamps, so aggregation continues when the tick count wraps around,
+as long as consecutive events are less than 24.8 days apart. Window bounds are extended tick counts: the
+first event time plus the elapsed ticks.
+"""
+
+import collections
+import hashlib
+import math
+from typing import Any, Callable, Deque, Dict, Hashable, NamedTuple, Optional
+
+from .records import EventRecord
+from .timestamps import tick_delta
+
+
+class HyperLogLog:
+    """Approximate distinct counter, with a relative standard error of about 1.04 / sqrt(2 ** precision).
+
+    :param precision: number of bits used to select a register, between 4 and 16. Uses 2 ** precision bytes.
+    """
+
+    def __init__(self, precision: int = 10):
+        if not 4 <= precision <= 16:
+            raise ValueError(f'precision must be between 4 and 16, but was {precision}')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: Hashable):
+        """Adds a value. Values are identified by their repr(), which must be stable across processes."""
+        hashed = int.from_bytes(hashlib.blake2b(repr(value).encode('utf-8', 'surrogatepass'),
+                                                digest_size=8).digest(), 'little')
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        rank = remaining_bits - (hashed & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        """Adds the values of other to this counter."""
+        if other.precision != self.precision:
+            raise ValueError('can not merge HyperLogLog of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        """Returns the estimated number of distinct values added."""
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        raw_estimate = alpha * register_count * register_count / sum(2.0 ** -register for register in self.registers)
+        zero_registers = self.registers.count(0)
+        if raw_estimate <= 2.5 * register_count and zero_registers:
+            # Small range correction: linear counting
+            return round(register_count * math.log(register_count / zero_registers))
+        return round(raw_estimate)
+
+
+class WindowResult(NamedTuple):
+    """Aggregations of a window [start_ms, end_ms)."""
+    start_ms: int
+    end_ms: int
+    #: Number of events per key. The key is None if the aggregator has no key function.
+    counts: Dict[Any, int]
+    #: Estimated number of distinct values per key, empty if the aggregator has no distinct function.
+    distinct: Dict[Any, int]
+
+
+class _Bucket:
+    __slots__ = ('counts', 'sketches')
+
+    def __init__(self):
+        self.counts: Dict[Any, int] = {}
+        self.sketches: Dict[Any, HyperLogLog] = {}
+
+
+class WindowedAggregator:
+    """Counts events and distinct values per key over tumbling or sliding windows.
+
+    :param window_ms: window duration.
+    :param on_window: called with a WindowResult each time a window closes. Windows without events are
+        not emitted.
+    :param slide_ms: interval between the start of two windows. Defaults to window_ms (tumbling windows).
+        window_ms must be a multiple of slide_ms.
+    :param key: returns the aggregation key of a record. None aggregates all records under the None key.
+    :param distinct: returns the value of a record whose distinct values are counted per key.
+    :param hll_precision: precision of the distinct count sketches, see HyperLogLog.
+    """
+
+    def __init__(self, window_ms: int, on_window: Callable[[WindowResult], None], slide_ms: Optional[int] = None,
+                 key: Optional[Callable[[EventRecord], Hashable]] = None,
+                 distinct: Optional[Callable[[EventRecord], Hashable]] = None, hll_precision: int = 10):
+        slide_ms = slide_ms or window_ms
+        if window_ms <= 0 or window_ms % slide_ms:
+            raise ValueError(f'window_ms ({window_ms}) must be a positive multiple of slide_ms ({slide_ms})')
+        self.window_ms = window_ms
+        self.slide_ms = slide_ms
+        self.on_window = on_window
+        self.key = key
+        self.distinct = distinct
+        self.hll_precision = hll_precision
+        self.bucket_count = window_ms // slide_ms
+        #: Number of events dropped because they were older than the current bucket.
+        self.late_events = 0
+        self._buckets: Deque[_Bucket] = collections.deque([_Bucket()])
+        self._bucket_start_ms: Optional[int] = None  # extended tick count
+        self._totals: Dict[Any, int] = {}  # event count per key over the buckets of the ring
+
+    def add(self, record: EventRecord):
+        """Adds an event, first emitting the windows that end at or before its time."""
+        event_time_ms = record.event_time_ms
+        if self._bucket_start_ms is None:
+            self._bucket_start_ms = event_time_ms - event_time_ms % self.slide_ms
+        else:
+            event_time_ms = self._bucket_start_ms + tick_delta(event_time_ms, self._bucket_start_ms)
+        if event_time_ms < self._bucket_start_ms:
+            self.late_events += 1
+            return
+        elif event_time_ms >= self._bucket_start_ms + self.slide_ms:
+            self.advance(event_time_ms)
+        key = self.key(record) if self.key is not None else None
+        bucket = self._buckets[-1]
+        bucket.counts[key] = bucket.counts.get(key, 0) + 1
+        self._totals[key] = self._totals.get(key, 0) + 1
+        if self.distinct is not None:
+            sketch = bucket.sketches.get(key)
+            if sketch is None:
+                sketch = bucket.sketches[key] = HyperLogLog(self.hll_precision)
+            sketch.add(self.distinct(record))
+
+    def advance(self, now_ms: int):
+        """Emits the windows ending at or before now_ms. Can be called from a timer when events are sparse."""
+        if self._bucket_start_ms is None:
+            return
+        now_ms = self._bucket_start_ms + tick_delta(now_ms, self._bucket_start_ms)
+        while now_ms >= self._bucket_start_ms + self.slide_ms:
+            if not self._totals:
+                # No event in the ring: skip the empty windows.
+                self._bucket_start_ms = now_ms - now_ms % self.slide_ms
+                self._buckets = collections.deque([_Bucket()])
+                return
+            end_ms = self._bucket_start_ms + self.slide_ms
+            self._emit(end_ms)
+            self._bucket_start_ms = end_ms
+            self._buckets.append(_Bucket())
+            if len(self._buckets) > self.bucket_count:
+                for key, count in self._buckets.popleft().counts.items():
+                    total = self._totals[key] - count
+                    if total:
+                        self._totals[key] = total
+                    else:
+                        del self._totals[key]
+
+    def flush(self):
+        """Emits all the windows containing events, for example at the end of the stream."""
+        if self._bucket_start_ms is not None:
+            self.advance(self._bucket_start_ms + self.window_ms)
+
+    def _emit(self, end_ms: int):
+        distinct = {}
+        if self.distinct is not None:
+            sketches = {}
+            for bucket in self._buckets:
+                for key, sketch in bucket.sketches.items():
+                    window_sketch = sketches.get(key)
+                    if window_sketch is None:
+                        window_sketch = sketches[key] = HyperLogLog(self.hll_precision)
+                    window_sketch.merge(sketch)
+            distinct = {key: sketch.estimate() for key, sketch in sketches.items()}
+        self.on_window(WindowResult(end_ms - self.window_ms, end_ms, dict(self._totals), distinct))